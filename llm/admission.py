@@ -0,0 +1,197 @@
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+
+from metrics import metrics
+
+# Model bound requests running at once per process, and how many more can wait for a slot
+max_concurrent = int(os.getenv("ADMISSION_MAX_CONCURRENT", "16"))
+max_queue = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+max_queue_seconds = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "5"))
+# Consecutive requests hitting rate limits that open the circuit, and seconds it stays open
+breaker_threshold = int(os.getenv("BREAKER_THRESHOLD", "5"))
+breaker_cooldown = float(os.getenv("BREAKER_COOLDOWN", "30"))
+
+
+# Rate limits hit by the request holding a slot. A list, so tasks and threads started by the request
+# (which get a copy of the context) count on the same one
+request_rate_limits: ContextVar[list[int] | None] = ContextVar("request_rate_limits", default=None)
+
+
+def record_rate_limit():
+    """
+    Count a model rate limit for the request in progress, so only that request counts for the breaker
+    """
+    hits = request_rate_limits.get()
+    if hits is not None:
+        hits[0] += 1
+
+
+class Overloaded(Exception):
+    """
+    Request rejected before doing any work. Clients should retry after retry_after seconds
+    """
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Opens after several consecutive requests hit model rate limits, rejecting requests right away instead
+    of letting them sleep through backoff. Once the cooldown ends a single probe request is let through,
+    closing the circuit when it doesn't hit rate limits
+    """
+
+    def __init__(self, threshold: int = breaker_threshold, cooldown: float = breaker_cooldown):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        self.consecutive = 0
+        self.open_until = 0.0
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self.open_until > 0
+
+    def allow(self, now: float) -> float:
+        """
+        Seconds until requests are allowed again, 0 when this one can go
+        """
+        if not self.is_open:
+            return 0
+        if now < self.open_until:
+            return self.open_until - now
+        if self._probing:
+            return self.cooldown
+        self._probing = True
+        return 0
+
+    def record(self, rate_limited: bool, now: float):
+        if not rate_limited:
+            self.consecutive = 0
+            self.open_until = 0.0
+            self._probing = False
+            return
+
+        self.consecutive += 1
+        if self._probing or self.consecutive >= self.threshold:
+            if not self.is_open or self._probing:
+                metrics.increment("circuit_opened")
+            self.open_until = now + self.cooldown
+            self._probing = False
+
+
+class AdmissionController:
+    """
+    Bounds the model bound work of the process. Requests over max_concurrent wait in a FIFO queue for at most
+    max_queue_seconds, and requests over the queue size are rejected right away, both with a Retry-After
+    estimate based on the observed request duration. Keeps latency predictable for accepted requests
+    """
+
+    # Smoothing of the observed request duration
+    smoothing = 0.2
+
+    def __init__(self, concurrency: int = max_concurrent, queue_size: int = max_queue,
+                 queue_seconds: float = max_queue_seconds, breaker: CircuitBreaker = None):
+        self.concurrency = max(1, concurrency)
+        self.queue_size = max(0, queue_size)
+        self.queue_seconds = queue_seconds
+        self.breaker = breaker or CircuitBreaker()
+        self.in_flight = 0
+        self.average_seconds = 1.0
+        self._waiters: deque[asyncio.Future] = deque()
+
+    def _retry_after(self, position: int) -> int:
+        return max(1, math.ceil(self.average_seconds * position / self.concurrency))
+
+    def _reject(self, message: str, status_code: int, retry_after: float, reason: str) -> Overloaded:
+        metrics.increment("admission_rejected", reason=reason)
+        return Overloaded(message, status_code, max(1, math.ceil(retry_after)))
+
+    async def acquire(self):
+        wait = self.breaker.allow(time.monotonic())
+        if wait:
+            raise self._reject("Model is rate limited, try again later", 503, wait, "circuit_open")
+
+        if self.in_flight < self.concurrency and not self._waiters:
+            self.in_flight += 1
+            return
+
+        if len(self._waiters) >= self.queue_size:
+            raise self._reject("Too many requests queued", 429, self._retry_after(len(self._waiters) + 1),
+                               "queue_full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.queue_seconds)
+        except asyncio.TimeoutError:
+            if waiter.done():
+                # Slot was handed over right at the deadline
+                metrics.observe("admission_wait", time.perf_counter() - start)
+                return
+            self._waiters.remove(waiter)
+            waiter.cancel()
+            raise self._reject("Request waited too long for a free slot", 503,
+                               self._retry_after(len(self._waiters) + 1), "queue_timeout")
+        except asyncio.CancelledError:
+            # Client went away while waiting. Hand the slot over when it was already given
+            if waiter.done() and not waiter.cancelled():
+                self.release(0)
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+        metrics.observe("admission_wait", time.perf_counter() - start)
+
+    def release(self, seconds: float, rate_limited: bool = False):
+        if seconds:
+            self.average_seconds += self.smoothing * (seconds - self.average_seconds)
+            self.breaker.record(rate_limited, time.monotonic())
+
+        # The slot goes straight to the next waiter, so in_flight stays the same
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def held(self):
+        """
+        Release an acquired slot once the work is done. Work that hit model rate limits counts for the breaker
+        """
+        hits = [0]
+        token = request_rate_limits.set(hits)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            request_rate_limits.reset(token)
+            self.release(time.perf_counter() - start, hits[0] > 0)
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        async with self.held():
+            yield
+
+    def stats(self) -> dict:
+        return {
+            "inFlight": self.in_flight,
+            "queued": len(self._waiters),
+            "maxConcurrent": self.concurrency,
+            "maxQueue": self.queue_size,
+            "circuitOpen": int(self.breaker.is_open),
+        }
+
+
+admission = AdmissionController()
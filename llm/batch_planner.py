@@ -0,0 +1,89 @@
+import os
+import threading
+
+from compaction import compact_candidates
+from utils import estimate_tokens
+
+batch_input_tokens = int(os.getenv("BATCH_INPUT_TOKENS", "6000"))
+batch_output_tokens = int(os.getenv("BATCH_OUTPUT_TOKENS", "2400"))
+batch_max_candidates = int(os.getenv("BATCH_MAX_CANDIDATES", "30"))
+# Each score has 5 small fields plus highlights of up to 40 words
+output_tokens_per_candidate = int(os.getenv("OUTPUT_TOKENS_PER_CANDIDATE", "100"))
+
+
+class BatchPlanner:
+    """
+    Packs candidates into batches that fit an input and output token budget, instead of a fixed amount
+    per batch. Budgets shrink when responses often miss or break candidates (usually truncated output),
+    and grow back while they parse fine
+    """
+
+    # Smoothing of the observed failure rate, and thresholds to shrink or grow budgets
+    smoothing = 0.2
+    shrink_above = 0.15
+    grow_below = 0.05
+    min_scale = 0.25
+
+    def __init__(self, input_tokens: int = batch_input_tokens, output_tokens: int = batch_output_tokens,
+                 max_candidates: int = batch_max_candidates, output_per_candidate: int = output_tokens_per_candidate):
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.max_candidates = max(1, max_candidates)
+        self.output_per_candidate = output_per_candidate
+        self.scale = 1.0
+        self.failure_rate = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def candidate_tokens(candidate: dict) -> int:
+        return estimate_tokens(compact_candidates([candidate]))
+
+    def limits(self) -> tuple[float, int]:
+        """
+        Current input tokens budget and max candidates of a batch
+        """
+        max_candidates = min(self.max_candidates,
+                             max(1, int(self.output_tokens * self.scale // self.output_per_candidate)))
+        return self.input_tokens * self.scale, max_candidates
+
+    def plan(self, candidates: list[dict]) -> list[list[dict]]:
+        """
+        Split candidates in batches, keeping their order. A candidate over the budget goes on its own batch
+        """
+        input_budget, max_candidates = self.limits()
+
+        batches = []
+        batch = []
+        batch_tokens = 0
+        for candidate in candidates:
+            tokens = self.candidate_tokens(candidate)
+            if batch and (batch_tokens + tokens > input_budget or len(batch) >= max_candidates):
+                batches.append(batch)
+                batch = []
+                batch_tokens = 0
+            batch.append(candidate)
+            batch_tokens += tokens
+
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def record(self, candidates: int, failed: int):
+        """
+        Record how many candidates of a batch were missing or invalid on its first response
+        """
+        if not candidates:
+            return
+        with self._lock:
+            self.failure_rate += self.smoothing * (failed / candidates - self.failure_rate)
+            if self.failure_rate > self.shrink_above:
+                self.scale = max(self.min_scale, self.scale * 0.8)
+            elif self.failure_rate < self.grow_below:
+                self.scale = min(1.0, self.scale * 1.1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"scale": round(self.scale, 3), "failureRate": round(self.failure_rate, 3)}
+
+
+batch_planner = BatchPlanner()
@@ -0,0 +1,96 @@
+import asyncio
+import math
+import random
+import threading
+import time
+
+from google.api_core.exceptions import ResourceExhausted
+
+from benchmark.fake_model import extract_candidate_ids, fake_scores_response
+from schema.connector import Connector
+from schema.types import Prompt
+
+
+class FakeConnector(Connector):
+    """
+    Connector answering like the model without calling it. Latency follows a lognormal distribution
+    around latency_ms, and rate limits or malformed responses are injected at the given rates.
+    Rate limits are retried like GeminiConnector does, with its backoff scaled by backoff_scale
+    """
+
+    def __init__(self, latency_ms: float = 800, latency_sigma: float = 0.35, rate_limit_rate: float = 0.0,
+                 malformed_rate: float = 0.0, backoff_scale: float = 0.01, max_retries: int = 5, seed: int = None):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.rate_limit_rate = rate_limit_rate
+        self.malformed_rate = malformed_rate
+        self.backoff_scale = backoff_scale
+        self.max_retries = max_retries
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.reattempts = 0
+        self.rate_limited = 0
+        self.malformed = 0
+        self.prompt_bytes = 0
+        self.latencies: list[float] = []
+
+    def _sample_latency(self) -> float:
+        if self.latency_ms <= 0:
+            return 0.0
+        with self._lock:
+            return self._rng.lognormvariate(math.log(self.latency_ms / 1000), self.latency_sigma)
+
+    def _answer(self, prompt: Prompt) -> str:
+        """
+        Response of a single model call. Raises ResourceExhausted on injected rate limits
+        """
+        with self._lock:
+            self.calls += 1
+            self.prompt_bytes += len(prompt.get_full_prompt().encode("utf-8"))
+            if self._rng.random() < self.rate_limit_rate:
+                self.rate_limited += 1
+                raise ResourceExhausted("Injected rate limit")
+            response, is_malformed = fake_scores_response(extract_candidate_ids(prompt.batch_data or prompt.data),
+                                                          self._rng, self.malformed_rate)
+            self.malformed += int(is_malformed)
+            return response
+
+    def request(self, prompt: Prompt) -> str:
+        if prompt.retry_text:
+            self.reattempts += 1
+        for attempt in range(1, self.max_retries + 1):
+            latency = self._sample_latency()
+            time.sleep(latency)
+            try:
+                response = self._answer(prompt)
+                self.latencies.append(latency)
+                return response
+            except ResourceExhausted:
+                time.sleep(3 ** attempt * self.backoff_scale)
+
+        raise Exception("Maximum retry attempts reached. Could not complete the request.")
+
+    async def arequest(self, prompt: Prompt) -> str:
+        if prompt.retry_text:
+            self.reattempts += 1
+        for attempt in range(1, self.max_retries + 1):
+            latency = self._sample_latency()
+            await asyncio.sleep(latency)
+            try:
+                response = self._answer(prompt)
+                self.latencies.append(latency)
+                return response
+            except ResourceExhausted:
+                await asyncio.sleep(3 ** attempt * self.backoff_scale)
+
+        raise Exception("Maximum retry attempts reached. Could not complete the request.")
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "reattempts": self.reattempts,
+            "rateLimited": self.rate_limited,
+            "malformed": self.malformed,
+            "promptBytes": self.prompt_bytes,
+        }
@@ -0,0 +1,45 @@
+import json
+import random
+import re
+
+candidate_id_pattern = re.compile(r'"candidateId"\s*:\s*"?([^",}\]]+)')
+malformed_kinds = ["missing_candidate", "out_of_range", "truncated", "not_json"]
+
+
+def extract_candidate_ids(prompt_text: str) -> list[str]:
+    """
+    Find the candidateIds of the batch, which are sent after the last 'candidate list:' of the prompt
+    """
+    _, _, batch = prompt_text.rpartition("candidate list:")
+    return candidate_id_pattern.findall(batch)
+
+
+def fake_scores_response(candidate_ids: list[str], rng: random.Random, malformed_rate: float = 0.0) -> tuple[str, bool]:
+    """
+    Build a model like response scoring every candidate. Returns the response and whether it was made malformed
+    """
+    scores = [
+        {
+            "candidateId": candidate_id,
+            "overallExperience": rng.randint(0, 50),
+            "education": rng.randint(0, 20),
+            "questionAlignment": rng.randint(0, 20),
+            "completion": rng.randint(0, 10),
+            "highlights": "Candidate has experience related to the job description and answered most questions.",
+        }
+        for candidate_id in candidate_ids
+    ]
+
+    kind = rng.choice(malformed_kinds) if scores and rng.random() < malformed_rate else None
+    if kind == "missing_candidate":
+        scores.pop(rng.randrange(len(scores)))
+    elif kind == "out_of_range":
+        scores[rng.randrange(len(scores))]["overallExperience"] = 80
+
+    response = "```json\n" + json.dumps({"candidates": scores}) + "\n```"
+    if kind == "truncated":
+        response = response[:int(len(response) * 0.7)]
+    elif kind == "not_json":
+        response = "I could not process the candidates list."
+
+    return response, kind is not None
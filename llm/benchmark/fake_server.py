@@ -0,0 +1,105 @@
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmark.fake_model import extract_candidate_ids, fake_scores_response
+from data.prompt_defaults import prompt_reattempt
+
+
+class FakeModelServer:
+    """
+    Local stand-in for the Gemini REST API (generateContent). Point GeminiConnector to it with
+    GEMINI_API_ENDPOINT to benchmark the real connector without spending quota
+    """
+
+    def __init__(self, latency_ms: float = 800, latency_sigma: float = 0.35, rate_limit_rate: float = 0.0,
+                 malformed_rate: float = 0.0, seed: int = None, port: int = 0):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.rate_limit_rate = rate_limit_rate
+        self.malformed_rate = malformed_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.reattempts = 0
+        self.rate_limited = 0
+        self.malformed = 0
+        self.prompt_bytes = 0
+        self.latencies: list[float] = []
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeModelServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _respond(self, body: bytes) -> tuple[int, dict]:
+        request = json.loads(body or b"{}")
+        text = "\n".join(part.get("text", "") for content in request.get("contents", [])
+                         for part in content.get("parts", []))
+
+        with self._lock:
+            self.calls += 1
+            self.reattempts += int(prompt_reattempt in text)
+            self.prompt_bytes += len(body)
+            latency = self._rng.lognormvariate(math.log(self.latency_ms / 1000), self.latency_sigma) \
+                if self.latency_ms > 0 else 0.0
+            is_rate_limited = self._rng.random() < self.rate_limit_rate
+            if is_rate_limited:
+                self.rate_limited += 1
+            else:
+                response, is_malformed = fake_scores_response(extract_candidate_ids(text), self._rng,
+                                                              self.malformed_rate)
+                self.malformed += int(is_malformed)
+                self.latencies.append(latency)
+
+        time.sleep(latency)
+        if is_rate_limited:
+            return 429, {"error": {"code": 429, "message": "Resource has been exhausted", "status": "RESOURCE_EXHAUSTED"}}
+
+        return 200, {
+            "candidates": [{"content": {"parts": [{"text": response}], "role": "model"}, "finishReason": "STOP"}],
+            "usageMetadata": {"promptTokenCount": len(text) // 4, "candidatesTokenCount": len(response) // 4},
+        }
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                status, payload = server._respond(self.rfile.read(length))
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "reattempts": self.reattempts,
+            "rateLimited": self.rate_limited,
+            "malformed": self.malformed,
+            "promptBytes": self.prompt_bytes,
+        }
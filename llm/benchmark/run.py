@@ -0,0 +1,197 @@
+"""
+Offline throughput benchmark of the scoring path. Run from /llm, e.g.:
+
+    python -m benchmark.run --mode handler --jobs 5 --candidates 200 --latency-ms 800 --rate-limit-rate 0.05
+
+Modes:
+    handler: Handler.ahandle_bulk with a FakeConnector
+    app: POST /bulk on the FastAPI app (served by uvicorn) with a FakeConnector
+    server: Handler.ahandle_bulk with the real GeminiConnector against the local FakeModelServer
+"""
+import argparse
+import asyncio
+import copy
+import json
+import random
+import socket
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from unittest.mock import patch
+
+from benchmark.fake_connector import FakeConnector
+from benchmark.fake_server import FakeModelServer
+from data.prompt_defaults import example_candidate_1, example_candidate_2
+
+
+def make_candidates(count: int, seed: int = None) -> list[dict]:
+    rng = random.Random(seed)
+    candidates = []
+    for idx in range(count):
+        candidate = copy.deepcopy(rng.choice([example_candidate_1, example_candidate_2]))
+        candidate["candidateId"] = f"bench-{idx}"
+        candidate["candidateName"] = f"Candidate {idx}"
+        if rng.random() < 0.3:
+            candidate["questions"] = []
+        candidates.append(candidate)
+    return candidates
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return round(ordered[idx], 4)
+
+
+def latency_summary(values: list[float]) -> dict:
+    return {"p50": percentile(values, 50), "p95": percentile(values, 95), "p99": percentile(values, 99)}
+
+
+def job_descriptions(jobs: int) -> list[str]:
+    # Each job gets its own description, so jobs don't hit each other cached scores
+    return [f"Benchmark job {idx}: Ruby Developer with 2+ years of experience in Ruby on Rails" for idx in range(jobs)]
+
+
+@contextmanager
+def use_connector(connector):
+    import handler
+
+    with patch.object(handler, "GeminiConnector", lambda **_: connector):
+        yield
+
+
+@contextmanager
+def isolated_stores():
+    """
+    Fresh score cache and no result store, so every run sends the same batches instead of being answered
+    by scores persisted on previous runs
+    """
+    import handler
+    from score_cache import MemoryScoreCache
+
+    with patch.object(handler, "result_store", None), patch.object(handler, "score_cache", MemoryScoreCache()):
+        yield
+
+
+async def run_handler_jobs(jobs: int, candidates: list[dict]) -> list[float]:
+    from handler import Handler
+    from schema.types import BulkJobData
+
+    async def run_job(job_description: str) -> float:
+        start = time.perf_counter()
+        result = await Handler.ahandle_bulk(BulkJobData(job="", jobDescription=job_description, candidates=candidates))
+        assert len(result["candidates"]) == len(candidates)
+        return time.perf_counter() - start
+
+    return list(await asyncio.gather(*(run_job(jd) for jd in job_descriptions(jobs))))
+
+
+@contextmanager
+def serve_app():
+    import uvicorn
+    from main import app
+
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def run_app_jobs(jobs: int, candidates: list[dict]) -> list[float]:
+    def run_job(url: str, job_description: str) -> float:
+        body = json.dumps({"job": "", "jobDescription": job_description, "candidates": candidates}).encode("utf-8")
+        request = urllib.request.Request(f"{url}/bulk", data=body, headers={"Content-Type": "application/json"})
+        start = time.perf_counter()
+        with urllib.request.urlopen(request, timeout=600) as response:
+            result = json.loads(response.read())
+        assert len(result["result"]["candidates"]) == len(candidates)
+        return time.perf_counter() - start
+
+    with serve_app() as url, ThreadPoolExecutor(max_workers=jobs) as executor:
+        return list(executor.map(lambda jd: run_job(url, jd), job_descriptions(jobs)))
+
+
+def run_benchmark(mode: str = "handler", jobs: int = 5, candidates: int = 200, latency_ms: float = 800,
+                  latency_sigma: float = 0.35, rate_limit_rate: float = 0.0, malformed_rate: float = 0.0,
+                  backoff_scale: float = 0.01, seed: int = None) -> dict:
+    candidate_list = make_candidates(candidates, seed)
+    start = time.perf_counter()
+
+    with isolated_stores():
+        if mode == "server":
+            import gemini_connector
+
+            server = FakeModelServer(latency_ms, latency_sigma, rate_limit_rate, malformed_rate, seed).start()
+            try:
+                with patch.object(gemini_connector, "gemini_endpoint", server.url), \
+                        patch.object(gemini_connector, "gemini_key", "benchmark"), \
+                        patch.object(gemini_connector.GeminiConnector, "_backoff_time",
+                                     staticmethod(lambda attempt: 3 ** attempt * backoff_scale)):
+                    job_latencies = asyncio.run(run_handler_jobs(jobs, candidate_list))
+            finally:
+                server.stop()
+            stats = server.stats()
+            batch_latencies = server.latencies
+        else:
+            connector = FakeConnector(latency_ms, latency_sigma, rate_limit_rate, malformed_rate, backoff_scale, seed=seed)
+            with use_connector(connector):
+                if mode == "app":
+                    job_latencies = run_app_jobs(jobs, candidate_list)
+                else:
+                    job_latencies = asyncio.run(run_handler_jobs(jobs, candidate_list))
+            stats = connector.stats()
+            batch_latencies = connector.latencies
+
+    wall_time = time.perf_counter() - start
+    batches = stats["calls"] - stats["rateLimited"]
+    return {
+        "mode": mode,
+        "jobs": jobs,
+        "candidatesPerJob": candidates,
+        "wallSeconds": round(wall_time, 3),
+        "jobLatency": latency_summary(job_latencies),
+        "batchLatency": latency_summary(batch_latencies),
+        "batches": batches,
+        "batchesPerSecond": round(batches / wall_time, 2) if wall_time else 0.0,
+        "rateLimitRetries": stats["rateLimited"],
+        "malformedResponses": stats["malformed"],
+        "reattempts": stats["reattempts"],
+        "promptBytes": stats["promptBytes"],
+        "promptBytesPerBatch": round(stats["promptBytes"] / stats["calls"]) if stats["calls"] else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the candidate scoring path")
+    parser.add_argument("--mode", choices=["handler", "app", "server"], default="handler")
+    parser.add_argument("--jobs", type=int, default=5, help="Concurrent jobs")
+    parser.add_argument("--candidates", type=int, default=200, help="Candidates per job")
+    parser.add_argument("--latency-ms", type=float, default=800, help="Median model latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.35, help="Lognormal sigma of the model latency")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of calls answered with a rate limit")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Share of malformed model responses")
+    parser.add_argument("--backoff-scale", type=float, default=0.01, help="Scale applied to rate limit backoff sleeps")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    report = run_benchmark(args.mode, args.jobs, args.candidates, args.latency_ms, args.latency_sigma,
+                           args.rate_limit_rate, args.malformed_rate, args.backoff_scale, args.seed)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
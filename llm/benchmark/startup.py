@@ -0,0 +1,119 @@
+"""
+Cold start benchmark of the Lambda entrypoint. Each run starts a fresh interpreter, imports main and sends
+a first POST / through the Mangum handler, with the real GeminiConnector against the local FakeModelServer.
+Run from /llm, e.g.:
+
+    python -m benchmark.startup --runs 5 --max-first-response-ms 1500
+
+Exits with 1 when the median import or first response time is over the given limits, so cold start
+regressions can fail a CI step.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmark.fake_server import FakeModelServer
+from data.prompt_defaults import example_candidate_1, example_candidate_2
+
+llm_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+child_script = """
+import json
+import sys
+import time
+
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+response = main.handler(json.loads(sys.argv[1]), None)
+done = time.perf_counter()
+print(json.dumps({"import": imported - start, "firstResponse": done - imported, "status": response["statusCode"]}))
+"""
+
+
+def make_event(body: dict) -> dict:
+    # API Gateway HTTP API (payload 2.0) event, as the one the template.yaml function receives
+    return {
+        "version": "2.0",
+        "routeKey": "POST /",
+        "rawPath": "/",
+        "rawQueryString": "",
+        "headers": {"content-type": "application/json", "host": "localhost"},
+        "requestContext": {
+            "http": {"method": "POST", "path": "/", "protocol": "HTTP/1.1", "sourceIp": "127.0.0.1",
+                     "userAgent": "startup-benchmark"},
+            "stage": "$default",
+        },
+        "body": json.dumps(body),
+        "isBase64Encoded": False,
+    }
+
+
+def run_once(server_url: str, warmup: bool) -> dict:
+    env = {
+        **os.environ,
+        "AWS_LAMBDA_FUNCTION_NAME": "startup-benchmark",
+        "GEMINI_KEY": "benchmark",
+        "GEMINI_API_ENDPOINT": server_url,
+        "SCORE_CACHE_BACKEND": "none",
+        "RESULT_STORE_BACKEND": "none",
+        "WARMUP": "true" if warmup else "false",
+    }
+    event = make_event({"job": "", "jobDescription": "Ruby Developer with 2+ years of experience in Ruby on Rails",
+                        "candidates": [example_candidate_1, example_candidate_2]})
+
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", child_script, json.dumps(event)], cwd=llm_directory, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    process_seconds = time.perf_counter() - start
+    timings = json.loads(output.strip().splitlines()[-1])
+    if timings["status"] != 200:
+        raise RuntimeError(f"First request failed with status {timings['status']}")
+    return {**timings, "process": process_seconds}
+
+
+def run_startup_benchmark(runs: int = 5, warmup: bool = False) -> dict:
+    server = FakeModelServer(latency_ms=0, latency_sigma=0).start()
+    try:
+        results = [run_once(server.url, warmup) for _ in range(runs)]
+    finally:
+        server.stop()
+
+    def summary(name: str) -> dict:
+        values = [result[name] * 1000 for result in results]
+        return {"medianMs": round(statistics.median(values), 1), "maxMs": round(max(values), 1)}
+
+    return {
+        "runs": runs,
+        "warmup": warmup,
+        "import": summary("import"),
+        "firstResponse": summary("firstResponse"),
+        "process": summary("process"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start benchmark of the Lambda entrypoint")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to start")
+    parser.add_argument("--warmup", action="store_true", help="Run with WARMUP=true")
+    parser.add_argument("--max-import-ms", type=float, default=None, help="Fail when the median import is slower")
+    parser.add_argument("--max-first-response-ms", type=float, default=None,
+                        help="Fail when the median first response is slower")
+    args = parser.parse_args()
+
+    report = run_startup_benchmark(args.runs, args.warmup)
+    print(json.dumps(report, indent=2))
+
+    limits = (("import", args.max_import_ms), ("firstResponse", args.max_first_response_ms))
+    exceeded = [name for name, limit in limits if limit is not None and report[name]["medianMs"] > limit]
+    if exceeded:
+        print(f"Cold start over the limit: {', '.join(exceeded)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import json
+import os
+
+max_text_length = int(os.getenv("CANDIDATE_MAX_TEXT", "600"))
+short_keys_enabled = os.getenv("CANDIDATE_SHORT_KEYS", "false").lower() == "true"
+
+# candidateId is kept as is, as the model must answer with it
+short_keys = {
+    "candidateName": "name",
+    "education": "edu",
+    "experience": "exp",
+    "questions": "qa",
+    "question": "q",
+    "answer": "a",
+    "institution": "org",
+    "title": "role",
+    "startDate": "from",
+    "endDate": "to",
+    "totalMonths": "months",
+    "disqualified": "dq",
+    "jobApplied": "applied",
+}
+
+# Field dropped when the one it duplicates is present in the same object
+redundant_fields = {
+    "totalExperience": "totalMonths",
+}
+
+
+def get_short_keys_legend() -> str:
+    return "Candidate keys are abbreviated as: " + ", ".join(
+        f"{short}={key}" for key, short in short_keys.items()
+    )
+
+
+def compact_value(value, use_short_keys: bool = False, text_limit: int = max_text_length):
+    """
+    Drop nulls and empty values, redundant fields, and cap long texts. Returns None when nothing is left
+    """
+    if isinstance(value, dict):
+        compacted = {}
+        for key, item in value.items():
+            duplicate_of = redundant_fields.get(key)
+            if duplicate_of is not None and value.get(duplicate_of) is not None:
+                continue
+            item = compact_value(item, use_short_keys, text_limit)
+            if item is not None:
+                compacted[short_keys.get(key, key) if use_short_keys else key] = item
+        return compacted or None
+
+    if isinstance(value, list):
+        compacted = [item for item in (compact_value(item, use_short_keys, text_limit) for item in value)
+                     if item is not None]
+        return compacted or None
+
+    if isinstance(value, str):
+        value = value.strip()
+        if not value:
+            return None
+        if len(value) > text_limit:
+            return value[:text_limit].rstrip() + "..."
+
+    return value
+
+
+def compact_candidates(candidates: list[dict], use_short_keys: bool = short_keys_enabled) -> str:
+    """
+    Serialize candidates as minified JSON, which takes far less tokens than their Python repr
+    """
+    compacted = [compact_value(candidate, use_short_keys) or {} for candidate in candidates]
+    return json.dumps(compacted, separators=(",", ":"), ensure_ascii=False)
+
+
+def measure_compaction(candidates: list[dict]) -> dict:
+    """
+    Compare the size of the previous repr serialization with the compact one
+    """
+    from utils import estimate_tokens
+
+    original = f"{candidates}"
+    report = {"originalBytes": len(original.encode("utf-8")), "originalTokens": estimate_tokens(original)}
+    for name, use_short_keys in (("compact", False), ("short", True)):
+        text = compact_candidates(candidates, use_short_keys)
+        size = len(text.encode("utf-8"))
+        report[f"{name}Bytes"] = size
+        report[f"{name}Tokens"] = estimate_tokens(text)
+        report[f"{name}Reduction"] = round(1 - size / report["originalBytes"], 3)
+
+    return report
+
+
+if __name__ == "__main__":
+    from data.prompt_defaults import example_candidate_1, example_candidate_2
+
+    print(json.dumps(measure_compaction([example_candidate_1, example_candidate_2]), indent=2))
@@ -0,0 +1,67 @@
+import os
+import threading
+from collections import OrderedDict
+
+from schema.connector import Connector
+
+pool_size = int(os.getenv("CONNECTOR_POOL_SIZE", "4"))
+
+
+class ConnectorPool:
+    """
+    Process-wide registry of connectors keyed by connector class and config. Connectors are kept
+    between requests (and between warm Lambda invocations), so client setup is paid only once
+    """
+
+    def __init__(self, max_size: int = pool_size):
+        self.max_size = max(1, max_size)
+        self._connectors: OrderedDict[tuple, Connector] = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+
+    @staticmethod
+    def _key(connector_class: type[Connector], config: dict) -> tuple:
+        return connector_class, tuple(sorted(config.items()))
+
+    def get(self, connector_class: type[Connector], **config) -> Connector:
+        key = self._key(connector_class, config)
+
+        with self._lock:
+            connector = self._connectors.get(key)
+            if connector is not None:
+                if connector.is_healthy():
+                    self._connectors.move_to_end(key)
+                    self.reused += 1
+                    return connector
+                # Unhealthy connectors are replaced with a fresh instance
+                del self._connectors[key]
+                self.evicted += 1
+
+            connector = connector_class(**config)
+            self._connectors[key] = connector
+            self.created += 1
+
+            while len(self._connectors) > self.max_size:
+                self._connectors.popitem(last=False)
+                self.evicted += 1
+
+            return connector
+
+    def clear(self):
+        with self._lock:
+            self._connectors.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._connectors),
+                "maxSize": self.max_size,
+                "created": self.created,
+                "reused": self.reused,
+                "evicted": self.evicted,
+            }
+
+
+connector_pool = ConnectorPool()
@@ -0,0 +1,33 @@
+"""
+Render the default prompt parts ahead of deploy, so cold starts load them instead of building them.
+Run from /llm after changing prompts (and bumping prompt_version):
+
+    python -m data.build_prompts
+"""
+import json
+
+from compaction import max_text_length
+from data.prompt_defaults import artifacts_path, prompt_version, render_examples
+from utils import build_prompt_prefix
+
+
+def build_artifacts() -> dict:
+    examples = render_examples()
+    prefix = build_prompt_prefix(examples=examples)
+    return {
+        "version": prompt_version,
+        "textLimit": max_text_length,
+        "examples": examples,
+        "prefix": {
+            "role": prefix.role,
+            "instruction": prefix.instruction,
+            "context": prefix.context,
+            "examples": prefix.examples,
+        },
+    }
+
+
+if __name__ == "__main__":
+    with open(artifacts_path, "w", encoding="utf-8") as file:
+        json.dump(build_artifacts(), file, indent=2)
+    print(f"Prompt artifacts written to {artifacts_path}")
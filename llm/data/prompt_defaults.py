@@ -1,3 +1,11 @@
+import json
+import os
+
+from compaction import compact_candidates, max_text_length
+
+# Bump whenever prompts change, so cached scores from previous prompts are not reused
+prompt_version = "2"
+
 prompt_role = "Recruiter assistant"
 prompt_role_description = "helping recruiters filter and evaluate candidates based on some data"
 
@@ -19,6 +27,10 @@ prompt_reattempt = ("The last response provided for this prompt was incorrect. R
                       "described and an attribute highlights with a small text of the main highlights of the candidate. Let's "
                       "try again: ")
 
+prompt_matrix_instruction = ("This time you will be given several job descriptions, each with a jobId. Evaluate every "
+                             "candidate against each job separately, and provide one JSON per job and candidate, "
+                             "including the jobId of the job it was evaluated for besides the candidateId.")
+
 example_candidate_1 = {
     "candidateName": "Candidate 1",
     "candidateId": "123457894513",
@@ -153,13 +165,38 @@ example_response_2 = {
     ]
 }
 
-prompt_examples = [
-    {
-        "input": f"This is the job description: {example_job_description_1}, and candidate list: [{example_candidate_1}, {example_candidate_2}]",
-        "response": f"{example_response_1}"
-    },
-    {
-        "input": f"This is the job description: {example_job_description_2}, and candidate list: [{example_candidate_1}, {example_candidate_2}]",
-        "response": f"{example_response_2}"
-    }
-]
+artifacts_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompt_artifacts.json")
+
+
+def render_examples() -> list[dict]:
+    return [
+        {
+            "input": f"This is the job description: {example_job_description_1}, and candidate list: "
+                     f"{compact_candidates([example_candidate_1, example_candidate_2], use_short_keys=False)}",
+            "response": json.dumps(example_response_1)
+        },
+        {
+            "input": f"This is the job description: {example_job_description_2}, and candidate list: "
+                     f"{compact_candidates([example_candidate_1, example_candidate_2], use_short_keys=False)}",
+            "response": json.dumps(example_response_2)
+        }
+    ]
+
+
+def load_prompt_artifacts() -> dict | None:
+    """
+    Prompt parts rendered at build time by `python -m data.build_prompts`. Returns None when missing or built
+    for another prompt version or candidate text limit, so they are rendered at import instead
+    """
+    try:
+        with open(artifacts_path, encoding="utf-8") as file:
+            artifacts = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if artifacts.get("version") != prompt_version or artifacts.get("textLimit") != max_text_length:
+        return None
+    return artifacts
+
+
+prompt_artifacts = load_prompt_artifacts()
+prompt_examples = prompt_artifacts["examples"] if prompt_artifacts else render_examples()
@@ -0,0 +1,78 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Header with the seconds the caller is going to wait for a response
+deadline_header = "x-request-timeout"
+# Deadline of requests without header nor Lambda context. 0 means no deadline
+default_timeout = float(os.getenv("REQUEST_TIMEOUT", "0"))
+# Seconds kept to build and send the response once scoring stops
+deadline_margin = float(os.getenv("DEADLINE_MARGIN", "1"))
+# Seconds a model request needs at least. Attempts and backoff that can't fit it are skipped
+min_request_seconds = float(os.getenv("DEADLINE_MIN_REQUEST", "2"))
+
+timeout_status = "timeout"
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    """
+    Point in time by which a request has to be answered, measured on the monotonic clock
+    """
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def allows(self, seconds: float) -> bool:
+        """
+        Whether work taking the given seconds, plus a model request, still finishes in time
+        """
+        return self.remaining() >= seconds + min_request_seconds
+
+
+# Deadline of the request being scored, so connectors can see it without changing their interface
+current_deadline: ContextVar[Deadline | None] = ContextVar("current_deadline", default=None)
+
+
+@contextmanager
+def deadline_scope(deadline: Deadline | None):
+    token = current_deadline.set(deadline)
+    try:
+        yield
+    finally:
+        current_deadline.reset(token)
+
+
+def check_deadline(wait: float, stage: str):
+    """
+    Raise DeadlineExceeded when waiting the given seconds before a model request can't finish in time
+    """
+    deadline = current_deadline.get()
+    if deadline is not None and not deadline.allows(wait):
+        raise DeadlineExceeded(f"Not enough time left for the {stage}")
+
+
+def request_deadline(timeout_header: str | None = None, aws_context=None) -> Deadline | None:
+    """
+    Deadline of an incoming request: the earliest of the timeout header, the remaining time of the Lambda
+    invocation and REQUEST_TIMEOUT, minus the margin needed to send the response
+    """
+    timeouts = [default_timeout] if default_timeout > 0 else []
+    try:
+        if timeout_header:
+            timeouts.append(float(timeout_header))
+    except ValueError:
+        pass
+    if aws_context is not None and hasattr(aws_context, "get_remaining_time_in_millis"):
+        timeouts.append(aws_context.get_remaining_time_in_millis() / 1000)
+
+    if not timeouts:
+        return None
+    return Deadline(max(0.0, min(timeouts) - deadline_margin))
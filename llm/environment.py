@@ -0,0 +1,26 @@
+import os
+
+_loaded = False
+
+
+def load_environment():
+    """
+    Load the local .env file once, before settings are read. Skipped on Lambda,
+    where settings come from the function environment and looking for the file only adds cold start time
+    """
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    if os.getenv("AWS_LAMBDA_FUNCTION_NAME"):
+        return
+
+    for directory in (os.path.dirname(os.path.abspath(__file__)), os.getcwd()):
+        path = os.path.join(directory, ".env")
+        if os.path.isfile(path):
+            from dotenv import load_dotenv
+            load_dotenv(path)
+            return
+
+
+load_environment()
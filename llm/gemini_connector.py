@@ -1,26 +1,85 @@
-from google.api_core.exceptions import ResourceExhausted
-from google.generativeai import GenerativeModel
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import threading
 import time
+from datetime import timedelta
+from typing import AsyncIterator, TYPE_CHECKING
 
+from admission import record_rate_limit
+from deadline import check_deadline, current_deadline
+from environment import load_environment
+from metrics import metrics
+from rate_limiter import model_rate_limiter
 from schema.connector import Connector
-import google.generativeai as genai
-from dotenv import load_dotenv
 import os
 
 from schema.types import Prompt
+from utils import estimate_tokens
+
+if TYPE_CHECKING:
+    from google.generativeai import GenerativeModel
+
+# The SDK is imported on first use, as importing it is most of the service cold start.
+# Requests answered from cached or stored scores never need it
+genai = None
+ResourceExhausted = None
+TooManyRequests = None
+
+
+def load_sdk():
+    global genai
+    if genai is None:
+        import google.generativeai as sdk
+        genai = sdk
+
+
+def load_errors() -> tuple[type, type]:
+    global ResourceExhausted, TooManyRequests
+    if ResourceExhausted is None or TooManyRequests is None:
+        from google.api_core import exceptions
+        ResourceExhausted = ResourceExhausted or exceptions.ResourceExhausted
+        TooManyRequests = TooManyRequests or exceptions.TooManyRequests
+    return ResourceExhausted, TooManyRequests
 
-load_dotenv()
+
+load_environment()
 gemini_key = os.getenv("GEMINI_KEY")
 max_retries = int(os.getenv("MODEL_MAX_RETRIES", "5"))
+max_failures = int(os.getenv("CONNECTOR_MAX_FAILURES", "3"))
+gemini_model = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+gemini_endpoint = os.getenv("GEMINI_API_ENDPOINT")
+context_cache_enabled = os.getenv("PROMPT_CONTEXT_CACHE", "false").lower() == "true"
+context_cache_ttl = int(os.getenv("PROMPT_CONTEXT_CACHE_TTL", "600"))
+context_cache_size = 32
 
 class GeminiConnector(Connector):
     client: GenerativeModel
+    model_name: str
+    failures: int = 0
 
-    def __init__(self):
-        genai.configure(api_key=gemini_key)
-        self.client = genai.GenerativeModel("gemini-2.0-flash")
+    def __init__(self, model_name: str = gemini_model, retry_rate_limits: bool = True):
+        load_sdk()
+        if gemini_endpoint:
+            # Custom endpoints (like the benchmark stand-in server) are reached over REST
+            genai.configure(api_key=gemini_key, transport="rest", client_options={"api_endpoint": gemini_endpoint})
+        else:
+            genai.configure(api_key=gemini_key)
+        self.model_name = model_name
+        # Routed connectors raise rate limits right away, so the router can fail over to another route
+        self.retry_rate_limits = retry_rate_limits
+        self.client = genai.GenerativeModel(model_name)
+        # Context cache key -> (expiration, cached client or None when the provider refused it, cached tokens)
+        self._context_clients: dict[str, tuple[float, GenerativeModel | None, int]] = {}
+        self._context_lock = threading.Lock()
 
-    def request(self, prompt: Prompt) -> str:
+    def is_healthy(self) -> bool:
+        # Consecutive unexpected errors (not rate limits) mark the client as broken
+        return self.failures < max_failures
+
+    @staticmethod
+    def _build_content(prompt: Prompt) -> list[str]:
         content = [
             prompt.role,
             prompt.instruction,
@@ -32,19 +91,216 @@ class GeminiConnector(Connector):
         if prompt.retry_text is not None:
             content.insert(0, prompt.retry_text)
 
+        return content
+
+    def _get_context_client(self, prompt: Prompt) -> tuple[GenerativeModel | None, int]:
+        """
+        Get a client bound to a provider side cache of the static prompt plus the job description,
+        creating it on first use. Returns no client when caching is not possible, so the full prompt is sent
+        """
+        cached_parts = [*prompt.get_static_content(), prompt.job_context]
+        key = hashlib.sha256("\n".join(cached_parts).encode("utf-8")).hexdigest()
+        now = time.monotonic()
+
+        with self._context_lock:
+            entry = self._context_clients.get(key)
+            if entry is not None and entry[0] > now:
+                return entry[1], entry[2]
+
+            for expired in [k for k, (expires_at, _, _) in self._context_clients.items() if expires_at <= now]:
+                del self._context_clients[expired]
+            while len(self._context_clients) >= context_cache_size:
+                self._context_clients.pop(next(iter(self._context_clients)))
+
+            try:
+                cached_content = genai.caching.CachedContent.create(
+                    model=f"models/{self.model_name}",
+                    contents=["\n".join(cached_parts)],
+                    ttl=timedelta(seconds=context_cache_ttl),
+                )
+                client = genai.GenerativeModel.from_cached_content(cached_content)
+            except Exception as e:
+                # Provider rejected it (prompt too small, offline, unsupported model). Keep the full prompt
+                print(f"Context cache not available, sending full prompt: {e}")
+                client = None
+
+            # Expire locally a bit earlier than the provider does
+            cached_tokens = self._estimate_tokens(cached_parts)
+            self._context_clients[key] = (now + context_cache_ttl * 0.9, client, cached_tokens)
+            return client, cached_tokens
+
+    def _prepare(self, prompt: Prompt) -> tuple[GenerativeModel, list[str]]:
+        """
+        Get the client and the content to send for a prompt
+        """
+        if context_cache_enabled and prompt.job_context is not None:
+            client, cached_tokens = self._get_context_client(prompt)
+            if client is not None:
+                metrics.increment("context_cache_saved_tokens", cached_tokens)
+                return client, [part for part in (prompt.retry_text, prompt.batch_data) if part]
+
+        return self.client, self._build_content(prompt)
+
+    async def _aprepare(self, prompt: Prompt) -> tuple[GenerativeModel, list[str]]:
+        if context_cache_enabled:
+            # Creating the provider cache is a blocking call
+            return await asyncio.to_thread(self._prepare, prompt)
+        return self._prepare(prompt)
+
+    @staticmethod
+    def _generation_config(prompt: Prompt) -> dict | None:
+        if prompt.response_schema is None:
+            return None
+        return {"response_mime_type": "application/json", "response_schema": prompt.response_schema}
+
+    @staticmethod
+    def _estimate_tokens(content: list[str]) -> int:
+        return estimate_tokens("".join(part for part in content if part))
+
+    @staticmethod
+    def _is_rate_limit(e: Exception) -> bool:
+        # REST transport raises the generic HTTP 429 instead of ResourceExhausted
+        return isinstance(e, load_errors())
+
+    @staticmethod
+    def _backoff_time(attempt: int) -> int:
+        wait_time = 3 ** attempt # Last attempt will wait 27 seconds, likely refreshing RPM
+        print(f"Rate limit exceeded, retrying in {wait_time} seconds... (Attempt {attempt})")
+        metrics.increment("rate_limit_hits")
+        record_rate_limit()
+        metrics.observe("backoff", wait_time)
+        return wait_time
+
+    @staticmethod
+    def _request_options() -> dict | None:
+        # Model requests don't run past the request deadline
+        deadline = current_deadline.get()
+        if deadline is None:
+            return None
+        return {"timeout": max(1.0, deadline.remaining())}
+
+    @staticmethod
+    def _record_request(content: list[str]):
+        metrics.increment("model_requests")
+        metrics.increment("prompt_bytes", sum(len(part.encode("utf-8")) for part in content if part))
+
+    @staticmethod
+    def _record_response(text: str, usage=None) -> str:
+        metrics.increment("response_bytes", len(text.encode("utf-8")))
+        for field, name in (("prompt_token_count", "prompt_tokens"), ("candidates_token_count", "response_tokens"),
+                            ("cached_content_token_count", "cached_tokens")):
+            count = getattr(usage, field, None)
+            if isinstance(count, int):
+                metrics.increment(name, count)
+        return text
+
+    def request(self, prompt: Prompt) -> str:
+        client, content = self._prepare(prompt)
+        tokens = self._estimate_tokens(content)
+        generation_config = self._generation_config(prompt)
+
         # Exp backoff
         attempt = 0
         while attempt < int(max_retries):
+            # Outside the try, a request that can't wait for the quota before its deadline isn't a failure
+            model_rate_limiter.acquire(tokens)
+            try:
+                self._record_request(content)
+                with metrics.timer("model_request"):
+                    response = client.generate_content(contents=content, generation_config=generation_config,
+                                                       request_options=self._request_options())
+                self.failures = 0
+                return self._record_response(response.text, getattr(response, "usage_metadata", None))
+            except Exception as e:
+                if not self._is_rate_limit(e):
+                    self.failures += 1
+                    raise e
+                if not self.retry_rate_limits:
+                    raise e
+                model_rate_limiter.drain()
+                attempt += 1
+                wait_time = self._backoff_time(attempt)
+                check_deadline(wait_time, "rate limit backoff")
+                time.sleep(wait_time)
+
+        raise Exception("Maximum retry attempts reached. Could not complete the request.")
+
+    async def arequest(self, prompt: Prompt) -> str:
+        if gemini_endpoint:
+            # SDK async client does not support REST transport, so the request runs on a worker thread
+            return await super().arequest(prompt)
+
+        client, content = await self._aprepare(prompt)
+        tokens = self._estimate_tokens(content)
+        generation_config = self._generation_config(prompt)
+
+        # Same exp backoff as request, but sleeping without blocking the event loop
+        attempt = 0
+        while attempt < int(max_retries):
+            await model_rate_limiter.aacquire(tokens)
+            try:
+                self._record_request(content)
+                with metrics.timer("model_request"):
+                    response = await client.generate_content_async(contents=content,
+                                                                    generation_config=generation_config,
+                                                                    request_options=self._request_options())
+                self.failures = 0
+                return self._record_response(response.text, getattr(response, "usage_metadata", None))
+            except Exception as e:
+                if not self._is_rate_limit(e):
+                    self.failures += 1
+                    raise e
+                if not self.retry_rate_limits:
+                    raise e
+                model_rate_limiter.drain()
+                attempt += 1
+                wait_time = self._backoff_time(attempt)
+                check_deadline(wait_time, "rate limit backoff")
+                await asyncio.sleep(wait_time)
+
+        raise Exception("Maximum retry attempts reached. Could not complete the request.")
+
+    async def astream(self, prompt: Prompt) -> AsyncIterator[str]:
+        if gemini_endpoint:
+            async for chunk in super().astream(prompt):
+                yield chunk
+            return
+
+        client, content = await self._aprepare(prompt)
+        tokens = self._estimate_tokens(content)
+        generation_config = self._generation_config(prompt)
+
+        attempt = 0
+        received = False
+        while attempt < int(max_retries):
+            await model_rate_limiter.aacquire(tokens)
             try:
-                response = self.client.generate_content(contents=content)
-                return response.text
+                self._record_request(content)
+                start = time.perf_counter()
+                response = await client.generate_content_async(contents=content, stream=True,
+                                                                generation_config=generation_config,
+                                                                request_options=self._request_options())
+                text_size = 0
+                async for chunk in response:
+                    received = True
+                    text = chunk.text
+                    text_size += len(text.encode("utf-8"))
+                    yield text
+                metrics.observe("model_request", time.perf_counter() - start)
+                metrics.increment("response_bytes", text_size)
+                self.failures = 0
+                return
             except Exception as e:
-                if isinstance(e, ResourceExhausted):
+                # Once chunks were sent a retry would duplicate them, so only retry before the first chunk
+                if self._is_rate_limit(e) and not received and self.retry_rate_limits:
+                    model_rate_limiter.drain()
                     attempt += 1
-                    wait_time = 3 ** attempt # Last attempt will wait 27 seconds, likely refreshing RPM
-                    print(f"Rate limit exceeded, retrying in {wait_time} seconds... (Attempt {attempt})")
-                    time.sleep(wait_time)
+                    wait_time = self._backoff_time(attempt)
+                    check_deadline(wait_time, "rate limit backoff")
+                    await asyncio.sleep(wait_time)
                 else:
+                    if not self._is_rate_limit(e):
+                        self.failures += 1
                     raise e
 
         raise Exception("Maximum retry attempts reached. Could not complete the request.")
@@ -1,36 +1,624 @@
+import asyncio
 import os
+import time
+from typing import AsyncIterator, AsyncIterable
+
 from data.prompt_defaults import prompt_role, prompt_instruction, prompt_role_description, prompt_context, \
-    prompt_examples, prompt_reattempt
-from gemini_connector import GeminiConnector
-from schema.types import JobData
-from utils import verify_parsing, get_json_from_response, get_prompt
+    prompt_examples, prompt_reattempt, prompt_version, example_candidate_1, example_job_description_1
+from batch_planner import batch_planner
+from connector_pool import connector_pool
+from deadline import Deadline, DeadlineExceeded, deadline_scope, timeout_status
+from gemini_connector import GeminiConnector, gemini_model
+from json_salvage import SalvagedJson
+from metrics import metrics, log_event
+from prescoring import prescore, score_bounds, set_local_completion
+from routing_connector import GeminiRouter, model_routes
+from schema.connector import Connector
+from schema.types import JobData, BulkJobData
+from result_store import result_store
+from score_cache import score_cache, score_key
+from single_flight import request_flight, flight_key, coalescing_enabled
+from stream_parser import CandidateStreamParser
+from utils import get_json_from_response, get_prompt, split_in_batches, order_scores, split_valid_scores, \
+    parse_score, split_job_scores, score_total, candidate_id
 
 max_attempts = int(os.getenv("MAX_PARSE_ATTEMPTS", "5"))
+# Fixed candidates per batch on bulk requests. 0 sizes batches by token budget
+batch_size = int(os.getenv("BATCH_SIZE", "0"))
+batch_concurrency = int(os.getenv("BATCH_CONCURRENCY", "5"))
+# Candidates per batch on top K requests. Smaller batches let scoring stop earlier
+top_k_batch_size = int(os.getenv("TOP_K_BATCH_SIZE", "10"))
+score_version = f"{prompt_version}:{gemini_model}"
+
+class ScoringRequest:
+    """
+    Tracks the candidates of a batch that still need a valid score. Valid scores are kept between attempts,
+    and reattempts only include the candidates that were missing or invalid in the previous response.
+    On matrix requests (several jobs) a candidate needs a valid score for every job.
+    When the deadline leaves no time for another attempt, it stops with the valid scores received so far
+    """
+
+    def __init__(self, job_data: JobData, candidates: list[dict], is_retry: bool = False, deadline: Deadline = None):
+        self.job_data = job_data
+        self.deadline = deadline
+        self.timed_out = False
+        self.job_ids = job_data.job_ids
+        self.candidates = candidates
+        self.remaining = candidates
+        self.scores: list[dict] = []
+        self.attempts = 2 if is_retry else 1
+        self.prompt = self._build_prompt(candidates)
+        self._is_retry_prompt = is_retry
+        if is_retry:
+            self.prompt.set_retry_text(prompt_reattempt)
+
+    def run(self, connector: Connector) -> "ScoringRequest":
+        with deadline_scope(self.deadline):
+            try:
+                while self._can_attempt() and not self.receive(connector.request(self.prompt)):
+                    pass
+            except Exception as e:
+                if not self._is_past_deadline(e):
+                    raise e
+                self._expire()
+        return self
+
+    async def arun(self, connector: Connector) -> "ScoringRequest":
+        with deadline_scope(self.deadline):
+            try:
+                while self._can_attempt() and not self.receive(await connector.arequest(self.prompt)):
+                    pass
+            except Exception as e:
+                if not self._is_past_deadline(e):
+                    raise e
+                self._expire()
+        return self
+
+    def _can_attempt(self) -> bool:
+        if self.deadline is None or self.deadline.allows(0):
+            return True
+        self._expire()
+        return False
+
+    def _is_past_deadline(self, e: Exception) -> bool:
+        # Skipped backoff, or the model request itself timed out at the deadline
+        return isinstance(e, DeadlineExceeded) or (self.deadline is not None and not self.deadline.remaining())
+
+    def _expire(self):
+        self.timed_out = True
+        metrics.increment("deadline_exceeded")
+        print(f"Deadline reached, returning {len(self.candidates) - len(self.remaining)} of "
+              f"{len(self.candidates)} candidates scored")
+
+    def receive(self, response: str) -> bool:
+        """
+        Process a model response. Returns True once every candidate has a valid score
+        """
+        # In case invalid JSON that can't be salvaged, this will return empty dict, so every candidate stays remaining
+        with metrics.timer("stage", stage="parse_json"):
+            data = get_json_from_response(response)
+        salvaged = isinstance(data, SalvagedJson)
+        with metrics.timer("stage", stage="validate"):
+            valid, invalid = split_valid_scores(data, self.remaining, self.job_ids)
+        self.scores.extend(set_local_completion(self.remaining, valid))
+        if self.attempts == 1:
+            batch_planner.record(len(self.remaining), len(invalid))
+        if salvaged:
+            metrics.increment("salvaged_scores", len(valid))
+            if valid and not invalid:
+                metrics.increment("salvage_retries_avoided")
+
+        if not invalid:
+            self.remaining = []
+            return True
+
+        if self.attempts > max_attempts:
+            metrics.increment("parse_failures")
+            raise Exception("Data received could not be parsed. Attempts reached")
+
+        metrics.increment("parse_retries")
+        if len(invalid) < len(self.remaining):
+            print(f"Reattempting {len(invalid)} of {len(self.remaining)} candidates")
+            self.prompt = self._build_prompt(invalid)
+            self._is_retry_prompt = False
+        if not self._is_retry_prompt:
+            self.prompt.set_retry_text(prompt_reattempt)
+            self._is_retry_prompt = True
+
+        self.remaining = invalid
+        self.attempts += 1
+        return False
+
+    def _build_prompt(self, candidates: list[dict]):
+        with metrics.timer("stage", stage="get_prompt"):
+            return get_prompt(Handler._pending_job(self.job_data, candidates))
+
+    def result(self) -> dict:
+        if self.job_ids:
+            data = {"jobs": [{"jobId": job_id, "candidates": order_scores(self.candidates, scores)}
+                             for job_id, scores in split_job_scores(self.scores, self.job_ids).items()]}
+        else:
+            data = {"candidates": order_scores(self.candidates, self.scores)}
+        if self.timed_out:
+            data.update(Handler.timeout_result(self.remaining))
+        return data
+
 
 class Handler:
     @staticmethod
-    def handle_request(job_data: JobData) -> dict:
-        connector = GeminiConnector()
-        attempts = 1
+    def handle_request(job_data: JobData, deadline: Deadline = None) -> dict:
+        if job_data.jobs:
+            return Handler.handle_matrix(job_data, deadline)
+        start = time.perf_counter()
+        cached, pending = Handler._split_pending(job_data)
+        if not pending:
+            Handler._log_request(job_data, cached, start)
+            return Handler._merge_scores(job_data, cached, {})
 
-        prompt = get_prompt(job_data)
+        request = ScoringRequest(job_data, pending, deadline=deadline).run(Handler._get_connector())
+        data = request.result()
+        Handler._store_scores(job_data, pending, data)
+        Handler._log_request(job_data, cached, start, request)
+        return Handler._merge_scores(job_data, cached, data)
 
-        response = connector.request(prompt)
-        # In case invalid JSON, this will return empty error, which will return in invalidation
-        data = get_json_from_response(response)
-        is_valid = verify_parsing(data)
+    @staticmethod
+    async def ahandle_request(job_data: JobData, deadline: Deadline = None) -> dict:
+        """
+        Async version of handle_request. Model calls and backoff are awaited, so a single
+        worker can keep several batches in flight at once
+        """
+        if job_data.jobs:
+            return await Handler.ahandle_matrix(job_data, deadline)
+        start = time.perf_counter()
+        cached, pending = await Handler._asplit_pending(job_data)
+        if not pending:
+            Handler._log_request(job_data, cached, start)
+            return Handler._merge_scores(job_data, cached, {})
 
-        while not is_valid:
-            if attempts > max_attempts:
-                raise Exception("Data received could not be parsed. Attempts reached")
-            if attempts == 1:
-                prompt.set_retry_text(prompt_reattempt)
+        if coalescing_enabled:
+            # Identical requests already in flight (same job description and candidates) share its model calls
+            key = flight_key(job_data.jobDescription, pending, score_version)
+            try:
+                request = await request_flight.do(key, lambda: Handler._ascore_pending(job_data, pending, deadline),
+                                                  deadline.remaining() if deadline is not None else None)
+            except asyncio.TimeoutError:
+                # The shared call didn't finish before this request deadline
+                metrics.increment("deadline_exceeded")
+                Handler._log_request(job_data, cached, start)
+                return Handler._merge_scores(job_data, cached, {"candidates": [], **Handler.timeout_result(pending)})
+        else:
+            request = await Handler._ascore_pending(job_data, pending, deadline)
 
-            response = connector.request(prompt)
+        scores = request.scores
+        if request.timed_out and Handler._outlasts(deadline, request.deadline):
+            # Shared call cut short by the deadline of the request that started it, this one has time for the rest
+            request = await Handler._ascore_pending(job_data, request.remaining, deadline)
+            scores = [*scores, *request.scores]
 
-            data = get_json_from_response(response)
-            is_valid = verify_parsing(data)
-            attempts += 1
+        data = {**request.result(), "candidates": order_scores(pending, scores)}
+        Handler._log_request(job_data, cached, start, request)
+        return Handler._merge_scores(job_data, cached, data)
+
+    @staticmethod
+    async def _ascore_pending(job_data: JobData, pending: list[dict], deadline: Deadline = None) -> ScoringRequest:
+        request = await ScoringRequest(job_data, pending, deadline=deadline).arun(Handler._get_connector())
+        await Handler._astore_scores(job_data, pending, request.result())
+        return request
+
+    @staticmethod
+    def handle_matrix(job_data: JobData, deadline: Deadline = None) -> dict:
+        """
+        Score the candidates against several jobs on shared prompts, so each candidate is sent once per batch
+        instead of once per job. Returns the scores of every job, in the candidates order
+        """
+        start = time.perf_counter()
+        job_datas, cached, pending = Handler._split_matrix_pending(job_data)
+        request = None
+        if pending:
+            request = ScoringRequest(job_data, pending, deadline=deadline).run(Handler._get_connector())
+        return Handler._matrix_result(job_data, job_datas, cached, start, request)
+
+    @staticmethod
+    async def ahandle_matrix(job_data: JobData, deadline: Deadline = None) -> dict:
+        """
+        Async version of handle_matrix
+        """
+        start = time.perf_counter()
+        job_datas, cached, pending = await asyncio.to_thread(Handler._split_matrix_pending, job_data)
+        request = None
+        if pending:
+            request = await ScoringRequest(job_data, pending, deadline=deadline).arun(Handler._get_connector())
+        return await asyncio.to_thread(Handler._matrix_result, job_data, job_datas, cached, start, request)
+
+    @staticmethod
+    def warm_up():
+        """
+        Pay the first request setup ahead (SDK import, model client, prompt building and local scoring),
+        for example during the Lambda init phase
+        """
+        with metrics.timer("stage", stage="warm_up"):
+            Handler._get_connector()
+            job_data = JobData(job="", jobDescription=example_job_description_1, candidates=[example_candidate_1])
+            prescore(job_data.jobDescription, job_data.candidates)
+            get_prompt(job_data)
+
+    @staticmethod
+    def _outlasts(deadline: Deadline | None, other: Deadline | None) -> bool:
+        """
+        Whether a request with deadline can still score after other was reached
+        """
+        if other is None:
+            return False
+        return deadline is None or (deadline.expires_at > other.expires_at and deadline.allows(0))
+
+    @staticmethod
+    def timeout_result(missing: list[dict]) -> dict:
+        """
+        Added to responses cut short by their deadline, with the candidates left without a score
+        """
+        return {"status": timeout_status, "missing": [candidate.get("candidateId") for candidate in missing]}
+
+    @staticmethod
+    def batch_job_data(bulk_data: BulkJobData, batch: list[dict]) -> JobData:
+        # Bulk candidates were already validated, batches only need to be sized for the model
+        return JobData.model_construct(job=bulk_data.job, jobDescription=bulk_data.jobDescription, candidates=batch)
+
+    @staticmethod
+    def plan_batches(candidates: list[dict], size: int = None) -> list[list[dict]]:
+        size = size or batch_size
+        if size > 0:
+            return split_in_batches(candidates, size)
+        return batch_planner.plan(candidates)
+
+    @staticmethod
+    async def astream_request(job_data: JobData, deadline: Deadline = None) -> AsyncIterator[dict]:
+        """
+        Yield each candidate score as soon as it is complete and valid, instead of waiting for the whole batch.
+        Cached scores go first, candidates missing from the streamed response are reattempted at the end.
+        When the deadline cuts it short, the last item is the timeout status with the candidates left
+        """
+        cached, pending = await Handler._asplit_pending(job_data)
+        for score in order_scores(job_data.candidates, list(cached.values())):
+            yield score
+        if not pending:
+            return
+
+        connector = Handler._get_connector()
+        prompt = get_prompt(Handler._pending_job(job_data, pending))
+        expected = {candidate_id(candidate): candidate for candidate in pending}
+        parser = CandidateStreamParser()
+        # Streamed (candidate, score) pairs, stored together once the response ends
+        streamed = []
+
+        if deadline is None or deadline.allows(0):
+            try:
+                async for chunk in Handler._astream_chunks(connector, prompt, deadline):
+                    for item in parser.feed(chunk):
+                        score = parse_score(item)
+                        candidate = expected.get(candidate_id(score)) if score is not None else None
+                        if candidate is None:
+                            continue
+                        del expected[candidate_id(score)]
+                        set_local_completion([candidate], [score])
+                        streamed.append((candidate, score))
+                        yield score
+            except Exception as e:
+                # Past the deadline the reattempt below stops right away and reports what is missing
+                if not isinstance(e, DeadlineExceeded) and (deadline is None or deadline.remaining()):
+                    raise e
+            finally:
+                if streamed:
+                    await Handler._astore_scores(job_data, [candidate for candidate, _ in streamed],
+                                                 {"candidates": [score for _, score in streamed]})
+
+        if not expected:
+            return
+
+        request = await ScoringRequest(job_data, list(expected.values()), is_retry=True,
+                                       deadline=deadline).arun(connector)
+        data = request.result()
+        await Handler._astore_scores(job_data, request.candidates, data)
+        for score in data["candidates"]:
+            yield score
+        if request.timed_out:
+            yield Handler.timeout_result(request.remaining)
+
+    @staticmethod
+    async def _astream_chunks(connector: Connector, prompt, deadline: Deadline = None) -> AsyncIterator[str]:
+        """
+        Model response chunks, with the deadline visible to the connector. The scope is only set while
+        a chunk is awaited, never across a yield to the caller
+        """
+        chunks = connector.astream(prompt).__aiter__()
+        while True:
+            with deadline_scope(deadline):
+                try:
+                    chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield chunk
+
+    @staticmethod
+    async def ahandle_bulk(bulk_data: BulkJobData, size: int = None, concurrency: int = None,
+                           deadline: Deadline = None) -> dict:
+        """
+        Score any amount of candidates in a single call. Candidates are split into batches sized by token budget
+        (or a fixed size) which run concurrently (bounded by concurrency), and scores are returned in input order
+        """
+        semaphore = asyncio.Semaphore(max(1, concurrency or batch_concurrency))
+
+        async def score_batch(batch: list[dict]) -> dict:
+            async with semaphore:
+                return await Handler.ahandle_request(Handler.batch_job_data(bulk_data, batch), deadline)
+
+        # Stored and pre-scored over the whole set, so only new or changed candidates are batched,
+        # from best to worst local match
+        scored, candidates = await Handler._asplit_pending(bulk_data)
+        batches = Handler.plan_batches(candidates, size)
+        results = await asyncio.gather(*(score_batch(batch) for batch in batches))
+
+        scores = [*scored.values(), *(score for data in results for score in data.get("candidates", []))]
+        data = {"candidates": order_scores(bulk_data.candidates, scores)}
+        timed_out = [result for result in results if result.get("status") == timeout_status]
+        if timed_out:
+            data.update(status=timeout_status, missing=[candidate_id for result in timed_out
+                                                        for candidate_id in result["missing"]])
+        return data
+
+    @staticmethod
+    async def ahandle_top_k(bulk_data: BulkJobData, k: int, size: int = None, concurrency: int = None,
+                            deadline: Deadline = None) -> dict:
+        """
+        Rank the best k candidates without scoring every one of them. Batches go to the model best local estimate
+        first, and no more batches are sent once the highest possible score left (local estimate plus margin)
+        can't enter the current top k. Returns the k best scores and the model calls saved
+        """
+        k = max(1, k)
+        limit = max(1, concurrency or batch_concurrency)
+        scored, pending = await Handler._asplit_pending(bulk_data)
+        # Pending candidates come sorted by local score, so the first of a batch has its highest bound
+        bounds = score_bounds(bulk_data.jobDescription, pending)
+        batches = Handler.plan_batches(pending, size or top_k_batch_size)
+        batch_starts = [0]
+        for batch in batches[:-1]:
+            batch_starts.append(batch_starts[-1] + len(batch))
+
+        scores = list(scored.values())
+        results = []
+        running: set[asyncio.Task] = set()
+        sent = 0
+
+        def can_enter_top_k(bound: float) -> bool:
+            totals = sorted((score_total(score) for score in scores), reverse=True)
+            return len(totals) < k or bound > totals[k - 1]
 
+        async def score_batch(batch: list[dict]) -> dict:
+            return await Handler.ahandle_request(Handler.batch_job_data(bulk_data, batch), deadline)
 
+        try:
+            stopped = False
+            while running or (sent < len(batches) and not stopped):
+                while not stopped and sent < len(batches) and len(running) < limit:
+                    if not can_enter_top_k(bounds[batch_starts[sent]]):
+                        stopped = True
+                        break
+                    running.add(asyncio.ensure_future(score_batch(batches[sent])))
+                    sent += 1
+                if running:
+                    done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        results.append(task.result())
+                        scores.extend(task.result().get("candidates", []))
+        finally:
+            for task in running:
+                task.cancel()
+
+        saved = len(batches) - sent
+        if saved:
+            metrics.increment("top_k_calls_saved", saved)
+        ranked = sorted(order_scores(bulk_data.candidates, scores), key=score_total, reverse=True)
+        data = {
+            "candidates": ranked[:k],
+            "modelCallsSaved": saved,
+            "candidatesSkipped": len(pending) - sum(len(batch) for batch in batches[:sent]),
+        }
+        timed_out = [result for result in results if result.get("status") == timeout_status]
+        if timed_out:
+            data.update(status=timeout_status, missing=[candidate_id for result in timed_out
+                                                        for candidate_id in result["missing"]])
         return data
+
+    @staticmethod
+    async def astream_bulk(job: str, job_description: str, candidates: AsyncIterable[dict],
+                           size: int = None, concurrency: int = None, deadline: Deadline = None) -> AsyncIterator[dict]:
+        """
+        Score candidates as they are read (like a file upload) and yield scores as each batch completes.
+        Only the batches in flight are kept in memory: the next batch is read once a slot is free.
+        When the deadline cuts batches short, the last item is the timeout status with the candidates left
+        """
+        limit = max(1, concurrency or batch_concurrency)
+        running: set[asyncio.Task] = set()
+        missing = []
+
+        async def score_batch(batch: list[dict]) -> dict:
+            job_data = JobData.model_construct(job=job, jobDescription=job_description, candidates=batch)
+            return await Handler.ahandle_request(job_data, deadline)
+
+        def batch_scores(task: asyncio.Task) -> list[dict]:
+            data = task.result()
+            if data.get("status") == timeout_status:
+                missing.extend(data["missing"])
+            return data.get("candidates", [])
+
+        try:
+            async for batch in Handler._abatches(candidates, size):
+                if len(running) >= limit:
+                    done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        for score in batch_scores(task):
+                            yield score
+                running.add(asyncio.ensure_future(score_batch(batch)))
+
+            while running:
+                done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    for score in batch_scores(task):
+                        yield score
+        finally:
+            for task in running:
+                task.cancel()
+
+        if missing:
+            yield {"status": timeout_status, "missing": missing}
+
+    @staticmethod
+    async def _abatches(candidates: AsyncIterable[dict], size: int = None) -> AsyncIterator[list[dict]]:
+        """
+        Group a candidate stream in batches, with a fixed size or the planner token budget
+        """
+        size = size or batch_size
+        batch = []
+        batch_tokens = 0
+        async for candidate in candidates:
+            tokens = batch_planner.candidate_tokens(candidate) if size <= 0 else 0
+            if batch:
+                input_budget, max_candidates = (float("inf"), size) if size > 0 else batch_planner.limits()
+                if batch_tokens + tokens > input_budget or len(batch) >= max_candidates:
+                    yield batch
+                    batch = []
+                    batch_tokens = 0
+            batch.append(candidate)
+            batch_tokens += tokens
+
+        if batch:
+            yield batch
+
+    @staticmethod
+    def _get_connector() -> Connector:
+        if model_routes:
+            return connector_pool.get(GeminiRouter, models=tuple(model_routes))
+        return connector_pool.get(GeminiConnector, model_name=gemini_model)
+
+    @staticmethod
+    def _split_pending(job_data: JobData | BulkJobData) -> tuple[dict[str, dict], list[dict]]:
+        """
+        Split candidates into the ones already scored (cached, or locally when they clearly don't match)
+        and the ones that need the model, in descending local score order
+        """
+        cached, pending = Handler._split_cached(job_data)
+        with metrics.timer("stage", stage="prescore"):
+            local, pending = prescore(job_data.jobDescription, pending)
+        if local:
+            metrics.increment("prescored_locally", len(local))
+        return {**cached, **local}, pending
+
+    @staticmethod
+    async def _asplit_pending(job_data: JobData | BulkJobData) -> tuple[dict[str, dict], list[dict]]:
+        """
+        Async version of _split_pending. Result store lookups and local scoring block,
+        so they run on a worker thread
+        """
+        return await asyncio.to_thread(Handler._split_pending, job_data)
+
+    @staticmethod
+    def _split_cached(job_data: JobData | BulkJobData) -> tuple[dict[str, dict], list[dict]]:
+        """
+        Split candidates into already scored ones (by candidateId, from the cache or the result store)
+        and the ones that still need the model. Repeated candidates are only sent once
+        """
+        cached = {}
+        pending = []
+        pending_keys = set()
+        for candidate in job_data.candidates:
+            key = score_key(job_data.jobDescription, candidate, score_version)
+            score = score_cache.get(key) if score_cache is not None else None
+            if score is not None:
+                metrics.increment("score_cache_hits")
+                cached[candidate_id(score)] = score
+            elif key not in pending_keys:
+                pending_keys.add(key)
+                pending.append(candidate)
+
+        if pending and result_store is not None:
+            # Persisted scores of unchanged candidates, warming the cache for the next requests
+            with metrics.timer("stage", stage="result_store"):
+                stored = result_store.get_many(job_data.jobDescription, pending, score_version)
+            if stored:
+                metrics.increment("result_store_hits", len(stored))
+                for candidate in pending:
+                    score = stored.get(candidate_id(candidate))
+                    if score is not None and score_cache is not None:
+                        score_cache.set(score_key(job_data.jobDescription, candidate, score_version), score)
+                cached.update(stored)
+                pending = [candidate for candidate in pending if candidate_id(candidate) not in stored]
+
+        return cached, pending
+
+    @staticmethod
+    def _split_matrix_pending(job_data: JobData) -> tuple[dict[str, JobData], dict[str, dict], list[dict]]:
+        """
+        Split a matrix request into a single job request per job, which cache scores the same as any other
+        request. Candidates missing a score for any of the jobs are sent to the model for all of them
+        """
+        job_datas = {job.jobId: job_data.model_copy(update={"jobDescription": job.jobDescription, "jobs": None})
+                     for job in job_data.jobs}
+        cached = {}
+        pending_ids = set()
+        for job_id, single_job in job_datas.items():
+            cached[job_id], missing = Handler._split_cached(single_job)
+            pending_ids.update(candidate_id(candidate) for candidate in missing)
+        pending = [candidate for candidate in job_data.candidates if candidate_id(candidate) in pending_ids]
+        return job_datas, cached, pending
+
+    @staticmethod
+    def _matrix_result(job_data: JobData, job_datas: dict[str, JobData], cached: dict[str, dict], start: float,
+                       request: ScoringRequest = None) -> dict:
+        jobs = {job_id: {"candidates": []} for job_id in job_datas}
+        result = request.result() if request is not None else {"jobs": []}
+        for item in result.pop("jobs"):
+            jobs[item["jobId"]] = {"candidates": item["candidates"]}
+            Handler._store_scores(job_datas[item["jobId"]], request.candidates, jobs[item["jobId"]])
+
+        cells = {(job_id, candidate_id): score for job_id, scores in cached.items()
+                 for candidate_id, score in scores.items()}
+        Handler._log_request(job_data, cells, start, request)
+        return {"jobs": [{"jobId": job_id, **Handler._merge_scores(job_datas[job_id], cached[job_id], data)}
+                         for job_id, data in jobs.items()], **result}
+
+    @staticmethod
+    def _log_request(job_data: JobData, cached: dict, start: float, request: ScoringRequest = None):
+        elapsed = time.perf_counter() - start
+        metrics.observe("score_request", elapsed)
+        log_event("score_request", candidates=len(job_data.candidates), cached=len(cached),
+                  attempts=request.attempts if request else 0, seconds=round(elapsed, 3))
+
+    @staticmethod
+    def _pending_job(job_data: JobData, pending: list[dict]) -> JobData:
+        if pending == job_data.candidates:
+            return job_data
+        return job_data.model_copy(update={"candidates": pending})
+
+    @staticmethod
+    def _store_scores(job_data: JobData, candidates: list[dict], data: dict):
+        scores = {candidate_id(score): score for score in data.get("candidates", [])}
+        scored = [(candidate, scores[candidate_id(candidate)]) for candidate in candidates
+                  if candidate_id(candidate) in scores]
+        if score_cache is not None:
+            for candidate, score in scored:
+                score_cache.set(score_key(job_data.jobDescription, candidate, score_version), score)
+        if result_store is not None:
+            result_store.set_many(job_data.jobDescription, scored, score_version)
+
+    @staticmethod
+    async def _astore_scores(job_data: JobData, candidates: list[dict], data: dict):
+        # Result store writes are blocking, so they run on a worker thread
+        await asyncio.to_thread(Handler._store_scores, job_data, candidates, data)
+
+    @staticmethod
+    def _merge_scores(job_data: JobData, cached: dict[str, dict], data: dict) -> dict:
+        """
+        Merge cached and model scores following the input candidate order. Model scores come in the
+        pre-scoring order, so they are always sorted back
+        """
+        scores = [*cached.values(), *data.get("candidates", [])]
+        return {**data, "candidates": order_scores(job_data.candidates, scores)}
@@ -0,0 +1,182 @@
+import codecs
+import csv
+import hashlib
+import json
+import re
+from datetime import date, datetime
+from typing import AsyncIterator
+
+# Same row format the app CsvDataProcessor reads: "|" separated entries, "Title at Institution (From to To)"
+entry_separator = "|"
+max_questions = 7
+date_formats = ("%b %Y", "%B %Y", "%m %Y", "%m/%Y", "%Y-%m", "%Y")
+date_pattern = re.compile(r"\(([^)]+)\)")
+at_pattern = re.compile(r"\bat\b", re.IGNORECASE)
+
+
+async def aiter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    Decode an uploaded byte stream into lines, keeping only the current incomplete line in memory
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer.rstrip("\r")
+
+
+def normalize_header(header: str) -> str:
+    # "Creation Time" -> "creationTime", same as the app normalizeHeaders
+    words = header.strip().lower().split()
+    return "".join([words[0], *(word[:1].upper() + word[1:] for word in words[1:])]) if words else ""
+
+
+async def aiter_csv_rows(lines: AsyncIterator[str]) -> AsyncIterator[dict]:
+    """
+    Parse CSV records as dicts keyed by normalized headers. Quoted values spanning several lines are
+    joined before parsing, so only one record is kept in memory
+    """
+    headers = None
+    record = []
+    async for line in lines:
+        record.append(line)
+        text = "\n".join(record)
+        if text.count('"') % 2:
+            # Quoted value continues on the next line
+            continue
+        record = []
+        if not text.strip():
+            continue
+
+        values = next(csv.reader([text]))
+        if headers is None:
+            headers = [normalize_header(header) for header in values]
+            continue
+        yield {header: (values[idx] or None) if idx < len(values) else None for idx, header in enumerate(headers)}
+
+
+def _js_string(value) -> str:
+    return "null" if value is None else str(value)
+
+
+def extract_date(entry: str) -> tuple[str | None, str | None, str]:
+    matches = date_pattern.findall(entry)
+    if not matches:
+        return None, None, entry.strip()
+
+    dates = matches[-1].split(" to ")
+    start, end = dates[0], dates[1] if len(dates) > 1 else None
+    clean = [None if value is None or value.strip() in ("", "N/A") else value for value in (start, end)]
+    return clean[0], clean[1], entry.replace(f"({matches[-1]})", "").strip()
+
+
+def extract_title_and_institution(text: str) -> tuple[str | None, str | None]:
+    match = at_pattern.search(text)
+    if match is None:
+        return None, None
+    title, institution = text[:match.start()].strip(), text[match.end():].strip()
+    return title or None, institution or None
+
+
+def _parse_month(value: str) -> date | None:
+    for date_format in date_formats:
+        try:
+            return datetime.strptime(value.strip(), date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def calculate_time_period(start: str | None, end: str | None) -> tuple[str | None, int | None]:
+    start_date = _parse_month(start) if start else None
+    if start_date is None:
+        return None, None
+    end_date = (_parse_month(end) if end else None) or date.today()
+
+    months = (end_date.year - start_date.year) * 12 + end_date.month - start_date.month
+    if months < 0:
+        return None, None
+    return f"{months // 12} years {months % 12} months", months
+
+
+def parse_education(value: str | None) -> list[dict]:
+    result = []
+    for entry in value.strip().split(entry_separator) if value else []:
+        start, end, text = extract_date(entry)
+        title, institution = extract_title_and_institution(text)
+        result.append({"institution": institution, "title": title, "startDate": start, "endDate": end})
+    return result
+
+
+def parse_experience(value: str | None) -> list[dict]:
+    result = []
+    for entry in value.strip().split(entry_separator) if value else []:
+        start, end, text = extract_date(entry)
+        title, institution = extract_title_and_institution(text)
+        total, months = calculate_time_period(start, end)
+        result.append({"institution": institution, "title": title, "startDate": start, "endDate": end,
+                       "totalExperience": total, "totalMonths": months})
+
+    # Only the longest of several current (no end date) experiences is kept
+    current = [item for item in result if item["endDate"] is None]
+    if len(current) > 1:
+        longest = max(current, key=lambda item: item["totalMonths"] or 0)
+        result = [item for item in result if item["endDate"] is not None or item is longest]
+    return result
+
+
+def parse_questions(row: dict) -> list[dict]:
+    return [{"question": row[f"question{idx}"], "answer": row.get(f"answer{idx}")}
+            for idx in range(1, max_questions + 1) if row.get(f"question{idx}")]
+
+
+def normalize_csv_row(row: dict) -> dict:
+    """
+    Normalize a CSV row into the candidate format the app sends, with the same candidateId
+    """
+    name = row.get("name")
+    identity = _js_string(name) + _js_string(row.get("creationTime"))
+    skills = row.get("skills")
+    return {
+        "candidateId": row.get("candidateId") or hashlib.md5(identity.encode("utf-8")).hexdigest(),
+        "candidateName": name,
+        "appliedAt": row.get("creationTime"),
+        "skills": [skill.strip() for skill in skills.split(entry_separator)] if skills else [],
+        "education": parse_education(row.get("educations")),
+        "experience": parse_experience(row.get("experiences")),
+        "disqualified": row.get("disqualified") == "Yes",
+        "questions": parse_questions(row),
+    }
+
+
+async def aiter_jsonl_candidates(lines: AsyncIterator[str]) -> AsyncIterator[dict]:
+    async for line in lines:
+        if not line.strip():
+            continue
+        candidate = json.loads(line)
+        if not isinstance(candidate, dict):
+            raise ValueError("Each JSONL line must be a candidate object")
+        if candidate.get("candidateId") is None:
+            candidate["candidateId"] = hashlib.md5(line.encode("utf-8")).hexdigest()
+        yield candidate
+
+
+async def aiter_candidates(chunks: AsyncIterator[bytes], file_format: str) -> AsyncIterator[dict]:
+    """
+    Stream candidates out of an uploaded CSV or JSONL file, one row at a time
+    """
+    lines = aiter_lines(chunks)
+    if file_format == "csv":
+        async for row in aiter_csv_rows(lines):
+            yield normalize_csv_row(row)
+    elif file_format == "jsonl":
+        async for candidate in aiter_jsonl_candidates(lines):
+            yield candidate
+    else:
+        raise ValueError(f"Unsupported format '{file_format}', use csv or jsonl")
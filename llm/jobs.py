@@ -0,0 +1,228 @@
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+from handler import Handler
+from schema.job_store import JobStore
+from schema.types import BulkJobData, JobData
+
+job_workers = int(os.getenv("JOB_WORKERS", "4"))
+job_store_backend = os.getenv("JOB_STORE_BACKEND", "memory")
+job_store_path = os.getenv("JOB_STORE_PATH", os.path.join(tempfile.gettempdir(), "jobs.db"))
+job_ttl = int(os.getenv("JOB_TTL", "3600"))
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+def _job_view(job: dict, results: dict[int, list[dict]]) -> dict:
+    # Batches are planned in input order, so joining them by index keeps candidates order
+    return {**job, "scored": sum(len(scores) for scores in results.values()),
+            "result": [score for idx in sorted(results) for score in results[idx]]}
+
+
+def _next_status(status: str, completed_batches: int, batches: int) -> str:
+    if status == FAILED:
+        return FAILED
+    return COMPLETED if completed_batches >= batches else RUNNING
+
+
+class MemoryJobStore(JobStore):
+    """
+    Keeps jobs in process. Finished jobs are dropped after ttl seconds
+    """
+
+    def __init__(self, ttl: int = job_ttl):
+        self.ttl = ttl
+        self._jobs: dict[str, dict] = {}
+        self._results: dict[str, dict[int, list[dict]]] = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float):
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job["status"] in (COMPLETED, FAILED) and now - job["updatedAt"] > self.ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+            del self._results[job_id]
+
+    def create(self, job_id: str, candidates: int, batches: int):
+        now = time.time()
+        with self._lock:
+            self._prune(now)
+            self._jobs[job_id] = {"jobId": job_id, "status": QUEUED, "candidates": candidates, "batches": batches,
+                                  "completedBatches": 0, "error": None, "createdAt": now, "updatedAt": now}
+            self._results[job_id] = {}
+
+    def add_batch_result(self, job_id: str, batch_index: int, scores: list[dict]):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            self._results[job_id][batch_index] = scores
+            job["completedBatches"] = len(self._results[job_id])
+            job["status"] = _next_status(job["status"], job["completedBatches"], job["batches"])
+            job["updatedAt"] = time.time()
+
+    def set_status(self, job_id: str, status: str, error: str | None = None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(status=status, error=error, updatedAt=time.time())
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return _job_view(dict(job), dict(self._results[job_id]))
+
+
+class SqliteJobStore(JobStore):
+    """
+    Keeps jobs on a local SQLite file, so progress can be read by every worker process using it.
+    Jobs left unfinished by a previous process are marked as failed, as their queued batches were lost
+    """
+
+    columns = ["jobId", "status", "candidates", "batches", "completedBatches", "error", "createdAt", "updatedAt"]
+
+    def __init__(self, path: str = job_store_path):
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, status TEXT NOT NULL, candidates INTEGER, "
+            "batches INTEGER, completed_batches INTEGER, error TEXT, created_at REAL, updated_at REAL)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS job_batches (job_id TEXT NOT NULL, batch_index INTEGER NOT NULL, "
+            "scores TEXT NOT NULL, PRIMARY KEY (job_id, batch_index))"
+        )
+        self._connection.execute(
+            "UPDATE jobs SET status = ?, error = ? WHERE status IN (?, ?)",
+            (FAILED, "Interrupted before finishing", QUEUED, RUNNING)
+        )
+        self._connection.commit()
+
+    def create(self, job_id: str, candidates: int, batches: int):
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO jobs VALUES (?, ?, ?, ?, 0, NULL, ?, ?)", (job_id, QUEUED, candidates, batches, now, now)
+            )
+            self._connection.commit()
+
+    def add_batch_result(self, job_id: str, batch_index: int, scores: list[dict]):
+        with self._lock:
+            row = self._connection.execute("SELECT status, batches FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            self._connection.execute("INSERT OR REPLACE INTO job_batches VALUES (?, ?, ?)",
+                                     (job_id, batch_index, json.dumps(scores)))
+            completed = self._connection.execute(
+                "SELECT COUNT(*) FROM job_batches WHERE job_id = ?", (job_id,)
+            ).fetchone()[0]
+            self._connection.execute(
+                "UPDATE jobs SET completed_batches = ?, status = ?, updated_at = ? WHERE job_id = ?",
+                (completed, _next_status(row[0], completed, row[1]), time.time(), job_id)
+            )
+            self._connection.commit()
+
+    def set_status(self, job_id: str, status: str, error: str | None = None):
+        with self._lock:
+            self._connection.execute("UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE job_id = ?",
+                                     (status, error, time.time(), job_id))
+            self._connection.commit()
+
+    def get(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT job_id, status, candidates, batches, completed_batches, error, created_at, updated_at "
+                "FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            batches = self._connection.execute(
+                "SELECT batch_index, scores FROM job_batches WHERE job_id = ?", (job_id,)
+            ).fetchall()
+        return _job_view(dict(zip(self.columns, row)), {idx: json.loads(scores) for idx, scores in batches})
+
+
+class JobQueue:
+    """
+    In process job queue. Submitted jobs are split into batches, which a bounded pool of workers scores
+    in submission order. Jobs keep running when the client disconnects, and their progress is kept on the store
+    """
+
+    def __init__(self, store: JobStore, workers: int = job_workers):
+        self.store = store
+        self.workers = max(1, workers)
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _ensure_workers(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Queue and workers belong to a single event loop
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._tasks = []
+
+        self._tasks = [task for task in self._tasks if not task.done()]
+        while len(self._tasks) < self.workers:
+            self._tasks.append(loop.create_task(self._work()))
+
+    async def submit(self, bulk_data: BulkJobData) -> str:
+        job_id = uuid.uuid4().hex
+        batches = Handler.plan_batches(bulk_data.candidates)
+        self.store.create(job_id, len(bulk_data.candidates), len(batches))
+
+        self._ensure_workers()
+        for idx, batch in enumerate(batches):
+            self._queue.put_nowait((job_id, idx, Handler.batch_job_data(bulk_data, batch)))
+
+        return job_id
+
+    async def _work(self):
+        while True:
+            job_id, batch_index, job_data = await self._queue.get()
+            try:
+                await self._score_batch(job_id, batch_index, job_data)
+            finally:
+                self._queue.task_done()
+
+    async def _score_batch(self, job_id: str, batch_index: int, job_data: JobData):
+        job = self.store.get(job_id)
+        if job is None or job["status"] == FAILED:
+            # Remaining batches of a failed job are skipped
+            return
+        if job["status"] == QUEUED:
+            self.store.set_status(job_id, RUNNING)
+
+        try:
+            data = await Handler.ahandle_request(job_data)
+            self.store.add_batch_result(job_id, batch_index, data.get("candidates", []))
+        except Exception as e:
+            self.store.set_status(job_id, FAILED, str(e))
+
+    async def join(self):
+        if self._queue is not None:
+            await self._queue.join()
+
+    def stats(self) -> dict:
+        return {"queuedBatches": self._queue.qsize() if self._queue else 0, "workers": self.workers}
+
+
+def create_job_store(backend: str = job_store_backend) -> JobStore:
+    if backend == "sqlite":
+        return SqliteJobStore()
+    return MemoryJobStore()
+
+
+job_queue = JobQueue(create_job_store())
@@ -0,0 +1,108 @@
+import json
+import os
+import re
+
+from metrics import metrics
+from stream_parser import CandidateStreamParser
+
+# Repair near valid model output instead of re-requesting it
+salvage_enabled = os.getenv("JSON_SALVAGE", "true").lower() == "true"
+
+# Everything the repair needs to look at. Text between tokens (whitespace, numbers, colons) is copied as is,
+# so the scan runs at regex speed instead of one Python step per character
+token_pattern = re.compile(r""""(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|[{}\[\],]|[A-Za-z_]+|["']""", re.DOTALL)
+unescaped_quote = re.compile(r'(?<!\\)"')
+python_literals = {"True": "true", "False": "false", "None": "null"}
+
+
+class SalvagedJson(dict):
+    """
+    Data recovered by salvage_json, so callers can tell it apart from a response that was valid as is
+    """
+
+
+def _double_quote(token: str) -> str:
+    # 'text' -> "text", as in the Python repr of the prompt examples
+    return '"' + unescaped_quote.sub(r'\\"', token[1:-1].replace("\\'", "'")) + '"'
+
+
+def repair_json(text: str, start: int = 0) -> tuple[str, bool]:
+    """
+    Repair the JSON value starting at start: single quoted strings, trailing commas and Python literals.
+    Stops at the end of the first balanced value. Returns the repaired text and whether the value was complete,
+    when it isn't (truncated response) the text holds everything received
+    """
+    pieces = []
+    depth = 0
+    pos = start
+    comma = -1
+    for match in token_pattern.finditer(text, start):
+        gap = text[pos:match.start()]
+        pieces.append(gap)
+        if gap and not gap.isspace():
+            comma = -1
+        token = match.group()
+        pos = match.end()
+
+        first = token[0]
+        if first in "\"'":
+            if len(token) == 1:
+                # String cut by the end of the response
+                pos = match.start()
+                break
+            pieces.append(token if first == '"' else _double_quote(token))
+        elif first in "{[":
+            depth += 1
+            pieces.append(token)
+        elif first in "}]":
+            if comma >= 0:
+                pieces[comma] = ""
+            depth -= 1
+            pieces.append(token)
+            if depth <= 0:
+                return "".join(pieces), True
+        elif first == ",":
+            pieces.append(token)
+            comma = len(pieces) - 1
+            continue
+        else:
+            pieces.append(python_literals.get(token, token))
+        comma = -1
+
+    pieces.append(text[pos:])
+    return "".join(pieces), False
+
+
+def _load(text: str) -> dict | None:
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+    if isinstance(data, list):
+        return {"candidates": data}
+    return data if isinstance(data, dict) else None
+
+
+def salvage_json(text: str) -> dict:
+    """
+    Recover scores from a response json.loads rejected. Takes the first balanced JSON value, ignoring any text
+    around it, and repairs it. When the response was cut short, every complete candidate object is kept.
+    Returns the recovered data as SalvagedJson, or an empty dict when nothing could be recovered
+    """
+    starts = [idx for idx in (text.find("{"), text.find("[")) if idx >= 0]
+    if not starts:
+        return {}
+
+    repaired, complete = repair_json(text, min(starts))
+    data = _load(repaired) if complete else None
+    if data is None:
+        if repaired.startswith("["):
+            repaired = '{"candidates": ' + repaired
+        candidates = CandidateStreamParser().feed(repaired)
+        data = {"candidates": candidates} if candidates else {}
+
+    if not data:
+        return {}
+    metrics.increment("salvaged_responses")
+    return SalvagedJson(data)
+
@@ -1,13 +1,39 @@
+import environment  # Loads .env before any module reads its settings
+import json
+import os
+
 from fastapi import FastAPI, Request
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 
+from admission import admission, Overloaded
+from batch_planner import batch_planner
+from connector_pool import connector_pool
+from deadline import Deadline, deadline_header, request_deadline
 from handler import Handler
-from schema.types import JobData
+from ingestion import aiter_candidates
+from jobs import job_queue
+from metrics import metrics
+from rate_limiter import model_rate_limiter
+from single_flight import request_flight
+from schema.types import JobData, BulkJobData
 from mangum import Mangum
 
+# Set up the model client while the Lambda init phase runs, instead of on the first request
+warmup_enabled = os.getenv("WARMUP", "false").lower() == "true"
+
 app = FastAPI()
 
+metrics.register_collector("connector_pool", connector_pool.stats)
+metrics.register_collector("rate_limiter", model_rate_limiter.stats)
+metrics.register_collector("batch_planner", batch_planner.stats)
+metrics.register_collector("job_queue", job_queue.stats)
+metrics.register_collector("single_flight", request_flight.stats)
+metrics.register_collector("admission", admission.stats)
+
+if warmup_enabled:
+    Handler.warm_up()
+
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(_, exc: RequestValidationError):
     errors = []
@@ -21,16 +47,149 @@ async def validation_exception_handler(_, exc: RequestValidationError):
         content={"errors": errors}
     )
 
+@app.exception_handler(Overloaded)
+async def overloaded_exception_handler(_, exc: Overloaded):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"error": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 # Endpoint
+def get_deadline(request: Request) -> Deadline | None:
+    # Taken before waiting for an admission slot, so the wait counts against it
+    return request_deadline(request.headers.get(deadline_header), request.scope.get("aws.context"))
+
 @app.post("/")
-async def test(job_data: JobData):
+async def test(job_data: JobData, request: Request):
+    deadline = get_deadline(request)
+    async with admission.slot():
+        try:
+            result = await Handler.ahandle_request(job_data, deadline)
+            return {"result": result }
+        except Exception as e:
+            return JSONResponse(
+                status_code=500,
+                content={"error": str(e)}
+            )
+
+@app.post("/bulk")
+async def bulk(bulk_data: BulkJobData, request: Request):
+    deadline = get_deadline(request)
+    async with admission.slot():
+        try:
+            result = await Handler.ahandle_bulk(bulk_data, deadline=deadline)
+            return {"result": result }
+        except Exception as e:
+            return JSONResponse(
+                status_code=500,
+                content={"error": str(e)}
+            )
+
+@app.post("/top")
+async def top(bulk_data: BulkJobData, request: Request, k: int = 10):
+    """
+    Best k candidates ranked by score, without scoring the ones that can't reach them
+    """
+    deadline = get_deadline(request)
+    async with admission.slot():
+        try:
+            result = await Handler.ahandle_top_k(bulk_data, k, deadline=deadline)
+            return {"result": result }
+        except Exception as e:
+            return JSONResponse(
+                status_code=500,
+                content={"error": str(e)}
+            )
+
+@app.post("/stream")
+async def stream(job_data: JobData, request: Request, format: str = "ndjson"):
+    """
+    Streams every candidate score once available, as NDJSON lines or Server-Sent Events (format=sse)
+    """
+    deadline = get_deadline(request)
+    if job_data.jobs:
+        return JSONResponse(
+            status_code=400,
+            content={"error": "Scores of several jobs can't be streamed, use POST / instead"}
+        )
+    is_sse = format == "sse"
+
+    def serialize(data: dict) -> str:
+        return f"data: {json.dumps(data)}\n\n" if is_sse else json.dumps(data) + "\n"
+
+    async def generate():
+        try:
+            async for score in Handler.astream_request(job_data, deadline):
+                yield serialize(score)
+        except Exception as e:
+            yield serialize({"error": str(e)})
+
+    await admission.acquire()
+    return AdmittedStreamingResponse(generate(), media_type="text/event-stream" if is_sse else "application/x-ndjson")
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    Holds the admission slot acquired by its route until the response ends. The slot is released even when
+    the client disconnects before the body is ever iterated
+    """
+
+    async def __call__(self, scope, receive, send):
+        async with admission.held():
+            await super().__call__(scope, receive, send)
+
+class UploadStreamingResponse(AdmittedStreamingResponse):
+    """
+    The request body is read while the response streams, so receive is left to the body reader
+    (it also gets the client disconnect), instead of being shared with a disconnect listener
+    """
+
+    async def __call__(self, scope, receive, send):
+        async with admission.held():
+            await self.stream_response(send)
+
+@app.post("/upload")
+async def upload(request: Request, jobDescription: str, job: str = "", format: str = None):
+    """
+    Scores a streamed CSV or JSONL candidates file, returning each score as an NDJSON line once its batch completes
+    """
+    file_format = format or ("jsonl" if "json" in request.headers.get("content-type", "") else "csv")
+    deadline = get_deadline(request)
+
+    async def generate():
+        try:
+            candidates = aiter_candidates(request.stream(), file_format)
+            async for score in Handler.astream_bulk(job, jobDescription, candidates, deadline=deadline):
+                yield json.dumps(score) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    await admission.acquire()
+    return UploadStreamingResponse(generate(), media_type="application/x-ndjson")
+
+@app.post("/jobs", status_code=202)
+async def submit_job(bulk_data: BulkJobData):
     try:
-        result = Handler.handle_request(job_data)
-        return {"result": result }
+        job_id = await job_queue.submit(bulk_data)
+        return {"jobId": job_id}
     except Exception as e:
         return JSONResponse(
             status_code=500,
             content={"error": str(e)}
         )
 
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = job_queue.store.get(job_id)
+    if job is None:
+        return JSONResponse(
+            status_code=404,
+            content={"error": "Job not found"}
+        )
+    return job
+
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 handler = Mangum(app)
\ No newline at end of file
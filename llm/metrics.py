@@ -0,0 +1,116 @@
+import json
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+# Seconds. Covers everything from local parsing to a full model request with backoff
+histogram_buckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+def _snake_case(name: str) -> str:
+    return re.sub(r"(?<!^)(?=[A-Z])", "_", name).lower()
+
+
+class Metrics:
+    """
+    In process counters and histograms, rendered in Prometheus text format. Recording is a dict update
+    under a lock, so it can be used on the hot path
+    """
+
+    def __init__(self, prefix: str = "llm"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._counters: dict[str, dict[tuple, float]] = {}
+        self._histograms: dict[str, dict[tuple, list]] = {}
+        self._collectors: dict[str, Callable[[], dict]] = {}
+
+    def increment(self, name: str, value: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            # Bucket counts, then sum and count
+            values = series.setdefault(key, [0] * len(histogram_buckets) + [0.0, 0])
+            for idx, bound in enumerate(histogram_buckets):
+                if seconds <= bound:
+                    values[idx] += 1
+            values[-2] += seconds
+            values[-1] += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def register_collector(self, name: str, collector: Callable[[], dict]):
+        """
+        Register a function returning numeric stats, exposed as gauges named after the collector
+        """
+        self._collectors[name] = collector
+
+    def get_counter(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_label_key(labels), 0)
+
+    def get_count(self, name: str, **labels) -> int:
+        with self._lock:
+            values = self._histograms.get(name, {}).get(_label_key(labels))
+            return values[-1] if values else 0
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                metric = f"{self.prefix}_{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.extend(f"{metric}{_format_labels(labels)} {value}" for labels, value in series.items())
+
+            for name, series in sorted(self._histograms.items()):
+                metric = f"{self.prefix}_{name}_seconds"
+                lines.append(f"# TYPE {metric} histogram")
+                for labels, values in series.items():
+                    for idx, bound in enumerate(histogram_buckets):
+                        lines.append(f"{metric}_bucket{_format_labels(labels, (('le', bound),))} {values[idx]}")
+                    lines.append(f"{metric}_bucket{_format_labels(labels, (('le', '+Inf'),))} {values[-1]}")
+                    lines.append(f"{metric}_sum{_format_labels(labels)} {round(values[-2], 6)}")
+                    lines.append(f"{metric}_count{_format_labels(labels)} {values[-1]}")
+
+        for collector_name, collector in sorted(self._collectors.items()):
+            for key, value in collector().items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    metric = f"{self.prefix}_{collector_name}_{_snake_case(key)}"
+                    lines.append(f"# TYPE {metric} gauge")
+                    lines.append(f"{metric} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+def log_event(event: str, **fields):
+    """
+    Structured log line, one JSON object per event
+    """
+    print(json.dumps({"event": event, "timestamp": round(time.time(), 3), **fields}, default=str))
+
+
+metrics = Metrics()
@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import os
+import re
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# numpy is imported on first use, as it is a large part of the service cold start. Requests answered from
+# cached or stored scores never need it, and WARMUP loads it during the Lambda init phase
+
+# Candidates whose local total (0-100) is below this are scored locally, without a model call. 0 disables it
+prescore_threshold = float(os.getenv("PRESCORE_THRESHOLD", "0"))
+# Replace the model completion with the one computed from the form
+local_completion_enabled = os.getenv("LOCAL_COMPLETION", "false").lower() == "true"
+# Points the model total can be above the local total, bounding the score of candidates not sent yet
+top_k_margin = float(os.getenv("TOP_K_MARGIN", "20"))
+
+# Share of the job description keywords a candidate section needs to get the full area score
+full_match_coverage = 0.5
+form_sections = ("candidateName", "experience", "education", "skills")
+local_highlights = "Scored locally: low overlap between the candidate profile and the job description"
+
+token_pattern = re.compile(r"[a-z0-9][a-z0-9+#]*")
+stop_words = frozenset((
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have", "in", "is", "it", "of", "on",
+    "or", "our", "the", "to", "we", "will", "with", "you", "your", "yrs", "years", "year", "no", "not", "job",
+    "title", "department", "tags", "required", "experience", "requirements", "defined", "headline",
+))
+
+
+def extract_keywords(text: str) -> set[str]:
+    return {token for token in token_pattern.findall(text.lower()) if len(token) > 1 and token not in stop_words}
+
+
+def _text(value) -> str:
+    if isinstance(value, dict):
+        return " ".join(_text(item) for item in value.values())
+    if isinstance(value, list):
+        return " ".join(_text(item) for item in value)
+    return value if isinstance(value, str) else ""
+
+
+def _section_texts(candidate: dict) -> tuple[str, str, str]:
+    """
+    Text compared against the job description for experience (with skills), education and question answers
+    """
+    experience = [{key: item.get(key) for key in ("title", "institution")} for item in candidate.get("experience") or []
+                  if isinstance(item, dict)]
+    answers = [item.get("answer") for item in candidate.get("questions") or [] if isinstance(item, dict)]
+    return (
+        _text([experience, candidate.get("skills") or [], candidate.get("jobApplied")]),
+        _text(candidate.get("education") or []),
+        _text(answers),
+    )
+
+
+def completion_scores(candidates: list[dict]) -> np.ndarray:
+    """
+    Completion (0-10) as the share of the form that was filled: each main section plus each question asked
+    """
+    import numpy as np
+
+    filled = np.array([[bool(candidate.get(section)) for section in form_sections] for candidate in candidates],
+                      dtype=float).reshape(len(candidates), len(form_sections))
+    questions = [[item for item in candidate.get("questions") or [] if isinstance(item, dict)]
+                 for candidate in candidates]
+    asked = np.array([len(items) for items in questions], dtype=float)
+    answered = np.array([sum(1 for item in items if item.get("answer")) for items in questions], dtype=float)
+
+    return np.rint(10 * (filled.sum(axis=1) + answered) / (len(form_sections) + asked)).astype(int)
+
+
+def area_scores(job_description: str, candidates: list[dict]) -> np.ndarray:
+    """
+    Local estimate of every scoring area, as a (candidates x 4) matrix following the model areas order:
+    overallExperience (0-50), education (0-20), questionAlignment (0-20) and completion (0-10).
+    Each area is the share of job description keywords found on its candidate section
+    """
+    import numpy as np
+
+    keywords = {keyword: idx for idx, keyword in enumerate(sorted(extract_keywords(job_description)))}
+    maximums = np.array([50, 20, 20], dtype=float)
+    # Coordinates of every (candidate, section, keyword) match, set on the match tensor at once
+    rows, sections, columns = [], [], []
+    for row, candidate in enumerate(candidates):
+        for section, text in enumerate(_section_texts(candidate)):
+            found = [keywords[token] for token in extract_keywords(text) if token in keywords]
+            rows.extend([row] * len(found))
+            sections.extend([section] * len(found))
+            columns.extend(found)
+    matches = np.zeros((len(candidates), len(maximums), max(1, len(keywords))), dtype=bool)
+    matches[rows, sections, columns] = True
+
+    coverage = matches.sum(axis=2) / max(1, len(keywords))
+    relevance = np.minimum(1.0, coverage / full_match_coverage)
+    return np.column_stack((np.rint(relevance * maximums).astype(int), completion_scores(candidates)))
+
+
+def prescore(job_description: str, candidates: list[dict],
+             threshold: float = None) -> tuple[dict[str, dict], list[dict]]:
+    """
+    Score candidates locally. Returns the scores of the candidates below threshold, which don't need the model,
+    and the remaining candidates in descending local score order, so the best matches are scored first
+    """
+    import numpy as np
+
+    threshold = prescore_threshold if threshold is None else threshold
+    if not candidates:
+        return {}, []
+    if not extract_keywords(job_description):
+        # Nothing to compare with, every candidate goes to the model
+        threshold = 0
+
+    scores = area_scores(job_description, candidates)
+    totals = scores.sum(axis=1)
+    local = {}
+    pending = []
+    for idx in np.argsort(-totals, kind="stable"):
+        candidate = candidates[idx]
+        if totals[idx] < threshold:
+            experience, education, questions, completion = (int(value) for value in scores[idx])
+            local[str(candidate.get("candidateId"))] = {
+                "candidateId": candidate.get("candidateId"),
+                "overallExperience": experience,
+                "education": education,
+                "questionAlignment": questions,
+                "completion": completion,
+                "highlights": local_highlights,
+            }
+        else:
+            pending.append(candidate)
+
+    return local, pending
+
+
+def score_bounds(job_description: str, candidates: list[dict], margin: float = None) -> np.ndarray:
+    """
+    Highest total (0-100) the model is expected to give each candidate: its local total plus margin.
+    Without job description keywords nothing can be estimated, so every bound is 100
+    """
+    import numpy as np
+
+    margin = top_k_margin if margin is None else margin
+    if not extract_keywords(job_description):
+        return np.full(len(candidates), 100.0)
+    if not candidates:
+        return np.zeros(0)
+    return np.minimum(100.0, area_scores(job_description, candidates).sum(axis=1) + margin)
+
+
+def set_local_completion(candidates: list[dict], scores: list[dict]) -> list[dict]:
+    """
+    Replace the model completion of each score with the one computed from its candidate form
+    """
+    if not local_completion_enabled or not scores:
+        return scores
+
+    # Compared as text, the model answers integer ids as strings
+    by_id = {str(candidate.get("candidateId")): candidate for candidate in candidates}
+    scored = [score for score in scores if str(score.get("candidateId")) in by_id]
+    completions = completion_scores([by_id[str(score["candidateId"])] for score in scored])
+    for score, completion in zip(scored, completions):
+        score["completion"] = int(completion)
+    return scores
@@ -0,0 +1,139 @@
+import asyncio
+import os
+import threading
+import time
+
+from deadline import DeadlineExceeded, check_deadline
+
+requests_per_minute = int(os.getenv("MODEL_RPM", "0"))
+tokens_per_minute = int(os.getenv("MODEL_TPM", "0"))
+rate_burst = float(os.getenv("MODEL_RATE_BURST", "0.25"))
+
+
+class TokenBucket:
+    """
+    Bucket refilled at rate_per_minute. Reservations can take the level below zero, so every later
+    reservation waits behind the previous ones (first come, first served)
+    """
+
+    def __init__(self, rate_per_minute: int, burst: float = rate_burst):
+        self.rate = rate_per_minute / 60
+        self.capacity = max(1.0, rate_per_minute * burst)
+        self.level = self.capacity
+        self.updated_at = time.monotonic()
+
+    def reserve(self, amount: float, now: float) -> float:
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        # A single request bigger than the bucket would never fit otherwise
+        self.level -= min(amount, self.capacity)
+        return max(0.0, -self.level / self.rate)
+
+    def refund(self, amount: float):
+        self.level = min(self.capacity, self.level + min(amount, self.capacity))
+
+    def drain(self, now: float):
+        self.reserve(0, now)
+        self.level = min(self.level, 0.0)
+
+
+class RateLimiter:
+    """
+    Proactive limiter shared by every connector of the process. Model calls reserve a request and
+    their estimated tokens before being sent, waiting just enough to stay under RPM and TPM quotas.
+    A limit of 0 disables that bucket
+    """
+
+    def __init__(self, rpm: int = requests_per_minute, tpm: int = tokens_per_minute, burst: float = rate_burst):
+        self._requests = TokenBucket(rpm, burst) if rpm > 0 else None
+        self._tokens = TokenBucket(tpm, burst) if tpm > 0 else None
+        self._lock = threading.Lock()
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.waits = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def reserve(self, tokens: int) -> float:
+        """
+        Reserve capacity for a request of the given tokens. Returns the seconds to wait before sending it
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            if self._requests is not None:
+                wait = max(wait, self._requests.reserve(1, now))
+            if self._tokens is not None:
+                wait = max(wait, self._tokens.reserve(tokens, now))
+
+            if wait > 0:
+                self.waits += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+                self.queue_depth += 1
+                self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+            return wait
+
+    def cancel(self, tokens: int):
+        """
+        Hand back a reservation that won't be used, so the next requests don't wait for it
+        """
+        with self._lock:
+            if self._requests is not None:
+                self._requests.refund(1)
+            if self._tokens is not None:
+                self._tokens.refund(tokens)
+
+    def _release(self):
+        with self._lock:
+            self.queue_depth -= 1
+
+    def _check_deadline(self, wait: float, tokens: int):
+        # A request that can't be sent before its deadline doesn't queue nor spend quota
+        try:
+            check_deadline(wait, "rate limiter wait")
+        except DeadlineExceeded:
+            self.cancel(tokens)
+            raise
+
+    def acquire(self, tokens: int):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            try:
+                self._check_deadline(wait, tokens)
+                time.sleep(wait)
+            finally:
+                self._release()
+
+    async def aacquire(self, tokens: int):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            try:
+                self._check_deadline(wait, tokens)
+                await asyncio.sleep(wait)
+            finally:
+                self._release()
+
+    def drain(self):
+        """
+        Called when the provider reports an exhausted quota, so every queued call waits for a refill
+        instead of finding out on its own
+        """
+        with self._lock:
+            now = time.monotonic()
+            for bucket in (self._requests, self._tokens):
+                if bucket is not None:
+                    bucket.drain(now)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queueDepth": self.queue_depth,
+                "maxQueueDepth": self.max_queue_depth,
+                "waits": self.waits,
+                "totalWaitSeconds": round(self.total_wait, 3),
+                "maxWaitSeconds": round(self.max_wait, 3),
+            }
+
+
+model_rate_limiter = RateLimiter()
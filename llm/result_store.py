@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from schema.result_store import ResultStore
+from score_cache import normalize_job_description
+
+result_store_backend = os.getenv("RESULT_STORE_BACKEND", "sqlite")
+result_store_path = os.getenv("RESULT_STORE_PATH", os.path.join(tempfile.gettempdir(), "results.db"))
+result_store_ttl = int(os.getenv("RESULT_STORE_TTL", str(30 * 86400)))
+result_store_size = int(os.getenv("RESULT_STORE_SIZE", "100000"))
+# SQLite limits the amount of bound parameters per statement
+lookup_chunk_size = 500
+
+
+def job_description_hash(job_description: str) -> str:
+    return hashlib.sha256(normalize_job_description(job_description).encode("utf-8")).hexdigest()
+
+
+def candidate_content_hash(candidate: dict) -> str:
+    return hashlib.sha256(json.dumps(candidate, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class SqliteResultStore(ResultStore):
+    """
+    Persistent scores per job description and candidate. Rows are indexed by
+    (jd_hash, candidate_id, candidate_content_hash, prompt_version), so a candidate that edited
+    its profile (new content hash) is a miss and only that candidate is scored again.
+    Scores older than ttl are misses, and the oldest rows are pruned over max_size
+    """
+
+    def __init__(self, path: str = result_store_path, max_size: int = result_store_size, ttl: int = result_store_ttl):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS results (jd_hash TEXT NOT NULL, candidate_id TEXT NOT NULL, "
+            "candidate_content_hash TEXT NOT NULL, prompt_version TEXT NOT NULL, score TEXT NOT NULL, "
+            "updated_at REAL NOT NULL, "
+            "PRIMARY KEY (jd_hash, candidate_id, candidate_content_hash, prompt_version))"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS results_updated ON results (updated_at)")
+        self._connection.commit()
+
+    def get_many(self, job_description: str, candidates: list[dict], version: str) -> dict[str, dict]:
+        jd_hash = job_description_hash(job_description)
+        expected = {(str(candidate.get("candidateId")), candidate_content_hash(candidate)) for candidate in candidates}
+        candidate_ids = sorted({candidate_id for candidate_id, _ in expected})
+        oldest = time.time() - self.ttl
+
+        rows = []
+        with self._lock:
+            for start in range(0, len(candidate_ids), lookup_chunk_size):
+                chunk = candidate_ids[start:start + lookup_chunk_size]
+                rows += self._connection.execute(
+                    "SELECT candidate_id, candidate_content_hash, score FROM results "
+                    "WHERE jd_hash = ? AND prompt_version = ? AND updated_at >= ? "
+                    f"AND candidate_id IN ({', '.join('?' * len(chunk))})",
+                    (jd_hash, version, oldest, *chunk)
+                ).fetchall()
+
+        scores = {}
+        for candidate_id, content_hash, score in rows:
+            if (candidate_id, content_hash) in expected:
+                score = json.loads(score)
+                scores[candidate_id] = score
+        return scores
+
+    def set_many(self, job_description: str, scored: list[tuple[dict, dict]], version: str):
+        if not scored:
+            return
+        jd_hash = job_description_hash(job_description)
+        now = time.time()
+        # One row per candidate, the last score wins
+        rows = list({str(candidate.get("candidateId")): (
+            jd_hash, str(candidate.get("candidateId")), candidate_content_hash(candidate), version, json.dumps(score), now
+        ) for candidate, score in scored}.values())
+        with self._lock:
+            # Scores of previous versions of the candidate profiles are replaced
+            self._connection.executemany(
+                "DELETE FROM results WHERE jd_hash = ? AND candidate_id = ? AND prompt_version = ?",
+                [(jd_hash, candidate_id, version) for _, candidate_id, _, _, _, _ in rows]
+            )
+            self._connection.executemany("INSERT INTO results VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._connection.execute("DELETE FROM results WHERE updated_at < ?", (now - self.ttl,))
+            self._connection.execute(
+                "DELETE FROM results WHERE rowid IN ("
+                "SELECT rowid FROM results ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,)
+            )
+            self._connection.commit()
+
+
+def create_result_store(backend: str = result_store_backend) -> ResultStore | None:
+    if backend == "sqlite":
+        return SqliteResultStore()
+    return None
+
+
+result_store = create_result_store()
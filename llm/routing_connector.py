@@ -0,0 +1,208 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from typing import AsyncIterator, Callable
+
+from deadline import check_deadline
+from gemini_connector import GeminiConnector, gemini_endpoint, max_retries
+from metrics import metrics
+from schema.connector import Connector
+from schema.types import Prompt
+
+# Comma separated models routed by GeminiRouter. Empty keeps a single GeminiConnector
+model_routes = [model.strip() for model in os.getenv("MODEL_ROUTES", "").split(",") if model.strip()]
+hedge_min_samples = int(os.getenv("HEDGE_MIN_SAMPLES", "10"))
+route_window = 50
+error_decay = 0.2
+default_latency = 1.0
+
+
+def is_valid_response(text: str) -> bool:
+    # Only whether it looks like a complete JSON object. ScoringRequest parses (and salvages) it once afterwards
+    start = text.find("{")
+    return start >= 0 and text.rfind("}") > start
+
+
+class Route:
+    """
+    A routed connector and its recent latency and error rate
+    """
+
+    def __init__(self, connector: Connector, name: str = None):
+        self.connector = connector
+        self.name = name or getattr(connector, "model_name", type(connector).__name__)
+        self.latencies: deque[float] = deque(maxlen=route_window)
+        self.error_rate = 0.0
+        self.requests = 0
+
+    def record(self, seconds: float, failed: bool = False):
+        self.latencies.append(seconds)
+        self.error_rate += error_decay * ((1.0 if failed else 0.0) - self.error_rate)
+        self.requests += 1
+
+    def p95(self) -> float | None:
+        """
+        Observed 95th percentile latency, or None until there are enough samples to trust it
+        """
+        if len(self.latencies) < hedge_min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def weight(self) -> float:
+        latency = sum(self.latencies) / len(self.latencies) if self.latencies else default_latency
+        return max(0.05, 1.0 - self.error_rate) / max(latency, 0.01)
+
+    def stats(self) -> dict:
+        return {"name": self.name, "requests": self.requests, "errorRate": round(self.error_rate, 3),
+                "p95": self.p95(), "weight": round(self.weight(), 3)}
+
+
+class RoutingConnector(Connector):
+    """
+    Spreads requests over several connectors. The primary route is picked by weight (faster and less failing
+    routes are picked more often). When the primary takes longer than its observed p95 latency, a hedge request
+    is sent to the next route, and rate limited or failing routes fail over to the next one.
+    The first valid response is returned and the request still running is cancelled.
+    Hedging is only worth it when routes stop their request on cancel, so it can be turned off
+    """
+
+    def __init__(self, routes: list[Connector], is_valid: Callable[[str], bool] = is_valid_response,
+                 retries: int = max_retries, seed: int = None, hedge: bool = True):
+        if not routes:
+            raise ValueError("At least one route is required")
+        self.routes = [route if isinstance(route, Route) else Route(route) for route in routes]
+        self.is_valid = is_valid
+        self.retries = retries
+        self.hedge = hedge
+        self._random = random.Random(seed)
+
+    def is_healthy(self) -> bool:
+        return any(route.connector.is_healthy() for route in self.routes)
+
+    def _ordered_routes(self) -> list[Route]:
+        """
+        Primary route picked by weight, then the rest from best to worst as hedge and failover candidates
+        """
+        routes = [route for route in self.routes if route.connector.is_healthy()] or list(self.routes)
+        primary = self._random.choices(routes, weights=[route.weight() for route in routes])[0]
+        rest = sorted((route for route in routes if route is not primary), key=Route.weight, reverse=True)
+        return [primary, *rest]
+
+    async def _call(self, route: Route, prompt: Prompt) -> str:
+        start = time.perf_counter()
+        try:
+            text = await route.connector.arequest(prompt)
+        except asyncio.CancelledError:
+            # Lost the race, still a lower bound of how slow the route is
+            route.record(time.perf_counter() - start)
+            raise
+        except Exception:
+            route.record(time.perf_counter() - start, failed=True)
+            raise
+        route.record(time.perf_counter() - start, failed=not self.is_valid(text))
+        return text
+
+    async def _race(self, prompt: Prompt) -> str:
+        waiting = self._ordered_routes()
+        running: dict[asyncio.Future, Route] = {}
+        errors: list[Exception] = []
+        invalid_text = None
+
+        def launch():
+            route = waiting.pop(0)
+            running[asyncio.ensure_future(self._call(route, prompt))] = route
+
+        launch()
+        hedge_after = next(iter(running.values())).p95() if self.hedge else None
+        try:
+            while running:
+                timeout = hedge_after if waiting else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    metrics.increment("hedged_requests")
+                    hedge_after = None
+                    launch()
+                    continue
+
+                for task in done:
+                    route = running.pop(task)
+                    try:
+                        text = task.result()
+                    except Exception as e:
+                        errors.append(e)
+                        continue
+                    if self.is_valid(text):
+                        metrics.increment("route_responses", route=route.name)
+                        return text
+                    invalid_text = text
+
+                if not running and waiting:
+                    metrics.increment("route_failovers")
+                    launch()
+        finally:
+            for task in running:
+                task.cancel()
+
+        # No valid response. An invalid one is still returned so the caller can reattempt the prompt
+        if invalid_text is not None:
+            return invalid_text
+        rate_limits = [e for e in errors if GeminiConnector._is_rate_limit(e)]
+        if len(rate_limits) == len(errors):
+            raise rate_limits[-1]
+        raise [e for e in errors if not GeminiConnector._is_rate_limit(e)][-1]
+
+    def request(self, prompt: Prompt) -> str:
+        return asyncio.run(self.arequest(prompt))
+
+    async def arequest(self, prompt: Prompt) -> str:
+        # Every route rate limited, back off before trying them again
+        attempt = 0
+        while attempt < int(self.retries):
+            try:
+                return await self._race(prompt)
+            except Exception as e:
+                if not GeminiConnector._is_rate_limit(e):
+                    raise e
+                attempt += 1
+                wait_time = GeminiConnector._backoff_time(attempt)
+                check_deadline(wait_time, "rate limit backoff")
+                await asyncio.sleep(wait_time)
+
+        raise Exception("Maximum retry attempts reached. Could not complete the request.")
+
+    async def astream(self, prompt: Prompt) -> AsyncIterator[str]:
+        """
+        Streams are not hedged, as chunks can't be taken back. Routes fail over until the first chunk
+        """
+        error = None
+        for route in self._ordered_routes():
+            received = False
+            try:
+                async for chunk in route.connector.astream(prompt):
+                    received = True
+                    yield chunk
+                return
+            except Exception as e:
+                if received:
+                    raise e
+                metrics.increment("route_failovers")
+                error = e
+        raise error
+
+    def stats(self) -> dict:
+        return {"routes": [route.stats() for route in self.routes]}
+
+
+class GeminiRouter(RoutingConnector):
+    """
+    Routes over several Gemini models. Routes don't back off by themselves, so rate limits fail over right away.
+    Custom endpoints (REST transport) run requests on worker threads, which keep going when the losing hedge
+    is cancelled, so they are not hedged
+    """
+
+    def __init__(self, models: tuple[str, ...] = tuple(model_routes)):
+        super().__init__([GeminiConnector(model_name=model, retry_rate_limits=False) for model in models],
+                         hedge=not gemini_endpoint)
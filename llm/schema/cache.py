@@ -0,0 +1,18 @@
+from abc import ABC, abstractmethod
+
+
+class ScoreCache(ABC):
+
+    @abstractmethod
+    def get(self, key: str) -> dict | None:
+        """
+        Return the cached candidate score for the given key, or None when missing or expired
+        """
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: dict):
+        """
+        Store a candidate score under the given key
+        """
+        pass
@@ -1,4 +1,6 @@
+import asyncio
 from abc import ABC, abstractmethod
+from typing import AsyncIterator
 
 from schema.types import Prompt
 
@@ -11,4 +13,24 @@ class Connector(ABC):
         Send a request to the connector with the given prompt.
         Each connector can handle Prompt normalization as needed
         """
-        pass
\ No newline at end of file
+        pass
+
+    async def arequest(self, prompt: Prompt) -> str:
+        """
+        Async version of request, so the event loop is not blocked while waiting for the model.
+        Connectors without an async client run request on a worker thread by default
+        """
+        return await asyncio.to_thread(self.request, prompt)
+
+    async def astream(self, prompt: Prompt) -> AsyncIterator[str]:
+        """
+        Stream the response text in chunks as the model generates it.
+        Connectors without streaming support yield the whole response as a single chunk
+        """
+        yield await self.arequest(prompt)
+
+    def is_healthy(self) -> bool:
+        """
+        Whether this connector can keep being reused. Pooled connectors that report unhealthy are replaced
+        """
+        return True
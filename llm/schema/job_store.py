@@ -0,0 +1,29 @@
+from abc import ABC, abstractmethod
+
+
+class JobStore(ABC):
+
+    @abstractmethod
+    def create(self, job_id: str, candidates: int, batches: int):
+        """
+        Register a new queued job
+        """
+        pass
+
+    @abstractmethod
+    def add_batch_result(self, job_id: str, batch_index: int, scores: list[dict]):
+        """
+        Save the scores of a finished batch. Job is completed once every batch has a result
+        """
+        pass
+
+    @abstractmethod
+    def set_status(self, job_id: str, status: str, error: str | None = None):
+        pass
+
+    @abstractmethod
+    def get(self, job_id: str) -> dict | None:
+        """
+        Return job state, progress and the scores received so far (in input order), or None when missing
+        """
+        pass
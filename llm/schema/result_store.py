@@ -0,0 +1,19 @@
+from abc import ABC, abstractmethod
+
+
+class ResultStore(ABC):
+
+    @abstractmethod
+    def get_many(self, job_description: str, candidates: list[dict], version: str) -> dict[str, dict]:
+        """
+        Return the stored scores (by candidateId) of the given candidates whose content did not change
+        since they were scored for this job description and prompt version
+        """
+        pass
+
+    @abstractmethod
+    def set_many(self, job_description: str, scored: list[tuple[dict, dict]], version: str):
+        """
+        Store (candidate, score) pairs, replacing previous scores of the same candidates
+        """
+        pass
@@ -1,9 +1,90 @@
-from pydantic import BaseModel, conlist
+from pydantic import BaseModel, conlist, conint, model_validator
+
+class JobDescription(BaseModel):
+    jobId: str
+    jobDescription: str
 
 class JobData(BaseModel):
     job: str
-    jobDescription: str
+    jobDescription: str = ""
     candidates: conlist(dict, min_length=1, max_length=10)
+    # Several job descriptions scored against the same candidates on shared prompts, answered as a
+    # job x candidate matrix. jobDescription is not needed then
+    jobs: conlist(JobDescription, min_length=1, max_length=5) | None = None
+
+    @model_validator(mode="after")
+    def check_jobs(self):
+        if self.jobs is None and "jobDescription" not in self.model_fields_set:
+            raise ValueError("jobDescription is required unless jobs are given")
+        if self.jobs is not None and len({job.jobId for job in self.jobs}) < len(self.jobs):
+            raise ValueError("jobId must be unique")
+        return self
+
+    @property
+    def job_ids(self) -> list[str] | None:
+        return [job.jobId for job in self.jobs] if self.jobs else None
+
+class BulkJobData(BaseModel):
+    job: str
+    jobDescription: str
+    candidates: conlist(dict, min_length=1)
+
+class CandidateScore(BaseModel):
+    """
+    Score of a single candidate as answered by the model. Validator is compiled once with the class
+    """
+    candidateId: str | int
+    overallExperience: conint(ge=0, le=50)
+    education: conint(ge=0, le=20)
+    questionAlignment: conint(ge=0, le=20)
+    completion: conint(ge=0, le=10)
+    highlights: str
+
+class CandidateJobScore(CandidateScore):
+    """
+    Score of a candidate for one of the jobs of a matrix request
+    """
+    jobId: str
+
+# Response schema sent to the model on structured output mode. Ranges are enforced by CandidateScore
+score_response_schema = {
+    "type": "object",
+    "properties": {
+        "candidates": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "candidateId": {"type": "string"},
+                    "overallExperience": {"type": "integer", "description": "Score from 0 to 50"},
+                    "education": {"type": "integer", "description": "Score from 0 to 20"},
+                    "questionAlignment": {"type": "integer", "description": "Score from 0 to 20"},
+                    "completion": {"type": "integer", "description": "Score from 0 to 10"},
+                    "highlights": {"type": "string", "description": "Main highlights, max 40 words"},
+                },
+                "required": ["candidateId", "overallExperience", "education", "questionAlignment",
+                             "completion", "highlights"],
+            },
+        },
+    },
+    "required": ["candidates"],
+}
+
+# Matrix requests answer one item per (job, candidate) cell
+_score_item_schema = score_response_schema["properties"]["candidates"]["items"]
+score_matrix_response_schema = {
+    **score_response_schema,
+    "properties": {
+        "candidates": {
+            "type": "array",
+            "items": {
+                **_score_item_schema,
+                "properties": {"jobId": {"type": "string"}, **_score_item_schema["properties"]},
+                "required": ["jobId", *_score_item_schema["required"]],
+            },
+        },
+    },
+}
 
 class PromptExample:
     input: str
@@ -21,6 +102,9 @@ class Prompt:
     examples: list[str] = []
     full_prompt: str
     retry_text: str = ""
+    job_context: str | None = None
+    batch_data: str | None = None
+    response_schema: dict | None = None
 
     def set_retry_text(self, text: str):
         self.retry_text = text
@@ -49,6 +133,24 @@ class Prompt:
             return
         self.data = data
 
+    def set_job_data(self, job_context: str, batch_data: str):
+        """
+        Set data split into the part shared by every batch of a job and the part specific to this batch,
+        so connectors are able to cache the shared part
+        """
+        self.job_context = job_context
+        self.batch_data = batch_data
+        self.set_data(job_context + batch_data)
+
+    def set_response_schema(self, schema: dict):
+        """
+        Ask connectors supporting structured output to constrain the response to this schema
+        """
+        self.response_schema = schema
+
+    def get_static_content(self) -> list[str]:
+        return [self.role, self.instruction, self.context, *self.examples]
+
     def get_full_prompt(self):
         return (self.retry_text + self.role + "\n" + self.instruction + "\n" +
          self.context + "\n\nThese are some examples:\n\n" + "\n\n".join(
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from schema.cache import ScoreCache
+
+cache_backend = os.getenv("SCORE_CACHE_BACKEND", "memory")
+cache_size = int(os.getenv("SCORE_CACHE_SIZE", "5000"))
+cache_ttl = int(os.getenv("SCORE_CACHE_TTL", "86400"))
+cache_path = os.getenv("SCORE_CACHE_PATH", os.path.join(tempfile.gettempdir(), "score_cache.db"))
+
+
+def normalize_job_description(job_description: str) -> str:
+    return " ".join(job_description.split())
+
+
+def score_key(job_description: str, candidate: dict, version: str) -> str:
+    """
+    Content address of a (job description, candidate) pair for a given prompt/model version
+    """
+    payload = json.dumps({
+        "jobDescription": normalize_job_description(job_description),
+        "candidate": candidate,
+        "version": version,
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryScoreCache(ScoreCache):
+    """
+    In process LRU cache with TTL expiration
+    """
+
+    def __init__(self, max_size: int = cache_size, ttl: int = cache_ttl):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: dict):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+class SqliteScoreCache(ScoreCache):
+    """
+    On disk cache, shared by every worker using the same file. Least recently read rows are pruned over max_size
+    """
+
+    def __init__(self, path: str = cache_path, max_size: int = cache_size, ttl: int = cache_ttl):
+        self.max_size = max(1, max_size)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS score_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS score_cache_accessed ON score_cache (accessed_at)")
+        self._connection.commit()
+
+    def get(self, key: str) -> dict | None:
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value, stored_at FROM score_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._connection.execute("DELETE FROM score_cache WHERE key = ?", (key,))
+                self._connection.commit()
+                return None
+            self._connection.execute("UPDATE score_cache SET accessed_at = ? WHERE key = ?", (now, key))
+            self._connection.commit()
+            return json.loads(row[0])
+
+    def set(self, key: str, value: dict):
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO score_cache (key, value, stored_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now, now)
+            )
+            self._connection.execute(
+                "DELETE FROM score_cache WHERE key IN ("
+                "SELECT key FROM score_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_size,)
+            )
+            self._connection.commit()
+
+
+def create_score_cache(backend: str = cache_backend) -> ScoreCache | None:
+    if backend == "memory":
+        return MemoryScoreCache()
+    if backend == "sqlite":
+        return SqliteScoreCache()
+    return None
+
+
+score_cache = create_score_cache()
@@ -0,0 +1,70 @@
+import asyncio
+import hashlib
+import json
+import os
+from typing import Awaitable, Callable
+
+from metrics import metrics
+from score_cache import normalize_job_description
+
+coalescing_enabled = os.getenv("REQUEST_COALESCING", "true").lower() == "true"
+
+
+def flight_key(job_description: str, candidates: list[dict], version: str) -> str:
+    """
+    Identity of a scoring request: normalized job description plus a hash of the candidate set.
+    Candidate order is ignored, as scores are ordered by each caller afterwards
+    """
+    candidate_hashes = sorted(
+        hashlib.sha256(json.dumps(candidate, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        for candidate in candidates
+    )
+    payload = json.dumps({
+        "jobDescription": normalize_job_description(job_description),
+        "candidates": candidate_hashes,
+        "version": version,
+    })
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls sharing a key, so they wait on a single execution and all receive its
+    result (or error). The shared call runs on its own task, so a caller that disconnects doesn't cancel
+    it for the others
+    """
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.hits = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable], timeout: float = None):
+        """
+        Run fn, or wait for the call already running with the same key. Waiting longer than timeout raises
+        asyncio.TimeoutError for this caller only, the shared call keeps running for the others
+        """
+        task = self._calls.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.hits += 1
+            metrics.increment("coalesced_requests")
+
+        return await asyncio.wait_for(asyncio.shield(task), timeout)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Mark the error as retrieved, in case every caller went away before it finished
+            task.exception()
+
+    def stats(self) -> dict:
+        return {"inFlight": len(self._calls), "leaders": self.leaders, "hits": self.hits}
+
+
+request_flight = SingleFlight()
@@ -0,0 +1,92 @@
+import json
+
+
+class CandidateStreamParser:
+    """
+    Incremental parser for model responses shaped as {"candidates": [...]}. Text can be fed in chunks of
+    any size, and every candidate object is returned as soon as its closing brace is received.
+    Each character is scanned only once
+    """
+
+    def __init__(self, key: str = "candidates"):
+        self._key = f'"{key}"'
+        self._buffer = ""
+        self._pos = 0
+        self._in_array = False
+        self._done = False
+        self._depth = 0
+        self._start = -1
+        self._in_string = False
+        self._escaped = False
+
+    @property
+    def done(self) -> bool:
+        return self._done
+
+    def feed(self, text: str) -> list[dict]:
+        if self._done:
+            return []
+        self._buffer += text
+
+        if not self._in_array and not self._find_array():
+            return []
+
+        items = []
+        buffer = self._buffer
+        while self._pos < len(buffer):
+            char = buffer[self._pos]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0 and char == "{":
+                    self._start = self._pos
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0:
+                    # End of the candidates array
+                    self._done = True
+                    break
+                self._depth -= 1
+                if self._depth == 0 and self._start >= 0:
+                    item = self._load(buffer[self._start:self._pos + 1])
+                    if item is not None:
+                        items.append(item)
+                    self._start = -1
+            self._pos += 1
+
+        self._trim()
+        return items
+
+    def _find_array(self) -> bool:
+        key_idx = self._buffer.find(self._key)
+        if key_idx < 0:
+            return False
+        array_idx = self._buffer.find("[", key_idx + len(self._key))
+        if array_idx < 0:
+            return False
+        self._in_array = True
+        self._pos = array_idx + 1
+        return True
+
+    def _trim(self):
+        # Only the candidate being received needs to be kept
+        keep_from = self._start if self._start >= 0 else self._pos
+        self._buffer = self._buffer[keep_from:]
+        self._pos -= keep_from
+        if self._start >= 0:
+            self._start = 0
+
+    @staticmethod
+    def _load(text: str) -> dict | None:
+        try:
+            item = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+        return item if isinstance(item, dict) else None
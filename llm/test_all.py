@@ -1,15 +1,75 @@
 from data.prompt_defaults import prompt_instruction, prompt_role
-from schema.types import Prompt, JobData
+from schema.connector import Connector
+from schema.types import Prompt, JobData, BulkJobData
 import unittest
-from unittest.mock import MagicMock, patch
+from unittest.mock import MagicMock, AsyncMock, patch
+from admission import AdmissionController, CircuitBreaker, Overloaded
+from batch_planner import BatchPlanner
+from benchmark.fake_connector import FakeConnector
+from benchmark.fake_model import extract_candidate_ids, fake_scores_response
+from connector_pool import ConnectorPool
+from deadline import Deadline, DeadlineExceeded, check_deadline, deadline_scope, request_deadline
+from metrics import Metrics
+from rate_limiter import RateLimiter
+from routing_connector import Route, RoutingConnector, is_valid_response
+from compaction import compact_candidates, compact_value, measure_compaction
+from prescoring import area_scores, completion_scores, prescore, score_bounds, set_local_completion
+from stream_parser import CandidateStreamParser
+from result_store import SqliteResultStore
+from score_cache import MemoryScoreCache, SqliteScoreCache, score_key
+from single_flight import SingleFlight, flight_key
 from gemini_connector import GeminiConnector
 from handler import Handler
-from utils import get_json_from_response, verify_parsing, get_prompt
+from ingestion import aiter_candidates, normalize_csv_row, parse_experience
+from jobs import JobQueue, MemoryJobStore, SqliteJobStore
+from json_salvage import SalvagedJson, salvage_json
+from utils import get_json_from_response, verify_parsing, get_prompt, split_valid_scores, parse_score
+
+
+def setUpModule():
+    # Scores persisted by previous runs must not answer the tests requests
+    patcher = patch("handler.result_store", None)
+    patcher.start()
+    unittest.addModuleCleanup(patcher.stop)
 
 
 class ResourceExhausted(Exception):
     pass
 
+
+def make_job_data(candidate_ids=("1",), job_description="Test job description") -> JobData:
+    return JobData(
+        job="",
+        jobDescription=job_description,
+        candidates=[{"candidateId": candidate_id} for candidate_id in candidate_ids]
+    )
+
+
+def call_lambda(body: dict) -> dict:
+    import asyncio
+    import main
+    from benchmark.startup import make_event
+
+    # Mangum runs on the current event loop, which async test cases leave unset
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        return main.handler(make_event(body), None)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def make_score(candidate_id: str, experience=30) -> dict:
+    return {
+        "candidateId": candidate_id,
+        "overallExperience": experience,
+        "education": 10,
+        "questionAlignment": 10,
+        "completion": 5,
+        "highlights": "Highlights"
+    }
+
 class TestGeminiConnector(unittest.TestCase):
     @patch("gemini_connector.genai")
     def test_request_successful(self, mock_genai):
@@ -86,15 +146,1045 @@ class TestGeminiConnector(unittest.TestCase):
         self.assertIn("Maximum retry attempts", str(cm.exception))
         self.assertEqual(mock_model.generate_content.call_count, 1)
 
+    @patch("gemini_connector.genai")
+    @patch("gemini_connector.time.sleep")
+    def test_request_skips_backoff_past_the_deadline(self, mock_sleep, mock_genai):
+        import gemini_connector
+        gemini_connector.ResourceExhausted = ResourceExhausted
+        mock_model = MagicMock()
+        mock_model.generate_content.side_effect = ResourceExhausted("Rate limit")
+        mock_genai.GenerativeModel.return_value = mock_model
+        prompt = Prompt()
+        prompt.set_role("Assistant", "answering questions")
+        prompt.set_instruction("provide the requested information clearly")
+        prompt.set_context("you are an AI model trained on various domains")
+        prompt.set_data("Please explain deadlines.")
+
+        with deadline_scope(Deadline(4)), self.assertRaises(DeadlineExceeded):
+            GeminiConnector().request(prompt)
+
+        mock_sleep.assert_not_called()
+        self.assertLessEqual(mock_model.generate_content.call_args.kwargs["request_options"]["timeout"], 4)
+
+
+class TestGeminiContextCache(unittest.TestCase):
+    @staticmethod
+    def make_prompt(job_description="Test job description", candidate_ids=("1",)) -> Prompt:
+        return get_prompt(make_job_data(candidate_ids, job_description))
+
+    @patch("gemini_connector.context_cache_enabled", True)
+    @patch("gemini_connector.genai")
+    def test_request_sends_only_batch_data_with_context_cache(self, mock_genai):
+        cached_model = MagicMock()
+        cached_model.generate_content.return_value.text = "LLM output"
+        mock_genai.GenerativeModel.from_cached_content.return_value = cached_model
+
+        registry = Metrics()
+        connector = GeminiConnector()
+        with patch("gemini_connector.metrics", registry):
+            connector.request(self.make_prompt(candidate_ids=("1",)))
+            connector.request(self.make_prompt(candidate_ids=("2",)))
+
+        mock_genai.caching.CachedContent.create.assert_called_once()
+        cached_text = mock_genai.caching.CachedContent.create.call_args.kwargs["contents"][0]
+        self.assertIn("Test job description", cached_text)
+        sent = cached_model.generate_content.call_args.kwargs["contents"]
+        self.assertEqual(len(sent), 1)
+        self.assertIn('"candidateId":"2"', sent[0])
+        self.assertNotIn("Test job description", sent[0])
+        self.assertGreater(registry.get_counter("context_cache_saved_tokens"), 0)
+
+    @patch("gemini_connector.context_cache_enabled", True)
+    @patch("gemini_connector.genai")
+    def test_request_falls_back_to_full_prompt_when_cache_fails(self, mock_genai):
+        mock_genai.caching.CachedContent.create.side_effect = ValueError("Cached content is too small")
+        mock_genai.GenerativeModel.return_value.generate_content.return_value.text = "LLM output"
+
+        registry = Metrics()
+        connector = GeminiConnector()
+        with patch("gemini_connector.metrics", registry):
+            result = connector.request(self.make_prompt())
+            connector.request(self.make_prompt())
+
+        self.assertEqual(result, "LLM output")
+        mock_genai.caching.CachedContent.create.assert_called_once()
+        sent = mock_genai.GenerativeModel.return_value.generate_content.call_args.kwargs["contents"]
+        self.assertTrue(any("Test job description" in part for part in sent if part))
+        self.assertEqual(registry.get_counter("context_cache_saved_tokens"), 0)
+
+
+class TestGeminiStructuredOutput(unittest.TestCase):
+    @patch("gemini_connector.genai")
+    def test_request_sends_response_schema(self, mock_genai):
+        from schema.types import score_response_schema
+        mock_model = MagicMock()
+        mock_model.generate_content.return_value.text = "{}"
+        mock_genai.GenerativeModel.return_value = mock_model
+
+        with patch("utils.structured_output_enabled", True):
+            prompt = get_prompt(make_job_data())
+        GeminiConnector().request(prompt)
+
+        generation_config = mock_model.generate_content.call_args.kwargs["generation_config"]
+        self.assertEqual(generation_config["response_mime_type"], "application/json")
+        self.assertIs(generation_config["response_schema"], score_response_schema)
+
+    @patch("gemini_connector.genai")
+    def test_request_without_structured_output(self, mock_genai):
+        mock_model = MagicMock()
+        mock_model.generate_content.return_value.text = "{}"
+        mock_genai.GenerativeModel.return_value = mock_model
+
+        with patch("utils.structured_output_enabled", False):
+            prompt = get_prompt(make_job_data())
+        GeminiConnector().request(prompt)
+
+        self.assertIsNone(mock_model.generate_content.call_args.kwargs["generation_config"])
+
+
+class TestGeminiConnectorAsync(unittest.IsolatedAsyncioTestCase):
+    @patch("gemini_connector.asyncio.sleep", new_callable=AsyncMock)
+    @patch("gemini_connector.genai")
+    async def test_arequest_with_retries_and_success(self, mock_genai, mock_sleep):
+        mock_model = MagicMock()
+
+        response = MagicMock()
+        response.text = "Recovered output"
+
+        mock_model.generate_content_async = AsyncMock(side_effect=[
+            ResourceExhausted("Rate limit"),
+            response
+        ])
+        mock_genai.GenerativeModel.return_value = mock_model
+
+        prompt = Prompt()
+        prompt.set_role("Assistant", "answering questions")
+        prompt.set_instruction("provide the requested information clearly")
+        prompt.set_context("you are an AI model trained on various domains")
+        prompt.set_data("Please explain retry handling.")
+
+        import gemini_connector
+        gemini_connector.ResourceExhausted = ResourceExhausted
+
+        connector = GeminiConnector()
+        result = await connector.arequest(prompt)
+
+        self.assertEqual(result, "Recovered output")
+        self.assertEqual(mock_model.generate_content_async.call_count, 2)
+        mock_sleep.assert_awaited_once_with(3)
+        mock_model.generate_content.assert_not_called()
+
+
+class RouteConnector(Connector):
+    def __init__(self, name: str, delay: float = 0, error: Exception = None):
+        self.model_name = name
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.cancelled = False
+
+    def request(self, prompt):
+        raise NotImplementedError
+
+    async def arequest(self, prompt):
+        import asyncio
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        if self.error is not None:
+            raise self.error
+        return '{"candidates": [{"candidateId": "%s"}]}' % self.model_name
+
+
+class TestRoutingConnector(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patcher = patch("gemini_connector.ResourceExhausted", ResourceExhausted)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def make_router(*connectors: RouteConnector) -> RoutingConnector:
+        router = RoutingConnector(list(connectors), retries=2)
+        # Always pick the first route as primary
+        router._random = MagicMock(choices=lambda routes, weights: [routes[0]])
+        return router
+
+    async def test_hedges_slow_primary_and_cancels_loser(self):
+        slow = RouteConnector("slow", delay=1)
+        fast = RouteConnector("fast", delay=0)
+        router = self.make_router(slow, fast)
+        for _ in range(10):
+            router.routes[0].record(0.01)
+
+        import asyncio
+        result = await router.arequest(Prompt())
+        await asyncio.sleep(0)
+
+        self.assertIn("fast", result)
+        self.assertTrue(slow.cancelled)
+        self.assertEqual(fast.calls, 1)
+
+    async def test_does_not_hedge_when_disabled(self):
+        slow = RouteConnector("slow", delay=0.05)
+        fast = RouteConnector("fast", delay=0)
+        router = self.make_router(slow, fast)
+        router.hedge = False
+        for _ in range(10):
+            router.routes[0].record(0.01)
+
+        result = await router.arequest(Prompt())
+
+        self.assertIn("slow", result)
+        self.assertEqual(fast.calls, 0)
+
+    def test_is_valid_response_does_not_parse(self):
+        registry = Metrics()
+        with patch("json_salvage.metrics", registry):
+            self.assertTrue(is_valid_response('Sure: {"candidates": [{"candidateId": "1",}]}'))
+            self.assertFalse(is_valid_response('{"candidates": [{"candidateId": "1"'))
+
+        self.assertEqual(registry.get_counter("salvaged_responses"), 0)
+
+    async def test_fails_over_on_resource_exhausted(self):
+        limited = RouteConnector("limited", error=ResourceExhausted("Rate limit"))
+        backup = RouteConnector("backup")
+        router = self.make_router(limited, backup)
+
+        result = await router.arequest(Prompt())
+
+        self.assertIn("backup", result)
+        self.assertGreater(router.routes[0].error_rate, 0)
+
+    @patch("routing_connector.GeminiConnector._backoff_time", return_value=0)
+    async def test_backs_off_when_every_route_is_rate_limited(self, mock_backoff):
+        router = self.make_router(RouteConnector("a", error=ResourceExhausted("Rate limit")),
+                                  RouteConnector("b", error=ResourceExhausted("Rate limit")))
+
+        with self.assertRaises(Exception) as cm:
+            await router.arequest(Prompt())
+
+        self.assertIn("Maximum retry attempts", str(cm.exception))
+        self.assertEqual(mock_backoff.call_count, 2)
+
+    async def test_other_errors_are_raised(self):
+        router = self.make_router(RouteConnector("a", error=ValueError("Broken")))
+
+        with self.assertRaises(ValueError):
+            await router.arequest(Prompt())
+
+    def test_weight_prefers_fast_and_reliable_routes(self):
+        fast, slow, failing = Route(RouteConnector("fast")), Route(RouteConnector("slow")), Route(RouteConnector("x"))
+        for _ in range(10):
+            fast.record(0.1)
+            slow.record(1.0)
+            failing.record(0.1, failed=True)
+
+        self.assertGreater(fast.weight(), slow.weight())
+        self.assertGreater(fast.weight(), failing.weight())
+        self.assertAlmostEqual(slow.p95(), 1.0)
+
+    @patch("gemini_connector.genai")
+    def test_routed_gemini_connector_does_not_back_off(self, mock_genai):
+        mock_genai.GenerativeModel.return_value.generate_content.side_effect = ResourceExhausted("Rate limit")
+        connector = GeminiConnector(retry_rate_limits=False)
+
+        with patch("gemini_connector.time.sleep") as mock_sleep, self.assertRaises(ResourceExhausted):
+            connector.request(get_prompt(make_job_data()))
+
+        mock_sleep.assert_not_called()
+        self.assertTrue(connector.is_healthy())
+
+
+class TestHandlerAsync(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        cache_patcher = patch("handler.score_cache", MemoryScoreCache())
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+
+    @patch("handler.get_json_from_response")
+    @patch("handler.get_prompt")
+    @patch("handler.GeminiConnector")
+    async def test_ahandle_request_retries_then_succeeds(
+        self, mock_connector_class, mock_get_prompt, mock_get_json
+    ):
+        mock_connector = MagicMock()
+        mock_connector.arequest = AsyncMock(side_effect=["bad", "good"])
+        mock_connector_class.return_value = mock_connector
+
+        mock_prompt = MagicMock()
+        mock_get_prompt.return_value = mock_prompt
+
+        mock_get_json.side_effect = [{}, {"candidates": [make_score("1")]}]
+
+        job_data = make_job_data()
+        result = await Handler.ahandle_request(job_data)
+
+        self.assertEqual(result, {"candidates": [make_score("1")]})
+        self.assertEqual(mock_connector.arequest.await_count, 2)
+        mock_connector.request.assert_not_called()
+        mock_prompt.set_retry_text.assert_called_once()
+
+    @patch("handler.GeminiConnector")
+    async def test_ahandle_request_matches_integer_ids_answered_as_strings(self, mock_connector_class):
+        import json
+        import handler
+        mock_connector = MagicMock()
+        mock_connector.arequest = AsyncMock(return_value=json.dumps({"candidates": [make_score("42"), make_score("7")]}))
+        mock_connector_class.return_value = mock_connector
+        store = SqliteResultStore(":memory:")
+
+        with patch("handler.result_store", store):
+            result = await Handler.ahandle_request(make_job_data(candidate_ids=(7, 42)))
+            stored = store.get_many(make_job_data().jobDescription, [{"candidateId": 7}, {"candidateId": 42}],
+                                    handler.score_version)
+
+        self.assertEqual([score["candidateId"] for score in result["candidates"]], ["7", "42"])
+        self.assertEqual(mock_connector.arequest.await_count, 1)
+        self.assertEqual(set(stored), {"7", "42"})
+
+
+class TestSingleFlight(unittest.IsolatedAsyncioTestCase):
+    def test_flight_key_ignores_candidate_order_and_spacing(self):
+        candidates = [{"candidateId": "1"}, {"candidateId": "2"}]
+
+        self.assertEqual(flight_key("Ruby  developer", candidates, "1"),
+                         flight_key("Ruby developer\n", list(reversed(candidates)), "1"))
+        self.assertNotEqual(flight_key("Ruby developer", candidates, "1"),
+                            flight_key("Ruby developer", candidates[:1], "1"))
+
+    @patch("handler.GeminiConnector")
+    async def test_concurrent_identical_requests_share_model_call(self, mock_connector_class):
+        import asyncio
+        import json
+
+        async def slow_request(_):
+            await asyncio.sleep(0.01)
+            return json.dumps({"candidates": [make_score("1"), make_score("2")]})
+
+        mock_connector = MagicMock()
+        mock_connector.arequest = AsyncMock(side_effect=slow_request)
+        mock_connector_class.return_value = mock_connector
+        flight = SingleFlight()
+
+        with patch("handler.score_cache", None), patch("handler.request_flight", flight):
+            results = await asyncio.gather(
+                Handler.ahandle_request(make_job_data(["1", "2"])),
+                Handler.ahandle_request(make_job_data(["2", "1"], job_description="Test job  description")),
+            )
+
+        self.assertEqual(mock_connector.arequest.await_count, 1)
+        self.assertEqual([score["candidateId"] for score in results[0]["candidates"]], ["1", "2"])
+        self.assertEqual([score["candidateId"] for score in results[1]["candidates"]], ["2", "1"])
+        self.assertEqual(flight.stats(), {"inFlight": 0, "leaders": 1, "hits": 1})
+
+    @patch("handler.GeminiConnector")
+    async def test_follower_answers_by_its_own_deadline(self, mock_connector_class):
+        import asyncio
+        import json
+
+        async def slow_request(_):
+            await asyncio.sleep(0.3)
+            return json.dumps({"candidates": [make_score("1")]})
+
+        mock_connector_class.return_value.arequest = AsyncMock(side_effect=slow_request)
+
+        with patch("handler.score_cache", None), patch("handler.request_flight", SingleFlight()):
+            leader = asyncio.ensure_future(Handler.ahandle_request(make_job_data(["1"])))
+            await asyncio.sleep(0)
+            follower = await Handler.ahandle_request(make_job_data(["1"]), Deadline(0.05))
+            self.assertFalse(leader.done())
+            self.assertEqual(await leader, {"candidates": [make_score("1")]})
+
+        self.assertEqual(follower, {"candidates": [], "status": "timeout", "missing": ["1"]})
+
+    @patch("handler.GeminiConnector")
+    async def test_follower_scores_what_the_leader_deadline_left_out(self, mock_connector_class):
+        import asyncio
+        import json
+        import time
+        leader_deadline = Deadline(60)
+        responses = [json.dumps({"candidates": [make_score("1")]}), json.dumps({"candidates": [make_score("2")]})]
+
+        async def respond(_):
+            await asyncio.sleep(0.01)
+            # Leader deadline is reached while the first response arrives
+            leader_deadline.expires_at = time.monotonic()
+            return responses.pop(0)
+
+        mock_connector = mock_connector_class.return_value
+        mock_connector.arequest = AsyncMock(side_effect=respond)
+
+        with patch("handler.score_cache", None), patch("handler.request_flight", SingleFlight()):
+            leader, follower = await asyncio.gather(
+                Handler.ahandle_request(make_job_data(["1", "2"]), leader_deadline),
+                Handler.ahandle_request(make_job_data(["1", "2"])),
+            )
+
+        self.assertEqual(leader, {"candidates": [make_score("1")], "status": "timeout", "missing": ["2"]})
+        self.assertEqual(follower, {"candidates": [make_score("1"), make_score("2")]})
+        self.assertEqual(mock_connector.arequest.await_count, 2)
+
+    async def test_error_reaches_every_caller(self):
+        import asyncio
+
+        async def failing():
+            await asyncio.sleep(0.01)
+            raise Exception("Model unavailable")
+
+        flight = SingleFlight()
+        results = await asyncio.gather(flight.do("key", failing), flight.do("key", failing), return_exceptions=True)
+
+        self.assertEqual([str(result) for result in results], ["Model unavailable"] * 2)
+        self.assertEqual(flight.stats()["inFlight"], 0)
+
+
+class TestAdmission(unittest.IsolatedAsyncioTestCase):
+    async def test_queues_over_concurrency_and_rejects_over_queue_size(self):
+        import asyncio
+        controller = AdmissionController(concurrency=1, queue_size=1, queue_seconds=1)
+        await controller.acquire()
+        waiting = asyncio.ensure_future(controller.acquire())
+        await asyncio.sleep(0)
+
+        with self.assertRaises(Overloaded) as cm:
+            await controller.acquire()
+        self.assertEqual((cm.exception.status_code, cm.exception.retry_after), (429, 2))
+
+        controller.release(0.5)
+        await waiting
+        self.assertEqual(controller.stats()["inFlight"], 1)
+        controller.release(0.5)
+        self.assertEqual((controller.stats()["inFlight"], controller.stats()["queued"]), (0, 0))
+
+    async def test_rejects_requests_waiting_over_queue_time(self):
+        controller = AdmissionController(concurrency=1, queue_size=5, queue_seconds=0.01)
+        await controller.acquire()
+
+        with self.assertRaises(Overloaded) as cm:
+            await controller.acquire()
+
+        self.assertEqual(cm.exception.status_code, 503)
+        self.assertEqual(controller.stats()["queued"], 0)
+
+    def test_breaker_opens_on_sustained_rate_limits_and_probes_after_cooldown(self):
+        breaker = CircuitBreaker(threshold=2, cooldown=10)
+        breaker.record(True, now=0)
+        self.assertEqual(breaker.allow(now=1), 0)
+
+        breaker.record(True, now=1)
+        self.assertEqual(breaker.allow(now=2), 9)
+        self.assertEqual(breaker.allow(now=11), 0)
+        self.assertGreater(breaker.allow(now=11), 0)
+
+        breaker.record(False, now=12)
+        self.assertEqual(breaker.allow(now=12), 0)
+        self.assertFalse(breaker.is_open)
+
+    async def test_slot_counts_rate_limited_work_for_the_breaker(self):
+        controller = AdmissionController(breaker=CircuitBreaker(threshold=1, cooldown=30))
+
+        async with controller.slot():
+            GeminiConnector._backoff_time(1)
+
+        with self.assertRaises(Overloaded) as cm:
+            await controller.acquire()
+        self.assertEqual((cm.exception.status_code, cm.exception.retry_after), (503, 30))
+
+    async def test_breaker_only_counts_the_rate_limited_request(self):
+        import asyncio
+        controller = AdmissionController(breaker=CircuitBreaker(threshold=2, cooldown=30))
+        release = asyncio.Event()
+
+        async def use_slot(rate_limited: bool):
+            async with controller.slot():
+                await release.wait()
+                if rate_limited:
+                    await asyncio.to_thread(GeminiConnector._backoff_time, 1)
+
+        tasks = [asyncio.ensure_future(use_slot(idx == 0)) for idx in range(6)]
+        await asyncio.sleep(0)
+        release.set()
+        await asyncio.gather(*tasks)
+
+        self.assertEqual(controller.stats()["circuitOpen"], 0)
+        self.assertLessEqual(controller.breaker.consecutive, 1)
+
+    async def test_stream_slot_is_released_when_client_disconnects_before_the_body(self):
+        import main
+        controller = AdmissionController(concurrency=1)
+        await controller.acquire()
+
+        async def body():
+            yield "never sent"
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            raise OSError("Client went away")
+
+        with patch("main.admission", controller):
+            for response in (main.AdmittedStreamingResponse(body()), main.UploadStreamingResponse(body())):
+                with self.assertRaises(Exception):
+                    await response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send)
+                await controller.acquire()
+
+        self.assertEqual(controller.stats()["inFlight"], 1)
+
+    def test_rejections_return_retry_after_header(self):
+        controller = AdmissionController(concurrency=1, queue_size=0)
+        controller.in_flight = 1
+
+        with patch("main.admission", controller):
+            response = call_lambda({"job": "", "jobDescription": "Ruby", "candidates": [{"candidateId": "1"}]})
+
+        self.assertEqual(response["statusCode"], 429)
+        self.assertEqual(response["headers"]["retry-after"], "1")
+
+
+class TestRateLimiter(unittest.TestCase):
+    @patch("rate_limiter.time.monotonic", return_value=0)
+    def test_reserve_queues_requests_over_rpm(self, _):
+        limiter = RateLimiter(rpm=60, tpm=0, burst=2 / 60)
+
+        waits = [limiter.reserve(100) for _ in range(4)]
+
+        self.assertEqual(waits, [0.0, 0.0, 1.0, 2.0])
+        self.assertEqual(limiter.stats()["queueDepth"], 2)
+        self.assertEqual(limiter.stats()["maxWaitSeconds"], 2.0)
+
+    @patch("rate_limiter.time.monotonic", return_value=0)
+    def test_reserve_waits_for_token_budget(self, _):
+        limiter = RateLimiter(rpm=0, tpm=6000, burst=1 / 60)
+
+        self.assertEqual(limiter.reserve(100), 0.0)
+        self.assertEqual(limiter.reserve(50), 0.5)
+
+    @patch("rate_limiter.time.monotonic")
+    def test_drain_makes_next_request_wait(self, mock_monotonic):
+        mock_monotonic.return_value = 0
+        limiter = RateLimiter(rpm=60, tpm=0, burst=0.5)
+        limiter.drain()
+
+        mock_monotonic.return_value = 0.5
+        self.assertEqual(limiter.reserve(1), 0.5)
+
+    @patch("rate_limiter.time.sleep")
+    @patch("rate_limiter.time.monotonic", return_value=0)
+    def test_acquire_hands_back_reservation_that_outlasts_the_deadline(self, _, mock_sleep):
+        limiter = RateLimiter(rpm=60, tpm=0, burst=2 / 60)
+        limiter.reserve(100)
+        limiter.reserve(100)
+
+        with deadline_scope(Deadline(2)), self.assertRaises(DeadlineExceeded):
+            limiter.acquire(100)
+
+        mock_sleep.assert_not_called()
+        self.assertEqual(limiter.stats()["queueDepth"], 0)
+        self.assertEqual(limiter.reserve(100), 1.0)
+
+    def test_disabled_limiter_never_waits(self):
+        limiter = RateLimiter(rpm=0, tpm=0)
+
+        self.assertEqual([limiter.reserve(10 ** 6) for _ in range(100)], [0.0] * 100)
+
+
+class TestCandidateStreamParser(unittest.TestCase):
+    def test_feed_returns_candidates_as_soon_as_complete(self):
+        import json
+        response = "```json\n" + json.dumps({"candidates": [
+            {**make_score("1"), "highlights": "Uses {braces} and \"quotes\""},
+            make_score("2"),
+        ]}) + "\n```"
+        first_end = response.index("}", response.index("quotes")) + 1
+
+        parser = CandidateStreamParser()
+        first = [item for idx in range(0, first_end, 7) for item in parser.feed(response[idx:min(idx + 7, first_end)])]
+        rest = parser.feed(response[first_end:])
+
+        self.assertEqual([item["candidateId"] for item in first], ["1"])
+        self.assertEqual(rest, [make_score("2")])
+        self.assertTrue(parser.done)
+
+    def test_feed_skips_malformed_candidates(self):
+        parser = CandidateStreamParser()
+
+        items = parser.feed('{"candidates": [{"candidateId": "1",}, {"candidateId": "2"}')
+
+        self.assertEqual(items, [{"candidateId": "2"}])
+        self.assertFalse(parser.done)
+
+
+class TestJsonSalvage(unittest.TestCase):
+    def test_salvage_repairs_text_around_trailing_commas_and_single_quotes(self):
+        response = "Sure! Here are the scores: {'candidates': [{'candidateId': '1', 'disqualified': False, " \
+                   "'highlights': \"Led the team's {Rails} migration\",},],}\nLet me know if you need anything else"
+
+        self.assertEqual(salvage_json(response), {"candidates": [
+            {"candidateId": "1", "disqualified": False, "highlights": "Led the team's {Rails} migration"}]})
+
+    def test_salvage_recovers_complete_candidates_of_truncated_response(self):
+        import json
+        response = json.dumps({"candidates": [make_score("1"), make_score("2"), make_score("3")]})
+        cut = response[:response.rindex("Highlights") + 4]
+
+        self.assertEqual(salvage_json(cut), {"candidates": [make_score("1"), make_score("2")]})
+        self.assertEqual(salvage_json(json.dumps([make_score("1"), make_score("2")])[:-3]),
+                         {"candidates": [make_score("1")]})
+
+    def test_salvage_returns_empty_dict_when_nothing_is_recovered(self):
+        registry = Metrics()
+        with patch("json_salvage.metrics", registry):
+            self.assertEqual(salvage_json("this is not json"), {})
+            self.assertEqual(salvage_json('{"candidates": [{"candidateId": "1"'), {})
+
+        self.assertEqual(registry.get_counter("salvaged_responses"), 0)
+
+    def test_get_json_from_response_salvages_only_when_enabled(self):
+        response = '```json\n{"candidates": [{"candidateId": "1",}]}\n```'
+
+        self.assertEqual(get_json_from_response(response), {"candidates": [{"candidateId": "1"}]})
+        self.assertIsInstance(get_json_from_response(response), SalvagedJson)
+        self.assertNotIsInstance(get_json_from_response('{"candidates": []}'), SalvagedJson)
+        with patch("utils.salvage_enabled", False):
+            self.assertEqual(get_json_from_response(response), {})
+
+
+class TestHandlerStream(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        cache_patcher = patch("handler.score_cache", MemoryScoreCache())
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+
+    @patch("handler.get_prompt", wraps=get_prompt)
+    @patch("handler.GeminiConnector")
+    async def test_astream_request_yields_scores_and_reattempts_missing(self, mock_connector_class, mock_get_prompt):
+        import json
+        streamed = json.dumps({"candidates": [make_score("2"), make_score("1")]})
+
+        async def fake_stream(_):
+            for idx in range(0, len(streamed), 10):
+                yield streamed[idx:idx + 10]
+
+        mock_connector = MagicMock()
+        mock_connector.astream = fake_stream
+        mock_connector.arequest = AsyncMock(return_value=json.dumps({"candidates": [make_score("3")]}))
+        mock_connector_class.return_value = mock_connector
+
+        scores = [score async for score in Handler.astream_request(make_job_data(["1", "2", "3"]))]
+
+        self.assertEqual([score["candidateId"] for score in scores], ["2", "1", "3"])
+        self.assertEqual(mock_get_prompt.call_args.args[0].candidates, [{"candidateId": "3"}])
+        self.assertTrue(mock_connector.arequest.call_args.args[0].retry_text)
+
+    @patch("handler.GeminiConnector")
+    async def test_astream_request_reports_candidates_left_at_the_deadline(self, mock_connector_class):
+        import json
+        from deadline import current_deadline
+        deadline = Deadline(30)
+        streamed = json.dumps({"candidates": [make_score("1")]})[:-2]
+
+        async def fake_stream(_):
+            self.assertIs(current_deadline.get(), deadline)
+            yield streamed
+            raise DeadlineExceeded("Not enough time left for the rate limit backoff")
+
+        mock_connector = MagicMock()
+        mock_connector.astream = fake_stream
+        mock_connector.arequest = AsyncMock(side_effect=DeadlineExceeded("Not enough time left"))
+        mock_connector_class.return_value = mock_connector
+
+        items = [item async for item in Handler.astream_request(make_job_data(["1", "2"]), deadline)]
+
+        self.assertEqual(items, [make_score("1"), {"status": "timeout", "missing": ["2"]}])
+        self.assertIsNone(current_deadline.get())
+
+
+class TestCompaction(unittest.TestCase):
+    def test_compact_value_drops_empty_redundant_and_long_values(self):
+        candidate = {
+            "candidateId": "1",
+            "skills": [],
+            "education": [{"institution": "University", "startDate": None, "title": " "}],
+            "experience": [{"totalExperience": "1 year 2 months", "totalMonths": 14}],
+            "questions": [{"question": "Why?", "answer": "a" * 20}],
+        }
+
+        compacted = compact_value(candidate, text_limit=10)
+
+        self.assertEqual(compacted, {
+            "candidateId": "1",
+            "education": [{"institution": "University"}],
+            "experience": [{"totalMonths": 14}],
+            "questions": [{"question": "Why?", "answer": "a" * 10 + "..."}],
+        })
+
+    def test_compact_candidates_uses_short_keys_but_keeps_candidate_id(self):
+        import json
+        text = compact_candidates([{"candidateId": "1", "candidateName": "Name", "disqualified": False}],
+                                  use_short_keys=True)
+
+        self.assertNotIn(" ", text)
+        self.assertEqual(json.loads(text), [{"candidateId": "1", "name": "Name", "dq": False}])
+
+    def test_measure_compaction_reduces_example_candidates(self):
+        from data.prompt_defaults import example_candidate_1, example_candidate_2
+
+        report = measure_compaction([example_candidate_1, example_candidate_2])
+
+        self.assertLess(report["compactBytes"], report["originalBytes"])
+        self.assertLess(report["shortTokens"], report["compactTokens"])
+
+
+class TestPrescoring(unittest.TestCase):
+    def setUp(self):
+        from data.prompt_defaults import example_candidate_1, example_candidate_2
+        self.candidates = [example_candidate_2, example_candidate_1]
+
+    def test_completion_counts_filled_sections_and_answers(self):
+        self.assertEqual(completion_scores(self.candidates).tolist(), [7, 8])
+        self.assertEqual(completion_scores([{"candidateId": "1"}]).tolist(), [0])
+
+    def test_area_scores_follow_keyword_overlap(self):
+        scores = area_scores("Ruby on Rails developer", self.candidates)
+
+        self.assertEqual(scores.shape, (2, 4))
+        self.assertGreater(scores[1].sum(), scores[0].sum())
+        self.assertTrue(((scores[:, :3] >= 0) & (scores[:, :3] <= [50, 20, 20])).all())
+
+    def test_prescore_orders_candidates_and_scores_low_ones_locally(self):
+        local, pending = prescore("Ruby on Rails developer", self.candidates, threshold=0)
+        self.assertEqual(local, {})
+        self.assertEqual([c["candidateId"] for c in pending], ["123457894513", "32165467841"])
+
+        local, pending = prescore("Ruby on Rails developer", self.candidates, threshold=80)
+        self.assertEqual([c["candidateId"] for c in pending], ["123457894513"])
+        self.assertIsNotNone(parse_score(local["32165467841"]))
+
+    def test_prescore_sends_everything_without_keywords(self):
+        local, pending = prescore("The", self.candidates, threshold=100)
+
+        self.assertEqual((local, len(pending)), ({}, 2))
+
+    def test_score_bounds_add_margin_to_local_total(self):
+        bounds = score_bounds("Ruby on Rails developer", self.candidates, margin=20)
+        totals = area_scores("Ruby on Rails developer", self.candidates).sum(axis=1)
+
+        self.assertEqual(bounds.tolist(), [min(100, total + 20) for total in totals.tolist()])
+        self.assertEqual(score_bounds("The", self.candidates).tolist(), [100, 100])
+
+    def test_set_local_completion_replaces_model_value(self):
+        scores = [make_score("123457894513")]
+        with patch("prescoring.local_completion_enabled", True):
+            set_local_completion(self.candidates, scores)
+
+        self.assertEqual(scores[0]["completion"], 8)
+
+    @patch("handler.GeminiConnector")
+    def test_handler_skips_model_for_low_prescores(self, mock_connector_class):
+        import json
+        mock_connector = MagicMock()
+        mock_connector.request.return_value = json.dumps({"candidates": [make_score("123457894513")]})
+        mock_connector_class.return_value = mock_connector
+        job_data = JobData(job="", jobDescription="Ruby on Rails developer", candidates=self.candidates)
+
+        with patch("handler.score_cache", None), patch("prescoring.prescore_threshold", 80):
+            result = Handler.handle_request(job_data)
+
+        self.assertEqual([score["candidateId"] for score in result["candidates"]], ["32165467841", "123457894513"])
+        self.assertEqual(mock_connector.request.call_count, 1)
+        self.assertNotIn("32165467841", mock_connector.request.call_args.args[0].data)
+
+    @patch("handler.GeminiConnector")
+    def test_handler_keeps_input_order_when_local_scores_differ(self, mock_connector_class):
+        import asyncio
+        import json
+        response = json.dumps({"candidates": [make_score("123457894513"), make_score("32165467841")]})
+        mock_connector = MagicMock()
+        mock_connector.request.return_value = response
+        mock_connector.arequest = AsyncMock(return_value=response)
+        mock_connector_class.return_value = mock_connector
+        job_data = JobData(job="", jobDescription="Ruby on Rails developer", candidates=self.candidates)
+
+        with patch("handler.score_cache", None):
+            results = [Handler.handle_request(job_data), asyncio.run(Handler.ahandle_request(job_data))]
+
+        for result in results:
+            self.assertEqual([score["candidateId"] for score in result["candidates"]],
+                             ["32165467841", "123457894513"])
+
+
+class TestBatchPlanner(unittest.TestCase):
+    def test_plan_packs_candidates_by_input_budget(self):
+        small = {"candidateId": "s", "skills": ["Ruby"]}
+        large = {"candidateId": "l", "questions": [{"question": "Why?", "answer": "x" * 400}]}
+        planner = BatchPlanner(input_tokens=130, output_tokens=10000, max_candidates=50)
+
+        batches = planner.plan([small, small, large, small, large])
+
+        self.assertEqual([[c["candidateId"] for c in batch] for batch in batches], [["s", "s"], ["l", "s"], ["l"]])
+
+    def test_plan_limits_candidates_by_output_budget(self):
+        planner = BatchPlanner(input_tokens=10000, output_tokens=300, max_candidates=50, output_per_candidate=100)
+
+        batches = planner.plan([{"candidateId": str(idx)} for idx in range(7)])
+
+        self.assertEqual([len(batch) for batch in batches], [3, 3, 1])
+
+    def test_record_shrinks_budget_on_failures_and_recovers(self):
+        planner = BatchPlanner(input_tokens=10000, output_tokens=1000, max_candidates=50, output_per_candidate=100)
+
+        for _ in range(3):
+            planner.record(10, 5)
+        shrunk = planner.plan([{"candidateId": str(idx)} for idx in range(10)])
+        for _ in range(30):
+            planner.record(10, 0)
+
+        self.assertLess(len(shrunk[0]), 10)
+        self.assertEqual(planner.stats()["scale"], 1.0)
+        self.assertEqual(len(planner.plan([{"candidateId": str(idx)} for idx in range(10)])), 1)
+
+
+class TestHandlerBulk(unittest.IsolatedAsyncioTestCase):
+    async def test_ahandle_bulk_batches_concurrently_and_keeps_order(self):
+        import asyncio
+        in_flight = 0
+        max_in_flight = 0
+
+        async def fake_handle(job_data, deadline=None):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            # Model may answer in any order
+            return {"candidates": [make_score(c["candidateId"]) for c in reversed(job_data.candidates)]}
+
+        candidate_ids = [str(idx) for idx in range(25)]
+        bulk_data = BulkJobData(job="", jobDescription="Test job description",
+                                candidates=[{"candidateId": candidate_id} for candidate_id in candidate_ids])
+
+        with patch("handler.Handler.ahandle_request", side_effect=fake_handle) as mock_handle:
+            result = await Handler.ahandle_bulk(bulk_data, size=10, concurrency=2)
+
+        self.assertEqual(mock_handle.call_count, 3)
+        self.assertEqual(max_in_flight, 2)
+        self.assertEqual([score["candidateId"] for score in result["candidates"]], candidate_ids)
+
+    async def test_ahandle_top_k_stops_once_remaining_candidates_cannot_enter(self):
+        strong = [{"candidateId": f"s{idx}", "skills": ["Ruby", "Rails"]} for idx in range(2)]
+        weak = [{"candidateId": f"w{idx}", "skills": ["Cooking"]} for idx in range(4)]
+        bulk_data = BulkJobData(job="", jobDescription="Ruby Rails developer", candidates=[*weak, *strong])
+        sent = []
+
+        async def fake_handle(job_data, deadline=None):
+            sent.append([c["candidateId"] for c in job_data.candidates])
+            return {"candidates": [make_score(c["candidateId"], 45 if c["candidateId"].startswith("s") else 10)
+                                   for c in job_data.candidates]}
+
+        with patch("handler.Handler.ahandle_request", side_effect=fake_handle), patch("prescoring.top_k_margin", 20):
+            top_two = await Handler.ahandle_top_k(bulk_data, 2, size=2, concurrency=1)
+            sent_for_two = list(sent)
+            top_three = await Handler.ahandle_top_k(bulk_data, 3, size=2, concurrency=1)
+
+        self.assertEqual(sent_for_two, [["s0", "s1"]])
+        self.assertEqual(top_two, {"candidates": [make_score("s0", 45), make_score("s1", 45)],
+                                   "modelCallsSaved": 2, "candidatesSkipped": 4})
+        self.assertEqual([score["candidateId"] for score in top_three["candidates"]], ["s0", "s1", "w0"])
+        self.assertEqual((top_three["modelCallsSaved"], top_three["candidatesSkipped"]), (1, 2))
+
+
+class TestJobQueue(unittest.IsolatedAsyncioTestCase):
+    @staticmethod
+    def make_bulk_data(count: int) -> BulkJobData:
+        return BulkJobData(job="", jobDescription="Test job description",
+                           candidates=[{"candidateId": str(idx)} for idx in range(count)])
+
+    async def test_submit_returns_id_and_scores_in_background(self):
+        async def fake_handle(job_data, deadline=None):
+            return {"candidates": [make_score(c["candidateId"]) for c in job_data.candidates]}
+
+        queue = JobQueue(MemoryJobStore(), workers=2)
+        with patch("jobs.Handler.ahandle_request", side_effect=fake_handle), patch("handler.batch_size", 10):
+            job_id = await queue.submit(self.make_bulk_data(25))
+            self.assertEqual(queue.store.get(job_id)["status"], "queued")
+            await queue.join()
+
+        job = queue.store.get(job_id)
+        self.assertEqual(job["status"], "completed")
+        self.assertEqual((job["batches"], job["completedBatches"], job["scored"]), (3, 3, 25))
+        self.assertEqual([score["candidateId"] for score in job["result"]], [str(idx) for idx in range(25)])
+
+    async def test_failed_batch_fails_job_and_skips_remaining(self):
+        mock_handle = AsyncMock(side_effect=Exception("Model unavailable"))
+
+        queue = JobQueue(MemoryJobStore(), workers=1)
+        with patch("jobs.Handler.ahandle_request", mock_handle), patch("handler.batch_size", 10):
+            job_id = await queue.submit(self.make_bulk_data(25))
+            await queue.join()
+
+        job = queue.store.get(job_id)
+        self.assertEqual((job["status"], job["error"]), ("failed", "Model unavailable"))
+        self.assertEqual(mock_handle.call_count, 1)
+
+    def test_sqlite_store_keeps_partial_results_and_marks_interrupted(self):
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "jobs.db")
+            store = SqliteJobStore(path)
+            store.create("job", candidates=3, batches=2)
+            store.add_batch_result("job", 1, [make_score("3")])
+            store.add_batch_result("job", 0, [make_score("1"), make_score("2")])
+            store.create("pending", candidates=1, batches=1)
+
+            job = store.get("job")
+            self.assertEqual((job["status"], job["scored"]), ("completed", 3))
+            self.assertEqual([score["candidateId"] for score in job["result"]], ["1", "2", "3"])
+
+            reopened = SqliteJobStore(path)
+            self.assertEqual(reopened.get("pending")["status"], "failed")
+            self.assertEqual(reopened.get("job")["status"], "completed")
+            self.assertIsNone(reopened.get("missing"))
+
+
+async def make_chunks(text: str, size: int = 7):
+    data = text.encode("utf-8")
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+class TestIngestion(unittest.IsolatedAsyncioTestCase):
+    async def test_csv_upload_is_normalized_like_the_app(self):
+        import hashlib
+        text = ("Name,Creation Time,Skills,Experiences,Question1,Answer1\r\n"
+                'John Doe,2024-01-01,Ruby | SQL,Developer at Heroku (Jan 2022 to Jan 2024),Why?,"Line one\nline two"\r\n'
+                "\r\n"
+                "Jane Roe,2024-02-01,,,,\r\n")
+
+        candidates = [candidate async for candidate in aiter_candidates(make_chunks(text), "csv")]
+
+        self.assertEqual(len(candidates), 2)
+        self.assertEqual(candidates[0]["candidateId"], hashlib.md5(b"John Doe2024-01-01").hexdigest())
+        self.assertEqual(candidates[0]["skills"], ["Ruby", "SQL"])
+        self.assertEqual(candidates[0]["questions"], [{"question": "Why?", "answer": "Line one\nline two"}])
+        self.assertEqual(candidates[0]["experience"][0]["institution"], "Heroku")
+        self.assertEqual(candidates[0]["experience"][0]["totalMonths"], 24)
+        self.assertEqual((candidates[1]["skills"], candidates[1]["experience"]), ([], []))
+
+    def test_only_longest_current_experience_is_kept(self):
+        experience = parse_experience("Dev at A (Jan 2020 to ) | Dev at B (Jan 2023 to N/A) | Dev at C (2019 to 2020)")
+
+        self.assertEqual([item["institution"] for item in experience], ["A", "C"])
+        self.assertFalse(normalize_csv_row({"name": "x", "disqualified": "No"})["disqualified"])
+
+    async def test_jsonl_upload_keeps_candidates(self):
+        text = '{"candidateId": "1", "skills": ["Ruby"]}\n\n{"skills": []}'
+
+        candidates = [candidate async for candidate in aiter_candidates(make_chunks(text), "jsonl")]
+
+        self.assertEqual(candidates[0], {"candidateId": "1", "skills": ["Ruby"]})
+        self.assertIsNotNone(candidates[1]["candidateId"])
+
+    async def test_astream_bulk_reads_lazily_and_yields_every_score(self):
+        import asyncio
+        read = 0
+        reads_at_first_score = None
+
+        async def candidates():
+            nonlocal read
+            for idx in range(50):
+                read += 1
+                yield {"candidateId": str(idx)}
+
+        async def fake_handle(job_data, deadline=None):
+            await asyncio.sleep(0.01)
+            return {"candidates": [make_score(c["candidateId"]) for c in job_data.candidates]}
+
+        scores = []
+        with patch("handler.Handler.ahandle_request", side_effect=fake_handle) as mock_handle:
+            async for score in Handler.astream_bulk("", "Test job description", candidates(), size=5, concurrency=2):
+                if reads_at_first_score is None:
+                    reads_at_first_score = read
+                scores.append(score)
+
+        self.assertEqual(sorted(int(score["candidateId"]) for score in scores), list(range(50)))
+        self.assertEqual(mock_handle.call_count, 10)
+        # Two batches in flight plus the one waiting for a free slot
+        self.assertLessEqual(reads_at_first_score, 16)
+
+
+class TestConnectorPool(unittest.TestCase):
+    def test_get_reuses_connector_for_same_config(self):
+        connector_class = MagicMock()
+        pool = ConnectorPool(max_size=2)
+
+        first = pool.get(connector_class, model_name="model-a")
+        second = pool.get(connector_class, model_name="model-a")
+
+        self.assertIs(first, second)
+        connector_class.assert_called_once_with(model_name="model-a")
+        self.assertEqual(pool.stats()["reused"], 1)
+
+    def test_get_evicts_least_recently_used_when_full(self):
+        connector_class = MagicMock(side_effect=lambda **_: MagicMock())
+        pool = ConnectorPool(max_size=2)
+
+        first = pool.get(connector_class, model_name="model-a")
+        pool.get(connector_class, model_name="model-b")
+        pool.get(connector_class, model_name="model-c")
+
+        self.assertIsNot(pool.get(connector_class, model_name="model-a"), first)
+        self.assertEqual(pool.stats()["size"], 2)
+        self.assertEqual(pool.stats()["evicted"], 2)
+
+    def test_get_replaces_unhealthy_connector(self):
+        connector_class = MagicMock(side_effect=lambda **_: MagicMock())
+        pool = ConnectorPool()
+
+        first = pool.get(connector_class)
+        first.is_healthy.return_value = False
+        second = pool.get(connector_class)
+
+        self.assertIsNot(first, second)
+        self.assertEqual(pool.stats()["created"], 2)
+        self.assertEqual(pool.stats()["evicted"], 1)
+
+    @patch("gemini_connector.genai")
+    def test_gemini_connector_unhealthy_after_consecutive_failures(self, mock_genai):
+        mock_model = MagicMock()
+        mock_model.generate_content.side_effect = ValueError("Broken client")
+        mock_genai.GenerativeModel.return_value = mock_model
+
+        prompt = Prompt()
+        prompt.set_role("Assistant")
+        prompt.set_instruction("answer")
+        prompt.set_context("testing")
+        prompt.set_data("data")
+
+        connector = GeminiConnector()
+        with patch("gemini_connector.max_failures", 2):
+            for _ in range(2):
+                with self.assertRaises(ValueError):
+                    connector.request(prompt)
+
+            self.assertFalse(connector.is_healthy())
+
 
 class TestHandler(unittest.TestCase):
+    def setUp(self):
+        cache_patcher = patch("handler.score_cache", MemoryScoreCache())
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
 
-    @patch("handler.verify_parsing")
     @patch("handler.get_json_from_response")
     @patch("handler.get_prompt")
     @patch("handler.GeminiConnector")
     def test_handle_request_valid_on_first_try(
-        self, mock_connector_class, mock_get_prompt, mock_get_json, mock_verify
+        self, mock_connector_class, mock_get_prompt, mock_get_json
     ):
         mock_connector = MagicMock()
         mock_connector.request.return_value = "response content"
@@ -103,22 +1193,20 @@ class TestHandler(unittest.TestCase):
         mock_prompt = MagicMock()
         mock_get_prompt.return_value = mock_prompt
 
-        mock_get_json.return_value = {"result": "ok"}
-        mock_verify.return_value = True
+        mock_get_json.return_value = {"candidates": [make_score("1")]}
 
-        job_data = MagicMock(spec=JobData)
+        job_data = make_job_data()
         result = Handler.handle_request(job_data)
 
-        self.assertEqual(result, {"result": "ok"})
+        self.assertEqual(result, {"candidates": [make_score("1")]})
         mock_connector.request.assert_called_once()
         mock_get_prompt.assert_called_once_with(job_data)
 
-    @patch("handler.verify_parsing")
     @patch("handler.get_json_from_response")
     @patch("handler.get_prompt")
     @patch("handler.GeminiConnector")
     def test_handle_request_retries_then_succeeds(
-        self, mock_connector_class, mock_get_prompt, mock_get_json, mock_verify
+        self, mock_connector_class, mock_get_prompt, mock_get_json
     ):
         mock_connector = MagicMock()
         mock_connector.request.side_effect = ["bad", "bad", "good"]
@@ -127,22 +1215,20 @@ class TestHandler(unittest.TestCase):
         mock_prompt = MagicMock()
         mock_get_prompt.return_value = mock_prompt
 
-        mock_get_json.side_effect = [{}, {}, {"result": "done"}]
-        mock_verify.side_effect = [False, False, True]
+        mock_get_json.side_effect = [{}, {}, {"candidates": [make_score("1")]}]
 
-        job_data = MagicMock(spec=JobData)
+        job_data = make_job_data()
         result = Handler.handle_request(job_data)
 
-        self.assertEqual(result, {"result": "done"})
+        self.assertEqual(result, {"candidates": [make_score("1")]})
         self.assertEqual(mock_connector.request.call_count, 3)
         mock_prompt.set_retry_text.assert_called_once()
 
-    @patch("handler.verify_parsing")
     @patch("handler.get_json_from_response")
     @patch("handler.get_prompt")
     @patch("handler.GeminiConnector")
     def test_handle_request_fails_after_max_attempts(
-        self, mock_connector_class, mock_get_prompt, mock_get_json, mock_verify
+        self, mock_connector_class, mock_get_prompt, mock_get_json
     ):
         mock_connector = MagicMock()
         mock_connector.request.return_value = "bad"
@@ -152,9 +1238,8 @@ class TestHandler(unittest.TestCase):
         mock_get_prompt.return_value = mock_prompt
 
         mock_get_json.return_value = {}
-        mock_verify.return_value = False
 
-        job_data = MagicMock(spec=JobData)
+        job_data = make_job_data()
 
         with patch("handler.max_attempts", 3):
             with self.assertRaises(Exception) as cm:
@@ -165,6 +1250,448 @@ class TestHandler(unittest.TestCase):
         self.assertEqual(mock_prompt.set_retry_text.call_count, 1)
 
 
+    @patch("handler.get_prompt", wraps=get_prompt)
+    @patch("handler.GeminiConnector")
+    def test_handle_request_reattempts_only_invalid_candidates(self, mock_connector_class, mock_get_prompt):
+        import json
+        invalid_score = {**make_score("2"), "education": None}
+        mock_connector = MagicMock()
+        mock_connector.request.side_effect = [
+            json.dumps({"candidates": [make_score("1"), invalid_score]}),
+            json.dumps({"candidates": [make_score("2"), make_score("3")]}),
+        ]
+        mock_connector_class.return_value = mock_connector
+
+        result = Handler.handle_request(make_job_data(["1", "2", "3"]))
+
+        self.assertEqual([score["candidateId"] for score in result["candidates"]], ["1", "2", "3"])
+        retry_prompt = mock_connector.request.call_args_list[1].args[0]
+        self.assertEqual(mock_get_prompt.call_args.args[0].candidates, [{"candidateId": "2"}, {"candidateId": "3"}])
+        self.assertTrue(retry_prompt.retry_text)
+
+    @patch("handler.GeminiConnector")
+    def test_handle_request_salvaged_response_avoids_retry(self, mock_connector_class):
+        import json
+        registry = Metrics()
+        mock_connector = MagicMock()
+        mock_connector.request.return_value = json.dumps({"candidates": [make_score("1")]})[:-2] + ",]} Done"
+        mock_connector_class.return_value = mock_connector
+
+        with patch("handler.metrics", registry), patch("json_salvage.metrics", registry):
+            result = Handler.handle_request(make_job_data())
+
+        self.assertEqual(result, {"candidates": [make_score("1")]})
+        mock_connector.request.assert_called_once()
+        self.assertEqual(registry.get_counter("salvage_retries_avoided"), 1)
+        self.assertEqual(registry.get_counter("parse_retries"), 0)
+
+    @patch("handler.GeminiConnector")
+    def test_handle_request_counts_salvage_from_its_own_response(self, mock_connector_class):
+        registry = Metrics()
+        mock_connector_class.return_value.request.return_value = "response content"
+
+        def parse_while_another_thread_salvages(_):
+            registry.increment("salvaged_responses")
+            return {"candidates": [make_score("1")]}
+
+        with patch("handler.metrics", registry), \
+                patch("handler.get_json_from_response", side_effect=parse_while_another_thread_salvages):
+            Handler.handle_request(make_job_data())
+
+        self.assertEqual(registry.get_counter("salvaged_scores"), 0)
+        self.assertEqual(registry.get_counter("salvage_retries_avoided"), 0)
+
+    @patch("handler.GeminiConnector")
+    def test_handle_request_matrix_scores_every_job_on_shared_prompts(self, mock_connector_class):
+        import json
+        jobs = [{"jobId": "a", "jobDescription": "Ruby developer"}, {"jobId": "b", "jobDescription": "Go developer"}]
+        mock_connector = MagicMock()
+        mock_connector.request.side_effect = [
+            json.dumps({"candidates": [{**make_score("1", 40), "jobId": "a"}, {**make_score("1", 10), "jobId": "b"},
+                                       {**make_score("2", 20), "jobId": "a"}]}),
+            json.dumps({"candidates": [{**make_score("2", 20), "jobId": "a"}, {**make_score("2", 30), "jobId": "b"}]}),
+        ]
+        mock_connector_class.return_value = mock_connector
+        job_data = JobData(job="", jobs=jobs, candidates=[{"candidateId": "1"}, {"candidateId": "2"}])
+
+        result = Handler.handle_request(job_data)
+
+        self.assertEqual(result, {"jobs": [
+            {"jobId": "a", "candidates": [make_score("1", 40), make_score("2", 20)]},
+            {"jobId": "b", "candidates": [make_score("1", 10), make_score("2", 30)]},
+        ]})
+        self.assertEqual(mock_connector.request.call_count, 2)
+        retry_prompt = mock_connector.request.call_args_list[1].args[0]
+        self.assertIn('"candidateId":"2"', retry_prompt.batch_data)
+        self.assertNotIn('"candidateId":"1"', retry_prompt.batch_data)
+
+        # Every cell is cached as a single job score
+        single = Handler.handle_request(make_job_data(["1", "2"], job_description="Go developer"))
+        self.assertEqual(single, {"candidates": [make_score("1", 10), make_score("2", 30)]})
+        self.assertEqual(mock_connector.request.call_count, 2)
+
+    @patch("handler.GeminiConnector")
+    def test_handle_request_returns_partial_scores_at_the_deadline(self, mock_connector_class):
+        import json
+        import time
+        deadline = Deadline(60)
+
+        def respond(prompt):
+            # Model answered after most of the time budget was spent
+            deadline.expires_at = time.monotonic() + 1
+            return json.dumps({"candidates": [make_score("1")]})
+
+        mock_connector = MagicMock()
+        mock_connector.request.side_effect = respond
+        mock_connector_class.return_value = mock_connector
+
+        result = Handler.handle_request(make_job_data(["1", "2"]), deadline)
+
+        self.assertEqual(result, {"candidates": [make_score("1")], "status": "timeout", "missing": ["2"]})
+        mock_connector.request.assert_called_once()
+
+    @patch("handler.GeminiConnector")
+    def test_handle_request_skips_the_model_without_time_left(self, mock_connector_class):
+        result = Handler.handle_request(make_job_data(["1"]), Deadline(0))
+
+        self.assertEqual(result, {"candidates": [], "status": "timeout", "missing": ["1"]})
+        mock_connector_class.return_value.request.assert_not_called()
+
+
+class TestDeadline(unittest.TestCase):
+    def test_request_deadline_takes_the_earliest_limit_minus_margin(self):
+        context = MagicMock()
+        context.get_remaining_time_in_millis.return_value = 8000
+
+        with patch("deadline.deadline_margin", 1):
+            self.assertAlmostEqual(request_deadline("5", context).remaining(), 4, delta=0.1)
+            self.assertAlmostEqual(request_deadline(None, context).remaining(), 7, delta=0.1)
+            self.assertAlmostEqual(request_deadline("invalid", context).remaining(), 7, delta=0.1)
+            self.assertIsNone(request_deadline(None, None))
+
+    def test_check_deadline_only_raises_inside_a_short_scope(self):
+        check_deadline(30, "backoff")
+        with deadline_scope(Deadline(60)):
+            check_deadline(30, "backoff")
+            with self.assertRaises(DeadlineExceeded):
+                check_deadline(59, "backoff")
+
+
+class TestScoreCache(unittest.TestCase):
+    def test_score_key_normalizes_job_description(self):
+        candidate = {"candidateId": "1", "skills": ["Ruby"]}
+
+        self.assertEqual(
+            score_key("Ruby  developer\n", candidate, "1"),
+            score_key("Ruby developer", dict(reversed(candidate.items())), "1")
+        )
+        self.assertNotEqual(score_key("Ruby developer", candidate, "1"), score_key("Ruby developer", candidate, "2"))
+
+    def test_memory_cache_evicts_least_recently_used(self):
+        cache = MemoryScoreCache(max_size=2, ttl=60)
+        cache.set("a", make_score("a"))
+        cache.set("b", make_score("b"))
+        cache.get("a")
+        cache.set("c", make_score("c"))
+
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+
+    def test_memory_cache_expires_entries(self):
+        cache = MemoryScoreCache(ttl=10)
+        with patch("score_cache.time.monotonic", side_effect=[0, 5, 20]):
+            cache.set("a", make_score("a"))
+            self.assertIsNotNone(cache.get("a"))
+            self.assertIsNone(cache.get("a"))
+
+    def test_sqlite_cache_round_trip_and_prune(self):
+        import os
+        import tempfile
+        with tempfile.TemporaryDirectory() as directory:
+            cache = SqliteScoreCache(path=os.path.join(directory, "cache.db"), max_size=1, ttl=60)
+            cache.set("a", make_score("a"))
+            self.assertEqual(cache.get("a"), make_score("a"))
+
+            cache.set("b", make_score("b"))
+            self.assertIsNone(cache.get("a"))
+            self.assertEqual(cache.get("b"), make_score("b"))
+
+    @patch("handler.get_prompt", wraps=get_prompt)
+    @patch("handler.GeminiConnector")
+    def test_handle_request_only_sends_cache_misses(self, mock_connector_class, mock_get_prompt):
+        import json
+        mock_connector = MagicMock()
+        mock_connector.request.side_effect = [
+            json.dumps({"candidates": [make_score("1"), make_score("2")]}),
+            json.dumps({"candidates": [make_score("3")]}),
+        ]
+        mock_connector_class.return_value = mock_connector
+
+        with patch("handler.score_cache", MemoryScoreCache()):
+            Handler.handle_request(make_job_data(["1", "2"]))
+            result = Handler.handle_request(make_job_data(["3", "1", "2"]))
+
+        self.assertEqual([score["candidateId"] for score in result["candidates"]], ["3", "1", "2"])
+        self.assertEqual(mock_connector.request.call_count, 2)
+        self.assertEqual(mock_get_prompt.call_args.args[0].candidates, [{"candidateId": "3"}])
+
+
+class TestResultStore(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        import os
+        import tempfile
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store_path = os.path.join(directory.name, "results.db")
+        self.store = SqliteResultStore(self.store_path)
+
+    def test_changed_candidates_are_misses(self):
+        candidates = [{"candidateId": "1", "skills": ["Ruby"]}, {"candidateId": 2, "skills": []}]
+        self.store.set_many("Ruby  developer", [(c, make_score(c["candidateId"])) for c in candidates], "1")
+
+        self.assertEqual(set(self.store.get_many("Ruby developer", candidates, "1")), {"1", "2"})
+        self.assertEqual(self.store.get_many("Ruby developer", candidates, "2"), {})
+        self.assertEqual(self.store.get_many("Python developer", candidates, "1"), {})
+
+        changed = [{"candidateId": "1", "skills": ["Ruby", "Rails"]}, candidates[1]]
+        self.assertEqual(set(self.store.get_many("Ruby developer", changed, "1")), {"2"})
+
+        self.store.set_many("Ruby developer", [(changed[0], make_score("1", experience=40))], "1")
+        self.assertEqual(self.store.get_many("Ruby developer", changed, "1")["1"]["overallExperience"], 40)
+        self.assertEqual(set(self.store.get_many("Ruby developer", candidates, "1")), {"2"})
+
+    @patch("result_store.time.time")
+    def test_expired_and_oldest_scores_are_pruned(self, mock_time):
+        import os
+        store = SqliteResultStore(os.path.join(os.path.dirname(self.store_path), "pruned.db"), max_size=2, ttl=100)
+        candidates = [{"candidateId": str(idx)} for idx in range(3)]
+        for idx, candidate in enumerate(candidates):
+            mock_time.return_value = idx
+            store.set_many("Ruby developer", [(candidate, make_score(candidate["candidateId"]))], "1")
+
+        self.assertEqual(set(store.get_many("Ruby developer", candidates, "1")), {"1", "2"})
+
+        mock_time.return_value = 150
+        self.assertEqual(store.get_many("Ruby developer", candidates, "1"), {})
+        store.set_many("Ruby developer", [({"candidateId": "3"}, make_score("3"))], "1")
+        self.assertEqual(store._connection.execute("SELECT COUNT(*) FROM results").fetchone()[0], 1)
+
+    @patch("handler.GeminiConnector")
+    async def test_async_requests_use_the_store_off_the_event_loop(self, mock_connector_class):
+        import json
+        import threading
+        threads = []
+
+        class RecordingStore(SqliteResultStore):
+            def get_many(self, *args):
+                threads.append(threading.get_ident())
+                return super().get_many(*args)
+
+            def set_many(self, *args):
+                threads.append(threading.get_ident())
+                return super().set_many(*args)
+
+        mock_connector = MagicMock()
+        mock_connector.arequest = AsyncMock(return_value=json.dumps({"candidates": [make_score("1"), make_score("2")]}))
+        mock_connector_class.return_value = mock_connector
+        with patch("handler.score_cache", None), patch("handler.result_store", RecordingStore(":memory:")):
+            await Handler.ahandle_request(make_job_data(["1", "2"]))
+
+        self.assertEqual(len(threads), 2)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    async def test_bulk_rescoring_only_sends_changed_candidates(self):
+        candidates = [{"candidateId": str(idx), "skills": ["Ruby"]} for idx in range(200)]
+
+        async def fake_request(prompt):
+            import json
+            ids = [c["candidateId"] for c in json.loads(prompt.batch_data.split("\n\n", 1)[1])]
+            return json.dumps({"candidates": [make_score(candidate_id) for candidate_id in ids]})
+
+        mock_connector = MagicMock()
+        mock_connector.arequest = AsyncMock(side_effect=fake_request)
+        with patch("handler.GeminiConnector", return_value=mock_connector), \
+                patch("handler.score_cache", None), patch("handler.result_store", self.store):
+            bulk_data = BulkJobData(job="", jobDescription="Ruby developer", candidates=candidates)
+            await Handler.ahandle_bulk(bulk_data, size=10)
+            self.assertEqual(mock_connector.arequest.await_count, 20)
+
+            for idx in (5, 77, 150):
+                candidates[idx] = {**candidates[idx], "skills": ["Ruby", "Rails"]}
+            result = await Handler.ahandle_bulk(BulkJobData(job="", jobDescription="Ruby developer",
+                                                            candidates=candidates), size=10)
+
+        self.assertEqual(mock_connector.arequest.await_count, 21)
+        self.assertEqual([score["candidateId"] for score in result["candidates"]], [str(idx) for idx in range(200)])
+
+
+class TestBenchmark(unittest.TestCase):
+    def test_fake_connector_scores_batch_candidates(self):
+        connector = FakeConnector(latency_ms=0, seed=1)
+
+        response = connector.request(get_prompt(make_job_data(["1", "2"])))
+
+        self.assertTrue(verify_parsing(get_json_from_response(response)))
+        self.assertEqual([c["candidateId"] for c in get_json_from_response(response)["candidates"]], ["1", "2"])
+        self.assertEqual(connector.stats()["calls"], 1)
+
+    def test_fake_connector_injects_rate_limits_and_malformed_output(self):
+        import random
+        connector = FakeConnector(latency_ms=0, rate_limit_rate=0.5, backoff_scale=0, seed=3)
+        for _ in range(10):
+            connector.request(get_prompt(make_job_data(["1"])))
+
+        malformed = [fake_scores_response(["1", "2"], random.Random(idx), malformed_rate=1.0) for idx in range(10)]
+
+        self.assertGreater(connector.stats()["rateLimited"], 0)
+        self.assertTrue(all(is_malformed for _, is_malformed in malformed))
+        self.assertFalse(any(verify_parsing(get_json_from_response(response)) and len(
+            get_json_from_response(response)["candidates"]) == 2 for response, _ in malformed))
+
+    def test_extract_candidate_ids_ignores_prompt_examples(self):
+        prompt = get_prompt(make_job_data(["a", "b"]))
+
+        self.assertEqual(extract_candidate_ids("\n".join([*prompt.get_static_content(), prompt.data])), ["a", "b"])
+
+    def test_run_benchmark_reports_throughput(self):
+        from benchmark.run import run_benchmark
+
+        with patch("handler.score_cache", MemoryScoreCache()):
+            report = run_benchmark("handler", jobs=2, candidates=30, latency_ms=0, malformed_rate=0.2, seed=1)
+
+        self.assertEqual(report["jobs"], 2)
+        self.assertGreater(report["batches"], 0)
+        self.assertGreater(report["promptBytes"], 0)
+        self.assertIn("p95", report["jobLatency"])
+
+    def test_run_benchmark_ignores_persisted_scores(self):
+        import os
+        import tempfile
+        from benchmark.run import run_benchmark
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+
+        with patch("handler.result_store", SqliteResultStore(os.path.join(directory.name, "results.db"))):
+            reports = [run_benchmark("handler", jobs=2, candidates=20, latency_ms=0, seed=1) for _ in range(2)]
+
+        self.assertGreater(reports[0]["batches"], 0)
+        self.assertEqual(reports[1]["batches"], reports[0]["batches"])
+        self.assertEqual(reports[1]["promptBytes"], reports[0]["promptBytes"])
+
+    def test_run_benchmark_against_fake_model_server(self):
+        from benchmark.run import run_benchmark
+
+        with patch("handler.score_cache", MemoryScoreCache()):
+            report = run_benchmark("server", jobs=1, candidates=20, latency_ms=0, rate_limit_rate=0.2,
+                                   backoff_scale=0, seed=2)
+
+        self.assertGreater(report["batches"], 0)
+        self.assertGreater(report["promptBytesPerBatch"], 0)
+
+
+class TestColdStart(unittest.TestCase):
+    def test_sdk_and_numpy_are_not_imported_with_the_app(self):
+        import os
+        import subprocess
+        import sys
+        output = subprocess.run(
+            [sys.executable, "-c",
+             "import sys, main; print('google.generativeai' in sys.modules, 'numpy' in sys.modules)"],
+            capture_output=True, text=True, check=True, env={**os.environ, "WARMUP": "false"}
+        ).stdout
+
+        self.assertEqual(output.strip(), "False False")
+
+    def test_prompt_artifacts_match_rendered_prompt(self):
+        from data import prompt_defaults
+        from data.build_prompts import build_artifacts
+        from utils import build_prompt_prefix, default_prompt_prefix
+
+        self.assertEqual(prompt_defaults.prompt_artifacts, build_artifacts())
+        self.assertEqual(default_prompt_prefix.get_static_content(),
+                         build_prompt_prefix(examples=prompt_defaults.render_examples()).get_static_content())
+        with patch("data.prompt_defaults.prompt_version", "outdated"):
+            self.assertIsNone(prompt_defaults.load_prompt_artifacts())
+
+    @patch("handler.GeminiConnector")
+    def test_warm_up_creates_pooled_connector(self, mock_connector_class):
+        Handler.warm_up()
+
+        mock_connector_class.assert_called_once()
+
+    def test_startup_benchmark_event_reaches_the_app(self):
+        import json
+
+        async def fake_handle(job_data, deadline=None):
+            return {"candidates": [make_score(c["candidateId"]) for c in job_data.candidates]}
+
+        with patch("handler.Handler.ahandle_request", side_effect=fake_handle):
+            response = call_lambda({"job": "", "jobDescription": "Ruby", "candidates": [{"candidateId": "1"}]})
+
+        self.assertEqual(response["statusCode"], 200)
+        self.assertEqual(json.loads(response["body"])["result"]["candidates"][0]["candidateId"], "1")
+
+
+class TestMetrics(unittest.TestCase):
+    def test_render_counters_histograms_and_collectors(self):
+        registry = Metrics()
+        registry.increment("parse_retries")
+        registry.increment("parse_retries", 2)
+        registry.observe("stage", 0.02, stage="get_prompt")
+        registry.register_collector("connector_pool", lambda: {"reused": 3, "maxSize": 4, "name": "skip"})
+
+        rendered = registry.render()
+
+        self.assertIn("llm_parse_retries_total 3", rendered)
+        self.assertIn('llm_stage_seconds_bucket{stage="get_prompt",le="0.01"} 0', rendered)
+        self.assertIn('llm_stage_seconds_bucket{stage="get_prompt",le="0.05"} 1', rendered)
+        self.assertIn('llm_stage_seconds_count{stage="get_prompt"} 1', rendered)
+        self.assertIn("llm_connector_pool_max_size 4", rendered)
+        self.assertNotIn("name", rendered)
+
+    @patch("gemini_connector.time.sleep")
+    @patch("gemini_connector.genai")
+    def test_connector_records_attempts_backoff_and_sizes(self, mock_genai, _):
+        import gemini_connector
+        gemini_connector.ResourceExhausted = ResourceExhausted
+        mock_model = MagicMock()
+        response = MagicMock()
+        response.text = "LLM output"
+        response.usage_metadata.prompt_token_count = 120
+        mock_model.generate_content.side_effect = [ResourceExhausted("Rate limit"), response]
+        mock_genai.GenerativeModel.return_value = mock_model
+
+        registry = Metrics()
+        with patch("gemini_connector.metrics", registry):
+            GeminiConnector().request(get_prompt(make_job_data()))
+
+        self.assertEqual(registry.get_counter("rate_limit_hits"), 1)
+        self.assertEqual(registry.get_count("backoff"), 1)
+        self.assertEqual(registry.get_count("model_request"), 2)
+        self.assertEqual(registry.get_counter("response_bytes"), len("LLM output"))
+        self.assertEqual(registry.get_counter("prompt_tokens"), 120)
+        self.assertGreater(registry.get_counter("prompt_bytes"), 0)
+
+    @patch("handler.GeminiConnector")
+    def test_handler_records_stages_and_parse_retries(self, mock_connector_class):
+        import json
+        mock_connector = MagicMock()
+        mock_connector.request.side_effect = ["bad", json.dumps({"candidates": [make_score("1")]})]
+        mock_connector_class.return_value = mock_connector
+
+        registry = Metrics()
+        with patch("handler.metrics", registry), patch("handler.score_cache", MemoryScoreCache()), \
+                patch("handler.log_event") as mock_log:
+            Handler.handle_request(make_job_data())
+
+        self.assertEqual(registry.get_counter("parse_retries"), 1)
+        self.assertEqual(registry.get_count("stage", stage="get_prompt"), 1)
+        self.assertEqual(registry.get_count("stage", stage="parse_json"), 2)
+        mock_log.assert_called_once()
+        self.assertEqual(mock_log.call_args.kwargs["attempts"], 2)
+
+
 class TestUtils(unittest.TestCase):
     def test_verify_parsing_valid(self):
         data = {
@@ -172,10 +1699,10 @@ class TestUtils(unittest.TestCase):
                 {
                     "candidateId": "123",
                     "overallExperience": 5,
-                    "education": "Bachelor",
-                    "questionAlignment": [],
-                    "completion": True,
-                    "highlights": []
+                    "education": 15,
+                    "questionAlignment": 10,
+                    "completion": 8,
+                    "highlights": "Bachelor in the required area"
                 }
             ]
         }
@@ -200,6 +1727,15 @@ class TestUtils(unittest.TestCase):
         data = {"candidates": []}
         self.assertFalse(verify_parsing(data))
 
+    def test_split_valid_scores_returns_invalid_and_missing_candidates(self):
+        data = {"candidates": [make_score("1"), {**make_score("2"), "highlights": None}, "not a score"]}
+        candidates = [{"candidateId": "1"}, {"candidateId": "2"}, {"candidateId": "3"}]
+
+        valid, invalid = split_valid_scores(data, candidates)
+
+        self.assertEqual(valid, [make_score("1")])
+        self.assertEqual(invalid, [{"candidateId": "2"}, {"candidateId": "3"}])
+
     def test_get_json_from_response_valid(self):
         json_str = """```json
     {
@@ -208,6 +1744,17 @@ class TestUtils(unittest.TestCase):
     ```"""
         self.assertEqual(get_json_from_response(json_str), {"key": "value"})
 
+    def test_verify_parsing_rejects_wrong_types_and_ranges(self):
+        self.assertFalse(verify_parsing({"candidates": [{**make_score("1"), "overallExperience": 51}]}))
+        self.assertFalse(verify_parsing({"candidates": [{**make_score("1"), "education": "Bachelor"}]}))
+        self.assertFalse(verify_parsing({"candidates": [{**make_score("1"), "highlights": []}]}))
+
+    def test_get_json_from_response_strips_fence_prefix_only(self):
+        response = 'Here you go:\n```json\n{"candidates": [], "note": "json"}\n```\nanything else'
+
+        self.assertEqual(get_json_from_response(response), {"candidates": [], "note": "json"})
+        self.assertEqual(get_json_from_response('[{"candidateId": "1"}]'), {"candidates": [{"candidateId": "1"}]})
+
     def test_get_json_from_response_invalid(self):
         json_str = "this is not json"
         self.assertEqual(get_json_from_response(json_str), {})
@@ -216,6 +1763,7 @@ class TestUtils(unittest.TestCase):
         job = MagicMock(spec=JobData)
         job.jobDescription = "Test job description"
         job.candidates = [{"id": 1}]
+        job.jobs = None
 
         prompt = get_prompt(job)
 
@@ -225,6 +1773,49 @@ class TestUtils(unittest.TestCase):
         self.assertIn(prompt_role, prompt.role)
         self.assertTrue(len(prompt.examples) > 0)
 
+    def test_matrix_job_data_and_prompt(self):
+        jobs = [{"jobId": "ruby", "jobDescription": "Ruby developer"}, {"jobId": "go", "jobDescription": "Go developer"}]
+        job = JobData(job="", jobs=jobs, candidates=[{"candidateId": "1"}])
+
+        prompt = get_prompt(job)
+
+        self.assertEqual(job.job_ids, ["ruby", "go"])
+        self.assertIn("jobId ruby:\nRuby developer", prompt.data)
+        self.assertIn("jobId go:\nGo developer", prompt.data)
+        self.assertIn("jobId", prompt.response_schema["properties"]["candidates"]["items"]["required"])
+        with self.assertRaises(ValueError):
+            JobData(job="", candidates=[{"candidateId": "1"}])
+        with self.assertRaises(ValueError):
+            JobData(job="", jobs=[jobs[0], jobs[0]], candidates=[{"candidateId": "1"}])
+
+    def test_verify_parsing_matrix_requires_every_cell(self):
+        cells = [{**make_score(candidate_id), "jobId": job_id} for job_id in ("a", "b") for candidate_id in ("1", "2")]
+
+        self.assertTrue(verify_parsing({"candidates": cells}, ["a", "b"]))
+        self.assertFalse(verify_parsing({"candidates": cells[:-1]}, ["a", "b"]))
+        self.assertFalse(verify_parsing({"candidates": cells}, ["a"]))
+        self.assertFalse(verify_parsing({"candidates": [make_score("1")]}, ["a"]))
+
+    def test_split_valid_scores_matrix_needs_every_job(self):
+        data = {"candidates": [{**make_score("1"), "jobId": "a"}, {**make_score("1"), "jobId": "b"},
+                               {**make_score("2"), "jobId": "a"}]}
+
+        valid, invalid = split_valid_scores(data, [{"candidateId": "1"}, {"candidateId": "2"}], ["a", "b"])
+
+        self.assertEqual(valid, [{**make_score("1"), "jobId": "a"}, {**make_score("1"), "jobId": "b"}])
+        self.assertEqual(invalid, [{"candidateId": "2"}])
+
+    def test_get_prompt_reuses_compiled_prefix(self):
+        first = get_prompt(make_job_data(["1"]))
+        second = get_prompt(make_job_data(["2"], "Another job description"))
+        first.set_retry_text("Retry")
+
+        self.assertIsNot(first, second)
+        self.assertIs(first.examples, second.examples)
+        self.assertEqual(second.retry_text, "")
+        self.assertIn("Another job description", second.job_context)
+        self.assertEqual(second.data, second.job_context + second.batch_data)
+
 if __name__ == "__main__":
     unittest.main()
 
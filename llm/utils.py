@@ -1,43 +1,158 @@
+import copy
 import json
+import os
+import re
 
 from data.prompt_defaults import prompt_role, prompt_instruction, prompt_role_description, prompt_context, \
-    prompt_examples
-from schema.types import JobData, Prompt
+    prompt_examples, prompt_artifacts, prompt_matrix_instruction
+from compaction import compact_candidates, get_short_keys_legend, short_keys_enabled
+from json_salvage import salvage_json, salvage_enabled
+from pydantic import ValidationError
 
+from schema.types import JobData, Prompt, CandidateScore, CandidateJobScore, score_response_schema, \
+    score_matrix_response_schema
 
-def verify_parsing(data: dict) -> bool:
+structured_output_enabled = os.getenv("STRUCTURED_OUTPUT", "true").lower() == "true"
+
+
+# Rough average for English text, good enough to budget quotas before sending a request
+chars_per_token = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // chars_per_token + 1
+
+
+def candidate_id(item: dict) -> str:
+    """
+    candidateId as text. Candidates may come with integer ids, while the model answers them as strings
+    """
+    return str(item.get("candidateId"))
+
+
+def parse_score(item: dict, score_model: type[CandidateScore] = CandidateScore) -> dict | None:
+    """
+    Validate types and ranges of a candidate score. Returns the normalized score, or None when invalid
+    """
+    if not isinstance(item, dict):
+        return None
+    try:
+        return score_model.model_validate(item).model_dump()
+    except ValidationError:
+        return None
+
+
+def verify_parsing(data: dict, job_ids: list[str] = None) -> bool:
+    """
+    Check every score of the response. With job_ids (matrix requests) each score must also have a jobId,
+    and every candidate in the response needs a score for each of the jobs
+    """
     candidates = data.get('candidates', [])
     if not len(candidates):
         print("No candidates found in the response")
         return False
+    score_model = CandidateJobScore if job_ids else CandidateScore
+    cells = set()
     for item in candidates:
-        candidate_id = item.get("candidateId", None)
-        experience = item.get("overallExperience", None)
-        education = item.get("education", None)
-        questions = item.get("questionAlignment", None)
-        completion = item.get("completion", None)
-        highlights = item.get("highlights", None)
-
-        if None in [candidate_id, experience, education, questions, completion, highlights]:
+        score = parse_score(item, score_model)
+        if score is None:
             print("Invalid data format")
             return False
+        cells.add((score.get("jobId"), candidate_id(score)))
 
+    if job_ids:
+        candidate_ids = {candidate_id for _, candidate_id in cells}
+        if cells != {(job_id, candidate_id) for job_id in job_ids for candidate_id in candidate_ids}:
+            print("Missing or unknown job scores")
+            return False
     return True
 
 
+def split_valid_scores(data: dict, candidates: list[dict],
+                       job_ids: list[str] = None) -> tuple[list[dict], list[dict]]:
+    """
+    Validate the response per candidate. Returns the valid scores of the given candidates,
+    and the candidates that are missing or invalid in the response.
+    With job_ids (matrix requests) a candidate is only valid when it has a valid score for every job
+    """
+    score_model = CandidateJobScore if job_ids else CandidateScore
+    scores = {}
+    for item in data.get('candidates', []):
+        score = parse_score(item, score_model)
+        if score is not None:
+            scores[(score.get("jobId"), candidate_id(score))] = score
+
+    valid = []
+    invalid = []
+    for candidate in candidates:
+        cells = [scores.get((job_id, candidate_id(candidate))) for job_id in job_ids or [None]]
+        if None in cells:
+            invalid.append(candidate)
+        else:
+            valid.extend(cells)
+
+    return valid, invalid
+
+
+def split_job_scores(scores: list[dict], job_ids: list[str]) -> dict[str, list[dict]]:
+    """
+    Group the scores of a matrix request by job, without the jobId
+    """
+    by_job = {job_id: [] for job_id in job_ids}
+    for score in scores:
+        job_scores = by_job.get(str(score.get("jobId")))
+        if job_scores is not None:
+            job_scores.append({key: value for key, value in score.items() if key != "jobId"})
+    return by_job
+
+
+def score_total(score: dict) -> int:
+    return sum(score.get(area) or 0 for area in ("overallExperience", "education", "questionAlignment", "completion"))
+
+
+def split_in_batches(items: list, size: int) -> list[list]:
+    return [items[idx:idx + size] for idx in range(0, len(items), size)]
+
+
+def order_scores(candidates: list[dict], scores: list[dict]) -> list[dict]:
+    """
+    Sort scores following the candidates order. Scores not matching any candidate are kept at the end
+    """
+    scores_by_id = {candidate_id(score): score for score in scores}
+    ordered = []
+    for candidate in candidates:
+        score = scores_by_id.pop(candidate_id(candidate), None)
+        if score is not None:
+            ordered.append(score)
+    ordered.extend(scores_by_id.values())
+
+    return ordered
+
+
+code_fence = re.compile(r"```(?:json)?\s*(.*?)\s*(?:```|$)", re.DOTALL)
+
+
 def get_json_from_response(response: str) -> dict:
+    match = code_fence.search(response)
+    clean_response = match.group(1) if match else response.strip()
     try:
-        clean_response = response.strip('```json\n').rstrip('```')
         json_data = json.loads(clean_response)
-        return json_data
-    except:
-        return {}
+    except (json.JSONDecodeError, TypeError):
+        # Near valid output (text around the JSON, trailing commas, single quotes, cut short) is repaired,
+        # and comes back as SalvagedJson
+        return salvage_json(clean_response) if salvage_enabled else {}
 
+    if isinstance(json_data, list):
+        # Candidates list without the wrapping object
+        return {"candidates": json_data}
+    return json_data if isinstance(json_data, dict) else {}
 
-def get_prompt(job: JobData, role=prompt_role, role_description=prompt_role_description,
-                   examples=prompt_examples, instruction=prompt_instruction, context=prompt_context) -> Prompt:
-    prompt_data = f"\nReady?\n\nThis is the information given for the task: \n\n{job.jobDescription}\n And candidate list:\n\n${job.candidates}"
 
+def build_prompt_prefix(role=prompt_role, role_description=prompt_role_description, examples=prompt_examples,
+                        instruction=prompt_instruction, context=prompt_context) -> Prompt:
+    """
+    Build the static part of the prompt, which is the same for every job and batch
+    """
     prompt = Prompt()
 
     prompt.set_role(role, role_description)
@@ -46,6 +161,48 @@ def get_prompt(job: JobData, role=prompt_role, role_description=prompt_role_desc
     prompt.set_examples(examples)
     prompt.set_context(context)
 
-    prompt.set_data(prompt_data)
+    return prompt
+
+
+def load_prompt_prefix(artifacts: dict) -> Prompt:
+    """
+    Default prefix from the parts rendered at build time
+    """
+    prompt = Prompt()
+    prefix = artifacts["prefix"]
+    prompt.role = prefix["role"]
+    prompt.instruction = prefix["instruction"]
+    prompt.context = prefix["context"]
+    prompt.examples = prefix["examples"]
+    return prompt
+
+
+# Default prefix is compiled once per process (or at build time) and copied for every request
+default_prompt_prefix = load_prompt_prefix(prompt_artifacts) if prompt_artifacts else build_prompt_prefix()
+
+
+def get_prompt(job: JobData, role=prompt_role, role_description=prompt_role_description,
+                   examples=prompt_examples, instruction=prompt_instruction, context=prompt_context) -> Prompt:
+    is_default = role is prompt_role and role_description is prompt_role_description and \
+        examples is prompt_examples and instruction is prompt_instruction and context is prompt_context
+    if is_default:
+        prompt = copy.copy(default_prompt_prefix)
+    else:
+        prompt = build_prompt_prefix(role, role_description, examples, instruction, context)
+
+    if job.jobs:
+        descriptions = "\n\n".join(f"jobId {item.jobId}:\n{item.jobDescription}" for item in job.jobs)
+        job_context = f"\nReady?\n\n{prompt_matrix_instruction}\n\nThese are the jobs given for the task: \n\n{descriptions}"
+    else:
+        job_context = f"\nReady?\n\nThis is the information given for the task: \n\n{job.jobDescription}"
+    if short_keys_enabled:
+        job_context += f"\n{get_short_keys_legend()}"
+
+    prompt.set_job_data(
+        job_context,
+        f"\n And candidate list:\n\n{compact_candidates(job.candidates, short_keys_enabled)}"
+    )
+    if structured_output_enabled:
+        prompt.set_response_schema(score_matrix_response_schema if job.jobs else score_response_schema)
 
     return prompt